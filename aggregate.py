@@ -0,0 +1,94 @@
+import numpy as np
+
+BUCKETS = ("hour", "day", "week")
+STATISTICS = ("mean", "min", "max", "count", "sum")
+
+
+def parse_timestamps(values):
+    """Convert 'YYYY-MM-DD HH:MM:SS' strings to datetime64[s]; bad values become NaT."""
+    parsed = np.empty(len(values), dtype="datetime64[s]")
+    for i, value in enumerate(values):
+        try:
+            parsed[i] = np.datetime64(str(value).strip().replace(" ", "T"), "s")
+        except ValueError:
+            parsed[i] = np.datetime64("NaT")
+    return parsed
+
+
+def parse_blood_pressure(values):
+    """Split '120/80' strings into systolic and diastolic arrays; bad values become NaN."""
+    systolic = np.full(len(values), np.nan)
+    diastolic = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            high, low = str(value).split("/")
+            systolic[i], diastolic[i] = float(high), float(low)
+        except (TypeError, ValueError):
+            pass
+    return systolic, diastolic
+
+
+def to_float(values):
+    """Convert a column to float64, mapping None and unparsable values to NaN."""
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def bucket_starts(timestamps, bucket):
+    """Truncate datetime64[s] timestamps to the start of their hour, day or ISO week."""
+    if bucket == "hour":
+        return timestamps.astype("datetime64[h]").astype("datetime64[s]")
+    days = timestamps.astype("datetime64[D]")
+    if bucket == "week":
+        # Day 0 of the epoch was a Thursday; shift so weeks start on Monday.
+        offset = (days.astype(np.int64) + 3) % 7
+        days = days - offset.astype("timedelta64[D]")
+    return days.astype("datetime64[s]")
+
+
+def aggregate(timestamps, metrics, bucket="day"):
+    """
+    Compute mean, min, max, count and sum of each metric per time bucket.
+
+    timestamps is a datetime64 array and metrics maps names to float arrays of
+    the same length; NaN values and rows without a timestamp are ignored.
+    Returns a columnar dict: a list of bucket start strings and, per metric,
+    one list per statistic aligned with the buckets.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    valid = ~np.isnat(timestamps)
+    starts = bucket_starts(timestamps[valid], bucket)
+    keys, inverse = np.unique(starts, return_inverse=True)
+    size = len(keys)
+
+    result = {
+        "bucket": bucket,
+        "buckets": [str(key).replace("T", " ") for key in keys],
+        "metrics": {},
+    }
+    for name, values in metrics.items():
+        values = values[valid]
+        present = ~np.isnan(values)
+        index, data = inverse[present], values[present]
+        count = np.bincount(index, minlength=size)
+        total = np.bincount(index, weights=data, minlength=size)
+        low = np.full(size, np.inf)
+        high = np.full(size, -np.inf)
+        np.minimum.at(low, index, data)
+        np.maximum.at(high, index, data)
+        empty = count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+        stats = {"mean": mean, "min": low, "max": high, "count": count, "sum": total}
+        result["metrics"][name] = {
+            stat: [None if empty[i] and stat in ("mean", "min", "max") else column[i].item()
+                   for i in range(size)]
+            for stat, column in stats.items()
+        }
+    return result
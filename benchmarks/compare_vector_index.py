@@ -0,0 +1,99 @@
+"""
+Compare the in-process vector index against the IRIS VECTOR_DOT_PRODUCT path
+used by /api/medical. For each user and prompt both engines answer the same
+top-k query; the script reports per-engine latency percentiles and the
+recall of the index results against the SQL results.
+
+Usage:
+    python benchmarks/compare_vector_index.py --users 129 130 --k 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from vector_index import UserVectorIndex
+
+DEFAULT_PROMPTS = [
+    "chest pain",
+    "dizzy when standing up",
+    "high blood sugar",
+    "persistent cough",
+    "shortness of breath at night",
+    "swollen ankles",
+    "headache and blurred vision",
+    "fatigue after meals",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, latencies):
+    ms = [t * 1000 for t in latencies]
+    print(f"{name:<12} n={len(ms):<5} mean={statistics.mean(ms):8.3f}ms "
+          f"p50={percentile(ms, 50):8.3f}ms p95={percentile(ms, 95):8.3f}ms p99={percentile(ms, 99):8.3f}ms")
+
+
+def distinct_users(limit):
+    with database.get_pool().cursor() as cursor:
+        cursor.execute("SELECT DISTINCT User_ID FROM MedicalRecords")
+        return [row[0] for row in cursor.fetchall()][:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", nargs="*", help="User IDs to query (default: first --max-users in the table)")
+    parser.add_argument("--max-users", type=int, default=20)
+    parser.add_argument("--prompts", nargs="*", default=DEFAULT_PROMPTS)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="Times each query is repeated")
+    args = parser.parse_args()
+
+    users = args.users or distinct_users(args.max_users)
+    if not users:
+        sys.exit("No MedicalRecords found; populate the database first.")
+
+    index = UserVectorIndex(database.load_user_embeddings, database.EMBEDDING_DIM, ttl=float("inf"))
+    prompt_vectors = dict(zip(args.prompts, database.embed_many(args.prompts)))
+
+    load_times = []
+    for user in users:
+        started = time.perf_counter()
+        index.search(user, prompt_vectors[args.prompts[0]], args.k)
+        load_times.append(time.perf_counter() - started)
+
+    sql_times, index_times, recalls = [], [], []
+    for user in users:
+        for prompt, vector in prompt_vectors.items():
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                expected = database.search_medical_records_sql(user, vector, args.k)
+                sql_times.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                actual = index.search(user, vector, args.k)
+                index_times.append(time.perf_counter() - started)
+
+            expected_keys = {tuple(row.values()) for row in expected}
+            if expected_keys:
+                actual_keys = {tuple(row.values()) for row in actual}
+                recalls.append(len(expected_keys & actual_keys) / len(expected_keys))
+
+    stats = index.stats()
+    print(f"{len(users)} users, {stats['vectors']} vectors, {len(args.prompts)} prompts, k={args.k}")
+    summarize("index load", load_times)
+    summarize("iris sql", sql_times)
+    summarize("index", index_times)
+    print(f"recall@{args.k} of index vs iris: {statistics.mean(recalls) if recalls else float('nan'):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Load generator for the Flask API.
+
+Replays a weighted mix of insert and query requests at a fixed concurrency
+for a fixed duration, then reports per-endpoint throughput and p50/p95/p99
+latency. By default it starts the API in a subprocess against the local
+IRIS stand-in and a small local model, seeds it with realistic data and
+runs fully offline. Use --url to target a server that is already running.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 8 --duration 30
+    python benchmarks/load_test.py --mix query_vitals=3,insert_vitals=1 --save run.json
+    python benchmarks/load_test.py --url http://localhost:3000 --users 129
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workload
+
+# Relative weight of each operation in the default traffic mix.
+DEFAULT_MIX = {
+    "insert_medical": 5,
+    "insert_vitals": 20,
+    "insert_activity": 10,
+    "query_medical": 25,
+    "query_vitals": 25,
+    "query_activity": 15,
+}
+
+
+def build_request(operation, rng, user):
+    """Return (method, path, keyword arguments for requests) for one operation."""
+    if operation == "insert_medical":
+        return "POST", "/api/insert/medical", {"json": workload.medical_record(rng, user)}
+    if operation == "insert_vitals":
+        return "POST", "/api/insert/vitals", {"json": workload.vitals_record(rng, user)}
+    if operation == "insert_activity":
+        return "POST", "/api/insert/activity", {"json": workload.activity_record(rng, user)}
+    if operation == "query_medical":
+        return "GET", "/api/medical", {"params": {"user": user, "prompt": rng.choice(workload.PROMPTS)}}
+    if operation == "query_vitals":
+        return "GET", "/api/vitals", {"params": {"user": user, "limit": 100}}
+    if operation == "query_activity":
+        return "GET", "/api/activity", {"params": {"user": user, "limit": 100}}
+    raise ValueError(f"Unknown operation {operation!r}, expected one of {sorted(DEFAULT_MIX)}")
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        operation, _, weight = item.partition("=")
+        build_request(operation.strip(), workload.rng(), "1")
+        mix[operation.strip()] = float(weight or 1)
+    return mix
+
+
+def serve(port):
+    """Run the API on port with a threaded server (used by the subprocess)."""
+    from werkzeug.serving import make_server
+    import database
+    from migrations import migrate
+    migrate()
+    database.warm_up()
+    print(f"Serving on port {port}", flush=True)
+    make_server("127.0.0.1", port, database.app, threaded=True).serve_forever()
+
+
+def start_server(port, db_path, model, dim):
+    env = dict(os.environ, **workload.offline_environment(db_path, model, dim))
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)], env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("API server exited during start-up")
+        try:
+            if requests.get(f"{url}/api/ready", timeout=2).status_code == 200:
+                return process, url
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    sys.exit("API server did not become ready within 300 seconds")
+
+
+def seed(url, users, records_per_user, chunk=500):
+    """Load records_per_user rows per table per user through the batch endpoints."""
+    rng = workload.rng(42)
+    makers = {
+        "medical": workload.medical_record,
+        "vitals": workload.vitals_record,
+        "activity": workload.activity_record,
+        "diet": workload.diet_record,
+    }
+    started = time.perf_counter()
+    for kind, make in makers.items():
+        records = [make(rng, user) for user in users for _ in range(records_per_user)]
+        for i in range(0, len(records), chunk):
+            response = requests.post(f"{url}/api/insert/{kind}/batch", json=records[i:i + chunk], timeout=600)
+            response.raise_for_status()
+    print(f"Seeded {records_per_user} rows per table for {len(users)} users "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+def run(url, mix, users, concurrency, duration, warmup, seed_value=0):
+    """Drive the mix from concurrency threads; return per-operation latencies and errors."""
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        rng = workload.rng(seed_value + index)
+        session = requests.Session()
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            operation = rng.choices(operations, weights)[0]
+            method, path, kwargs = build_request(operation, rng, rng.choice(users))
+            began = time.perf_counter()
+            try:
+                ok = session.request(method, url + path, timeout=60, **kwargs).status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - began
+            if now < measure_from:
+                continue
+            with lock:
+                if ok:
+                    latencies[operation].append(elapsed)
+                else:
+                    errors[operation] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def report(latencies, errors, duration):
+    results = {}
+    print(f"{'operation':<18}{'count':>8}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    every = []
+    for operation in sorted(set(latencies) | set(errors)):
+        summary = workload.latency_summary(latencies[operation], duration)
+        summary["errors"] = errors[operation]
+        results[operation] = summary
+        every.extend(latencies[operation])
+        print(f"{operation:<18}{summary['count']:>8}{summary['errors']:>8}{summary['throughput']:>9.1f}"
+              f"{summary.get('p50_ms', 0):>10.1f}{summary.get('p95_ms', 0):>10.1f}{summary.get('p99_ms', 0):>10.1f}")
+    total = workload.latency_summary(every, duration)
+    total["errors"] = sum(errors.values())
+    results["total"] = total
+    print(f"{'total':<18}{total['count']:>8}{total['errors']:>8}{total['throughput']:>9.1f}"
+          f"{total.get('p50_ms', 0):>10.1f}{total.get('p95_ms', 0):>10.1f}{total.get('p99_ms', 0):>10.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--db", help="Local stand-in database file (default: a fresh temporary file)")
+    parser.add_argument("--model", default=workload.SMALL_MODEL, help="Local model name or path")
+    parser.add_argument("--dim", type=int, default=workload.SMALL_MODEL_DIM, help="The model's embedding size")
+    parser.add_argument("--users", nargs="*", help="User IDs to send traffic for (default: --user-count seeded users)")
+    parser.add_argument("--user-count", type=int, default=20)
+    parser.add_argument("--seed-records", type=int, default=200, help="Rows per table per user to seed; 0 to skip")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. query_vitals=3,insert_vitals=1")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before the run")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    process = None
+    url = args.url
+    users = args.users or workload.users(args.user_count)
+    if url is None:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="load_test_"), "iris.db")
+        process, url = start_server(args.port, db_path, args.model, args.dim)
+        if args.seed_records:
+            seed(url, users, args.seed_records)
+    try:
+        print(f"{args.concurrency} workers for {args.duration:.0f}s against {url}")
+        latencies, errors = run(url, args.mix, users, args.concurrency, args.duration, args.warmup)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results = report(latencies, errors, args.duration)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"concurrency": args.concurrency, "duration": args.duration, "mix": args.mix,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
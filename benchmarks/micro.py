@@ -0,0 +1,136 @@
+"""
+Repeatable micro-benchmarks for the hot paths behind the API:
+  - embedding throughput of encode_batch() at each batch size
+  - vector serialization: json.dumps against each VectorCodec mode, and parsing
+  - row-to-dict conversion and JSON building for the time-series endpoints
+
+Every case runs --repeat times after a warm-up and reports the median and
+the spread, so two runs can be compared. Save a run with --save and compare
+a later run against it with --baseline.
+
+Runs offline with a small local model (see workload.py); no database is used.
+
+Usage:
+    python benchmarks/micro.py --save before.json
+    python benchmarks/micro.py --baseline before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workload
+
+
+def measure(fn, repeat, number):
+    """Seconds per call of fn(): one sample per repeat, each averaging number calls."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+def embedding_cases(database, batch_sizes, repeat):
+    rng = workload.rng(1)
+    texts = [f"{r['Symptom']} {r['Diagnosis']}" for r in (workload.medical_record(rng, "1") for _ in range(max(batch_sizes)))]
+    cases = {}
+    for size in batch_sizes:
+        batch = texts[:size]
+        samples = measure(lambda: database.encode_batch(batch), repeat, max(1, 64 // size))
+        cases[f"embed batch={size}"] = (samples, size)
+    return cases
+
+
+def serialization_cases(dim, repeat):
+    from vector_codec import VectorCodec
+    from vector_index import parse_vector
+
+    rng = np.random.default_rng(0)
+    vector = rng.standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    as_list = vector.tolist()
+    cases = {"serialize json.dumps": (measure(lambda: json.dumps(as_list), repeat, 200), 1)}
+    for mode in VectorCodec.MODES:
+        codec = VectorCodec(mode, dim)
+        cases[f"serialize codec {mode}"] = (measure(lambda: codec.encode(vector), repeat, 200), 1)
+    text = VectorCodec("double", dim).format(vector)
+    cases["parse stored vector"] = (measure(lambda: parse_vector(text), repeat, 200), 1)
+    return cases
+
+
+def row_cases(database, rows_per_page, repeat):
+    rng = workload.rng(2)
+    columns = database.TABLE_COLUMNS["Vitals"]
+    records = [workload.vitals_record(rng, "1") for _ in range(rows_per_page)]
+    # Rows as fetchall() returns them for build_user_query: columns, then Datetime and ID.
+    rows = [tuple(r[c] for c in columns) + (r["Datetime"], i) for i, r in enumerate(records)]
+    width = len(columns)
+
+    def to_dicts():
+        return [dict(zip(columns, row[:width])) for row in rows]
+
+    dicts = to_dicts()
+    with database.app.app_context():
+        cases = {
+            f"rows to dicts x{rows_per_page}": (measure(to_dicts, repeat, 20), rows_per_page),
+            f"json response x{rows_per_page}": (measure(lambda: database.app.json.dumps(dicts), repeat, 20), rows_per_page),
+            f"ndjson lines x{rows_per_page}": (measure(
+                lambda: [json.dumps(d, default=database.json_default) for d in dicts], repeat, 20), rows_per_page),
+        }
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=workload.SMALL_MODEL, help="Local model name or path")
+    parser.add_argument("--dim", type=int, default=workload.SMALL_MODEL_DIM, help="The model's embedding size")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16,32,64")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per simulated query page")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--skip-embedding", action="store_true")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against results saved with --save")
+    args = parser.parse_args()
+
+    workload.use_offline_environment(":memory:", args.model, args.dim)
+    import database
+
+    cases = {}
+    if not args.skip_embedding:
+        cases.update(embedding_cases(database, [int(n) for n in args.batch_sizes.split(",")], args.repeat))
+    cases.update(serialization_cases(args.dim, args.repeat))
+    cases.update(row_cases(database, args.rows, args.repeat))
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["cases"]
+
+    results = {}
+    print(f"{'case':<28}{'median':>12}{'spread':>9}{'items/s':>12}{'vs baseline':>13}")
+    for name, (samples, items) in cases.items():
+        median = statistics.median(samples)
+        spread = (max(samples) - min(samples)) / median if median else 0.0
+        results[name] = {"median_seconds": median, "min_seconds": min(samples), "items_per_second": items / median}
+        line = f"{name:<28}{median * 1e6:>10.1f}us{spread:>8.0%} {items / median:>11.0f}"
+        if name in baseline:
+            line += f"{median / baseline[name]['median_seconds'] - 1:>+12.1%}"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"model": args.model, "repeat": args.repeat, "cases": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare the response formats of the per-user time-series endpoints.
+
+For Vitals and Activity pages of --rows rows, as fetchall() returns them,
+the script reports for each format and content coding:
+  - bytes on the wire
+  - server CPU milliseconds to build the body, from the fetched rows to the
+    (compressed) bytes, median of --repeat runs
+both scaled to 10k rows. "rows json" is the default response (one dict per
+row, encoded by Flask's JSON provider); the other formats are columnar.py's.
+
+Runs offline; no database is used.
+
+Usage:
+    python benchmarks/response_format_benchmark.py --rows 10000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workload
+
+RECORDS = {"Vitals": workload.vitals_record, "Activity": workload.activity_record}
+LABELS = {"application/vnd.healthhack.columns+json": "columns json", "application/vnd.apache.arrow.stream": "arrow"}
+
+
+def fetched_rows(columns, record, count):
+    """Rows like fetchall() returns them: columns with TIMESTAMP values, then Datetime and ID."""
+    rng = workload.rng(3)
+    rows = []
+    for i in range(count):
+        r = record(rng, "1")
+        r["Datetime"] = datetime.strptime(r["Datetime"], "%Y-%m-%d %H:%M:%S")
+        rows.append(tuple(r[c] for c in columns) + (r["Datetime"], i))
+    return rows
+
+
+def cpu_ms(fn, repeat):
+    """Median process CPU milliseconds per call of fn()."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        samples.append((time.process_time() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Rows per page")
+    parser.add_argument("--repeat", type=int, default=9)
+    args = parser.parse_args()
+
+    workload.use_offline_environment(":memory:")
+    import database
+    import columnar
+
+    print(f"orjson: {'yes' if columnar.orjson else 'no'}, pyarrow: {'yes' if columnar.pyarrow else 'no'}, "
+          f"zstandard: {'yes' if columnar.zstandard else 'no'}")
+    scale = 10000 / args.rows
+    for table, record in RECORDS.items():
+        columns = database.TABLE_COLUMNS[table]
+        rows = fetched_rows(columns, record, args.rows)
+        width = len(columns)
+
+        def rows_json():
+            return database.app.json.dumps([dict(zip(columns, row[:width])) for row in rows]).encode("utf-8")
+
+        builders = {"rows json": rows_json}
+        for fmt in columnar.FORMATS[1:]:
+            builders[LABELS[fmt]] = lambda fmt=fmt: columnar.encode(fmt, columns, rows, database.json_default)
+
+        print(f"\n{table}, per 10k rows")
+        print(f"{'format':<16}{'encoding':<10}{'bytes':>12}{'cpu ms':>10}{'vs rows json':>14}")
+        with database.app.app_context():
+            baseline = None
+            for name, build in builders.items():
+                for encoding in [None] + columnar.ENCODINGS:
+                    def body(build=build, encoding=encoding):
+                        return columnar.compress(build(), encoding)[0]
+                    size = len(body()) * scale
+                    cpu = cpu_ms(body, args.repeat) * scale
+                    if baseline is None:
+                        baseline = size
+                    print(f"{name:<16}{encoding or 'identity':<10}{size:>12,.0f}{cpu:>10.1f}{size / baseline:>13.2f}x")
+
+
+if __name__ == "__main__":
+    main()
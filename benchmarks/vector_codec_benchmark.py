@@ -0,0 +1,117 @@
+"""
+Compare the vector storage modes in vector_codec.py.
+
+For each mode the script reports:
+  - bytes per stored vector at the mode's element width, plus the int8 scale
+    (IRIS's own on-disk layout adds some overhead on top)
+  - bytes per encoded TO_VECTOR parameter, against json.dumps of a float list
+  - encode throughput in vectors per second
+  - top-k recall of scores computed from the decoded (stored) vectors against
+    exact float64 scores
+  - with --db, insert throughput into a scratch table using executemany
+
+Vectors are synthetic clustered unit vectors by default, or the stored
+MedicalRecords embeddings with --from-db.
+
+Usage:
+    python benchmarks/vector_codec_benchmark.py --count 5000 --k 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_codec import VectorCodec
+
+ELEMENT_BYTES = {"double": 8, "float": 4, "int8": 1}
+
+
+def synthetic_vectors(count, dim, seed=0):
+    """Unit vectors drawn around a few centroids, like embeddings of related texts."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((32, dim))
+    vectors = centroids[rng.integers(0, 32, count)] + 0.6 * rng.standard_normal((count, dim))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def stored_vectors(limit):
+    import database
+    source = VectorCodec("double", database.EMBEDDING_DIM)
+    with database.get_pool().cursor() as cursor:
+        cursor.execute(f"SELECT TOP ? {source.column} FROM MedicalRecords WHERE {source.column} IS NOT NULL", (limit,))
+        rows = cursor.fetchall()
+    return np.stack([source.decode(row[0]) for row in rows]).astype(np.float64)
+
+
+def recall_at_k(exact, approx, queries, k):
+    hits = 0
+    for query in queries:
+        truth = set(np.argsort(-(exact @ query))[:k])
+        found = set(np.argsort(-(approx @ query))[:k])
+        hits += len(truth & found)
+    return hits / (k * len(queries))
+
+
+def insert_throughput(codec, params, repeat_rows):
+    import database
+    table = f"CodecBench_{codec.mode}"
+    with database.get_pool().cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {table} (ID INT, {', '.join(codec.column_definitions)})")
+    try:
+        sql = f"INSERT INTO {table} (ID, {codec.insert_columns}) VALUES (?, {codec.insert_placeholders})"
+        rows = [(i, *params[i % len(params)]) for i in range(repeat_rows)]
+        started = time.perf_counter()
+        with database.get_pool().cursor() as cursor:
+            cursor.executemany(sql, rows)
+        return repeat_rows / (time.perf_counter() - started)
+    finally:
+        with database.get_pool().cursor() as cursor:
+            cursor.execute(f"DROP TABLE {table}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=5000, help="Number of vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--from-db", action="store_true", help="Use stored MedicalRecords embeddings")
+    parser.add_argument("--db", action="store_true", help="Also measure insert throughput against the database")
+    parser.add_argument("--insert-rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    vectors = stored_vectors(args.count) if args.from_db else synthetic_vectors(args.count, args.dim)
+    dim = vectors.shape[1]
+    queries = synthetic_vectors(args.queries, dim, seed=1) if not args.from_db else vectors[:args.queries]
+
+    json_bytes = np.mean([len(json.dumps(v.tolist())) for v in vectors[:500]])
+    print(f"{len(vectors)} vectors of dim {dim}; json.dumps parameter: {json_bytes:.0f} bytes/vector")
+    header = f"{'mode':<8}{'stored B/vec':>14}{'param B/vec':>14}{'encode vec/s':>15}{'recall@' + str(args.k):>12}"
+    if args.db:
+        header += f"{'insert rows/s':>15}"
+    print(header)
+
+    for mode in VectorCodec.MODES:
+        codec = VectorCodec(mode, dim)
+        started = time.perf_counter()
+        params = [codec.encode(v) for v in vectors]
+        encode_rate = len(vectors) / (time.perf_counter() - started)
+
+        decoded = np.stack([codec.decode(*p) for p in params]).astype(np.float64)
+        stored = ELEMENT_BYTES[mode] * dim + (8 if mode == "int8" else 0)
+        param_bytes = np.mean([len(p[0]) for p in params])
+        recall = recall_at_k(vectors, decoded, queries, args.k)
+
+        line = f"{mode:<8}{stored:>14}{param_bytes:>14.0f}{encode_rate:>15.0f}{recall:>12.4f}"
+        if args.db:
+            line += f"{insert_throughput(codec, params, args.insert_rows):>15.0f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Shared pieces of the benchmark suite: the offline environment, synthetic
+but realistic records, and latency summaries.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+# A small sentence-transformers model, used instead of PubMedBert so the
+# benchmarks run quickly. It must already be in the local Hugging Face cache
+# (or be given as a local path); nothing is downloaded.
+SMALL_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SMALL_MODEL_DIM = 384
+
+SYMPTOMS = [
+    "cough", "fever", "headache", "chest pain", "fatigue", "nausea", "dizziness",
+    "shortness of breath", "back pain", "sore throat", "rash", "joint pain",
+]
+DIAGNOSES = [
+    "Upper respiratory infection, rest and fluids advised.",
+    "Tension headache, ibuprofen as needed and reduce screen time.",
+    "Essential hypertension, started lisinopril 10 mg daily.",
+    "Type 2 diabetes, HbA1c 7.8%, continue metformin.",
+    "Seasonal allergies, loratadine 10 mg daily.",
+    "Musculoskeletal strain, physiotherapy referral.",
+    "Iron deficiency anemia, oral iron supplementation.",
+    "Gastroenteritis, oral rehydration and bland diet.",
+    "Mild asthma exacerbation, albuterol inhaler as needed.",
+    "Viral pharyngitis, symptomatic treatment.",
+]
+PROMPTS = [
+    "Why have I been so tired lately?",
+    "Is my blood pressure getting better?",
+    "What did the doctor say about my cough?",
+    "Should I worry about chest pain after exercise?",
+    "What medication am I on for diabetes?",
+    "I keep getting headaches in the afternoon",
+]
+ACTIVITIES = ["walking", "running", "cycling", "swimming", "yoga", "strength training"]
+MEALS = ["oatmeal", "chicken salad", "pasta", "rice and beans", "smoothie", "grilled fish"]
+
+
+def offline_environment(db_path, model=SMALL_MODEL, dim=SMALL_MODEL_DIM):
+    """
+    Environment variables that point database.py at the local IRIS stand-in
+    and a small local model, with no network access and no disk cache.
+    """
+    return {
+        "IRIS_BACKEND": "local",
+        "LOCAL_IRIS_PATH": db_path,
+        "EMBEDDING_MODEL": model,
+        "EMBEDDING_DIM": str(dim),
+        "EMBED_CACHE_DIR": "",
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+    }
+
+
+def use_offline_environment(db_path, model=SMALL_MODEL, dim=SMALL_MODEL_DIM):
+    """Apply offline_environment() to this process; call before importing database."""
+    os.environ.update(offline_environment(db_path, model, dim))
+
+
+def timestamp(rng, start=datetime(2024, 1, 1), days=365):
+    return (start + timedelta(seconds=rng.randrange(days * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def medical_record(rng, user):
+    return {
+        "User_ID": user,
+        "Symptom": rng.choice(SYMPTOMS),
+        "Diagnosis": rng.choice(DIAGNOSES),
+        "Datetime": timestamp(rng),
+    }
+
+
+def vitals_record(rng, user):
+    return {
+        "User_ID": user,
+        "Temperature": round(rng.gauss(36.8, 0.4), 1),
+        "BloodPressure": f"{int(rng.gauss(122, 12))}/{int(rng.gauss(80, 8))}",
+        "PulseRate": int(rng.gauss(72, 9)),
+        "Datetime": timestamp(rng),
+    }
+
+
+def activity_record(rng, user):
+    return {
+        "User_ID": user,
+        "Activity": rng.choice(ACTIVITIES),
+        "Duration": rng.choice([15, 20, 30, 45, 60, 90]),
+        "Datetime": timestamp(rng),
+    }
+
+
+def diet_record(rng, user):
+    return {
+        "User_ID": user,
+        "Meal": rng.choice(MEALS),
+        "Calories": rng.randrange(150, 900),
+        "Datetime": timestamp(rng),
+    }
+
+
+def users(count):
+    return [str(100 + i) for i in range(count)]
+
+
+def rng(seed=0):
+    return random.Random(seed)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies, elapsed):
+    """count, throughput and mean/p50/p95/p99 latency in milliseconds."""
+    ms = [t * 1000 for t in latencies]
+    if not ms:
+        return {"count": 0, "throughput": 0.0}
+    return {
+        "count": len(ms),
+        "throughput": len(ms) / elapsed,
+        "mean_ms": sum(ms) / len(ms),
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+    }
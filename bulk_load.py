@@ -0,0 +1,289 @@
+"""
+Stream CSV or JSONL records of any size into one of the five tables.
+
+Input is read and written in chunks, so memory use does not grow with the
+input. MedicalRecords and PastPrompts texts are embedded in large batches.
+--workers starts a process pool that embeds several chunks at once, each
+process with its own copy of the model. Each chunk is written with one executemany, and its
+checkpoint row (BulkLoadCheckpoints) is updated in the same transaction.
+An interrupted load therefore resumes after the last committed chunk,
+without duplicating rows. Rows that fail validation are skipped and
+written to --rejects.
+
+Records use the same field names as the insert endpoints, e.g. for vitals:
+User_ID, Temperature, BloodPressure, PulseRate, Datetime.
+
+Usage:
+    python bulk_load.py medical history.jsonl --workers 2
+    python bulk_load.py vitals vitals.csv --chunk-size 5000
+    python bulk_load.py vitals vitals.csv --restart     # ignore the checkpoint
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import database
+from database import get_pool
+from embedding_versions import EMBEDDED_TABLES
+from migrations import migrate
+import validation
+from validation import NUMERIC_FIELDS
+
+# Table name, required fields and the fields stored as numbers, per record kind.
+TABLES = {
+    "medical": ("MedicalRecords", ["User_ID", "Symptom", "Diagnosis", "Datetime"], []),
+    "vitals": ("Vitals", ["User_ID", "Temperature", "BloodPressure", "PulseRate", "Datetime"], NUMERIC_FIELDS["Vitals"]),
+    "activity": ("Activity", ["User_ID", "Activity", "Duration", "Datetime"], NUMERIC_FIELDS["Activity"]),
+    "prompts": ("PastPrompts", ["User_ID", "Summary", "Datetime"], []),
+    "diet": ("Diet", ["User_ID", "Meal", "Calories", "Datetime"], NUMERIC_FIELDS["Diet"]),
+}
+
+
+def insert_query(kind):
+    table, fields, _ = TABLES[kind]
+    if table in EMBEDDED_TABLES:
+        return f"""
+            INSERT INTO {table} ({", ".join(fields)}, {database.codec.insert_columns})
+            VALUES ({", ".join("?" for _ in fields)}, {database.codec.insert_placeholders})
+        """
+    return f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})"
+
+
+###############################################################################
+# Reading
+###############################################################################
+
+class _ByteCounter:
+    """Iterate the decoded lines of a binary file, counting the bytes read."""
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def __iter__(self):
+        for line in self._f:
+            self.bytes_read += len(line)
+            yield line.decode("utf-8-sig" if self.bytes_read == len(line) else "utf-8")
+
+
+def read_records(lines, fmt):
+    """Yield (line_number, record) pairs; malformed JSON lines yield the error as the record."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+
+
+def to_row_values(kind, record):
+    """Return the record's field values in column order, or raise ValueError."""
+    _, fields, numeric = TABLES[kind]
+    return validation.to_row_values(record, fields, numeric)
+
+
+###############################################################################
+# Embedding
+###############################################################################
+
+_worker_model = None
+
+
+def _init_worker(model_name, backend, threads):
+    global _worker_model
+    from embedding_backends import load_model
+    _worker_model, _ = load_model(model_name, backend, threads)
+
+
+def _encode_in_worker(texts):
+    return _worker_model.encode(texts, normalize_embeddings=True, batch_size=min(len(texts), 64))
+
+
+def _prepare(kind, items):
+    """Validate a chunk; return (rows, rejects, texts to embed)."""
+    rows, rejects = [], []
+    for line, record in items:
+        if isinstance(record, ValueError):
+            rejects.append({"line": line, "error": str(record)})
+            continue
+        try:
+            rows.append(to_row_values(kind, record))
+        except (ValueError, TypeError) as e:
+            rejects.append({"line": line, "error": str(e)})
+    table, fields, _ = TABLES[kind]
+    if table not in EMBEDDED_TABLES:
+        return rows, rejects, None
+    positions = [fields.index(name) for name in EMBEDDED_TABLES[table]]
+    texts = [" ".join(row[i] for i in positions) for row in rows]
+    return rows, rejects, texts
+
+
+###############################################################################
+# Checkpoints
+###############################################################################
+
+def load_checkpoint(source, table):
+    with get_pool().cursor() as cursor:
+        cursor.execute(
+            "SELECT Records, Inserted, Rejected FROM BulkLoadCheckpoints WHERE Source = ? AND TableName = ?",
+            (source, table),
+        )
+        rows = cursor.fetchall()
+    return tuple(rows[0]) if rows else None
+
+
+def clear_checkpoint(source, table):
+    with get_pool().cursor() as cursor:
+        cursor.execute("DELETE FROM BulkLoadCheckpoints WHERE Source = ? AND TableName = ?", (source, table))
+
+
+def write_chunk(cursor, query, rows, source, table, progress, first):
+    """Insert a chunk and advance its checkpoint inside the caller's transaction."""
+    if rows:
+        cursor.executemany(query, rows)
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    if first:
+        cursor.execute(
+            "INSERT INTO BulkLoadCheckpoints (Source, TableName, Records, Inserted, Rejected, UpdatedAt) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (source, table, *progress, now),
+        )
+    else:
+        cursor.execute(
+            "UPDATE BulkLoadCheckpoints SET Records = ?, Inserted = ?, Rejected = ?, UpdatedAt = ? "
+            "WHERE Source = ? AND TableName = ?",
+            (*progress, now, source, table),
+        )
+
+
+###############################################################################
+# Loading
+###############################################################################
+
+def load(kind, path, fmt, chunk_size=1000, workers=0, restart=False, rejects_path=None, report_every=5.0):
+    """Load path into the table for kind; returns (records, inserted, rejected)."""
+    table = TABLES[kind][0]
+    source = os.path.abspath(path)
+    # Embed with the active embedding version's model and write its columns.
+    database.sync_embedding_version()
+    query = insert_query(kind)
+    total_bytes = os.path.getsize(path)
+
+    if restart:
+        clear_checkpoint(source, table)
+    checkpoint = load_checkpoint(source, table)
+    records, inserted, rejected = checkpoint or (0, 0, 0)
+    first = checkpoint is None
+    if checkpoint:
+        print(f"Resuming {path} after {records} records ({inserted} inserted, {rejected} rejected)")
+
+    pool = None
+    if workers and table in EMBEDDED_TABLES:
+        pool = ProcessPoolExecutor(
+            workers, initializer=_init_worker,
+            initargs=(database.MODEL_NAME, database.EMBEDDING_BACKEND,
+                      database.EMBED_THREADS or max(1, (os.cpu_count() or 1) // workers)),
+        )
+    rejects_file = open(rejects_path, "a") if rejects_path else None
+    started = time.perf_counter()
+    last_report = started
+    loaded_here = 0
+
+    with open(path, "rb") as f:
+        counter = _ByteCounter(f)
+        stream = read_records(counter, fmt)
+        # Skip records committed by an earlier run.
+        for _ in islice(stream, records):
+            pass
+
+        # Chunks are prepared (and embedded) ahead of the writer, up to a
+        # bounded number in flight, and committed strictly in input order.
+        pending = deque()
+        max_pending = max(2, 2 * workers)
+        exhausted = False
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_pending:
+                    items = list(islice(stream, chunk_size))
+                    if not items:
+                        exhausted = True
+                        break
+                    rows, rejects, texts = _prepare(kind, items)
+                    if texts and pool is not None:
+                        vectors = pool.submit(_encode_in_worker, texts)
+                    elif texts:
+                        vectors = database.encode_batch(texts)
+                    else:
+                        vectors = None
+                    pending.append((len(items), rows, rejects, vectors))
+                if not pending:
+                    break
+
+                count, rows, rejects, vectors = pending.popleft()
+                if hasattr(vectors, "result"):
+                    vectors = vectors.result()
+                if vectors is not None:
+                    rows = [values + list(database.codec.encode(vector)) for values, vector in zip(rows, vectors)]
+                records += count
+                inserted += len(rows)
+                rejected += len(rejects)
+                with get_pool().cursor() as cursor:
+                    write_chunk(cursor, query, rows, source, table, (records, inserted, rejected), first)
+                database.invalidate_user_rows(table, [row[0] for row in rows])
+                first = False
+                loaded_here += count
+                if rejects_file is not None:
+                    for reject in rejects:
+                        rejects_file.write(json.dumps(reject) + "\n")
+                    rejects_file.flush()
+
+                now = time.perf_counter()
+                if now - last_report >= report_every or (exhausted and not pending):
+                    last_report = now
+                    percent = 100 * counter.bytes_read / total_bytes if total_bytes else 100.0
+                    print(f"{records} records ({percent:.1f}% of input): {inserted} inserted, {rejected} rejected, "
+                          f"{loaded_here / (now - started):.0f} records/s")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if rejects_file is not None:
+                rejects_file.close()
+
+    print(f"Loaded {path} into {table}: {records} records, {inserted} inserted, {rejected} rejected "
+          f"in {time.perf_counter() - started:.1f}s")
+    return records, inserted, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=sorted(TABLES), help="Which table to load")
+    parser.add_argument("path", help="CSV or JSONL file")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from the file extension)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Records per transaction and embedding batch")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Embedding processes for medical records and prompts (default: embed in this process)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and load from the start")
+    parser.add_argument("--rejects", help="Append rejected rows to this JSONL file")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+    if args.chunk_size < 1:
+        sys.exit("--chunk-size must be at least 1")
+    migrate()
+    load(args.kind, args.path, fmt, args.chunk_size, args.workers, args.restart, args.rejects)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,20 @@
 import os
+import queue
+import threading
+import time
 import openai
+import requests
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-import iris
 from database import *
+from semantic_cache import SemanticCache
+from history import ConversationHistory, make_token_counter
 
 # Load environment variables from .env (ensure you have one with your Azure key)
 load_dotenv()
 
-# Create database
-createDatabase()
-createTable()
-
 # Azure OpenAI configuration
 AZURE_OPENAI_API_KEY = os.getenv("openAIkey")
 AZURE_OPENAI_ENDPOINT = "https://e0957-m7dhe0bf-eastus2.cognitiveservices.azure.com/"
@@ -43,12 +44,222 @@ SYSTEM_PROMPTS = {
     )
 }
 
+# Near-identical questions in these modes are answered from a semantic cache
+# instead of calling Azure OpenAI. Personalized modes are left out by default.
+# Only the first message of a conversation (no summary or earlier turns) is
+# looked up or stored, since later replies depend on what was said before.
+SEMANTIC_CACHE_MODES = set(filter(None, os.getenv("SEMANTIC_CACHE_MODES", "General Advice").split(",")))
+semantic_cache = SemanticCache(
+    embed,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+)
+
+# Conversation histories are kept within HISTORY_TOKEN_BUDGET tokens. Older
+# turns are folded into a rolling summary that is saved to PastPrompts through
+# the API, and a new session resumes from the latest saved summary.
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:3000")
+CHAT_USER_ID = os.getenv("CHAT_USER_ID", "129")
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+count_tokens = make_token_counter(DEPLOYMENT_NAME)
+
+
+def summarize_turns(previous_summary, turns):
+    """Fold conversation turns into the running summary with one LLM call."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    prompt = (
+        "Update the summary of a conversation between a patient and a healthcare assistant. "
+        "Keep symptoms, conditions, medications and advice given, in under 150 words.\n\n"
+        f"Current summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    response = client.chat.completions.create(
+        model=DEPLOYMENT_NAME,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=250,
+        temperature=0.3
+    )
+    return response.choices[0].message.content.strip()
+
+
+def summary_prefix(function):
+    return f"[{function}] "
+
+
+def persist_summary(function, summary):
+    """Save a rolling summary to PastPrompts through /api/insert/prompt."""
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/api/insert/prompt",
+            json={"User_ID": CHAT_USER_ID, "Summary": (summary_prefix(function) + summary)[:1000]},
+            timeout=10,
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Could not save conversation summary for {function}: {e}")
+
+
+def load_summary(function):
+    """Return the latest saved summary for a function, or an empty string."""
+    prefix = summary_prefix(function)
+    try:
+        response = requests.get(
+            f"{API_BASE_URL}/api/prompts",
+            params={"user": CHAT_USER_ID, "fields": "Summary", "order": "desc", "limit": 50},
+            timeout=10,
+        )
+        response.raise_for_status()
+        for row in response.json():
+            if row["Summary"].startswith(prefix):
+                return row["Summary"][len(prefix):]
+    except (requests.RequestException, ValueError) as e:
+        print(f"Could not load conversation summary for {function}: {e}")
+    return ""
+
+
 # Maintain separate conversation histories for each function
-conversation_histories = {
-    "Symptom Checker": [],
-    "Condition Evaluation": [],
-    "General Advice": []
-}
+conversation_histories = {}
+
+
+def get_history(function):
+    """Return the history for a function, resuming from its saved summary."""
+    if function not in conversation_histories:
+        conversation_histories[function] = ConversationHistory(
+            HISTORY_TOKEN_BUDGET,
+            summarize_turns,
+            count_tokens,
+            persist=lambda summary: persist_summary(function, summary),
+            summary=load_summary(function),
+        )
+    return conversation_histories[function]
+
+
+class ChatCancelled(Exception):
+    """Raised inside a worker when the user cancels a reply in progress."""
+
+
+def chat_with_gpt(function, user_message, max_tokens=150, on_token=None, cancel=None):
+    """
+    Get the assistant's reply for one turn, streaming it to on_token(text) as
+    it arrives. Runs on a worker thread, so it must not touch Tk widgets.
+    Raises ChatCancelled if the cancel event is set before the reply is complete;
+    a cancelled turn is left out of the history.
+    """
+    on_token = on_token or (lambda text: None)
+    cancel = cancel or threading.Event()
+    # Build conversation messages using the system prompt and conversation history
+    system_prompt = SYSTEM_PROMPTS[function]
+    history = get_history(function)
+    earlier = history.messages()
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(earlier)
+    messages.append({"role": "user", "content": user_message})
+
+    cached, vector = None, None
+    if function in SEMANTIC_CACHE_MODES and not earlier:
+        cached, vector = semantic_cache.lookup(system_prompt, user_message)
+    if cached is not None:
+        reply = cached
+        on_token(reply)
+    else:
+        started = time.perf_counter()
+        response = client.chat.completions.create(
+            model=DEPLOYMENT_NAME,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True
+        )
+        parts = []
+        try:
+            for chunk in response:
+                if cancel.is_set():
+                    raise ChatCancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    on_token(chunk.choices[0].delta.content)
+        finally:
+            response.close()
+        reply = "".join(parts).strip()
+        if vector is not None:
+            semantic_cache.store(system_prompt, vector, reply, time.perf_counter() - started)
+    if cancel.is_set():
+        raise ChatCancelled()
+    # Update conversation history
+    history.add_turn(user_message, reply)
+    print(f"[{function}] history: {history.used_tokens()} tokens, "
+          f"{history.last_saved} saved this turn")
+    return reply
+
+
+# Requests run on a small thread pool so the window stays responsive and each
+# tab can have a reply in flight at the same time. Workers never touch Tk:
+# they post events to a queue that the UI drains with after().
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "3"))
+UI_POLL_MS = 30
+chat_executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat-worker")
+
+
+class ChatDispatcher:
+    """
+    Run chat_with_gpt on chat_executor and deliver its tokens and outcome to
+    callbacks on the Tk main loop. One reply can be in flight per key.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.events = queue.Queue()
+        self.cancel_events = {}
+        self.closed = False
+        self.widget.after(UI_POLL_MS, self._drain)
+
+    def busy(self, key):
+        return key in self.cancel_events
+
+    def submit(self, key, function, user_message, on_token, on_done, max_tokens=150):
+        """Start a reply. on_done(reply, error) runs once; both are None if cancelled."""
+        cancel = threading.Event()
+        self.cancel_events[key] = cancel
+
+        def run():
+            try:
+                reply = chat_with_gpt(function, user_message, max_tokens,
+                                      on_token=lambda text: self.events.put((on_token, (text,))),
+                                      cancel=cancel)
+                outcome = (reply, None)
+            except ChatCancelled:
+                outcome = (None, None)
+            except Exception as e:
+                outcome = (None, e)
+            self.events.put((self._finish, (key, on_done) + outcome))
+
+        chat_executor.submit(run)
+
+    def cancel(self, key):
+        cancel = self.cancel_events.get(key)
+        if cancel is not None:
+            cancel.set()
+
+    def shutdown(self):
+        self.closed = True
+        for cancel in self.cancel_events.values():
+            cancel.set()
+        chat_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, key, on_done, reply, error):
+        self.cancel_events.pop(key, None)
+        on_done(reply, error)
+
+    def _drain(self):
+        if self.closed:
+            return
+        try:
+            while True:
+                callback, args = self.events.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        self.widget.after(UI_POLL_MS, self._drain)
 
 
 class HealthcareChatbotUI(tk.Tk):
@@ -57,6 +268,7 @@ class HealthcareChatbotUI(tk.Tk):
         self.title("Healthcare Assistant Chatbot")
         self.geometry("900x700")
         self.configure(bg="#F7F7F7")
+        self.dispatcher = ChatDispatcher(self)
         self.create_widgets()
 
     def create_widgets(self):
@@ -87,13 +299,20 @@ class HealthcareChatbotUI(tk.Tk):
             user_input.pack(side="left", fill="x", expand=True, padx=(0, 10))
             user_input.bind("<Return>", lambda event, f=func: self.send_message(f))
 
+            # Cancel button, enabled while a reply is streaming
+            cancel_btn = ttk.Button(input_frame, text="Cancel", state="disabled",
+                                    command=lambda f=func: self.dispatcher.cancel(f))
+            cancel_btn.pack(side="right", padx=(10, 0))
+
             # Send button
             send_btn = ttk.Button(input_frame, text="Send", command=lambda f=func: self.send_message(f))
             send_btn.pack(side="right")
 
             self.chat_components[func] = {
                 "chat_display": chat_display,
-                "user_input": user_input
+                "user_input": user_input,
+                "send_button": send_btn,
+                "cancel_button": cancel_btn
             }
 
         # Menu Bar for additional functions
@@ -101,26 +320,59 @@ class HealthcareChatbotUI(tk.Tk):
         self.config(menu=menubar)
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Clear Conversation", command=self.clear_current_conversation)
+        file_menu.add_command(label="Statistics", command=self.show_stats)
         file_menu.add_command(label="Exit", command=self.destroy)
         menubar.add_cascade(label="File", menu=file_menu)
 
     def clear_current_conversation(self):
         # Clear conversation history and text for the currently selected tab
         current_tab = self.notebook.tab(self.notebook.select(), "text")
-        conversation_histories[current_tab] = []
+        self.dispatcher.cancel(current_tab)
+        get_history(current_tab).clear()
         chat_display = self.chat_components[current_tab]["chat_display"]
         chat_display.configure(state="normal")
         chat_display.delete("1.0", tk.END)
         chat_display.configure(state="disabled")
 
+    def show_stats(self):
+        stats = semantic_cache.stats()
+        saved = sum(history.total_saved for history in conversation_histories.values())
+        messagebox.showinfo("Statistics", (
+            f"Cache entries: {stats['entries']}\n"
+            f"Cache hits: {stats['hits']}  Misses: {stats['misses']}\n"
+            f"Cache hit rate: {stats['hit_rate']:.1%}\n"
+            f"Latency saved: {stats['latency_saved_seconds']:.1f}s\n"
+            f"History tokens saved: {saved}"
+        ))
+
     def send_message(self, function):
-        user_message = self.chat_components[function]["user_input"].get().strip()
-        if not user_message:
+        components = self.chat_components[function]
+        user_message = components["user_input"].get().strip()
+        if not user_message or self.dispatcher.busy(function):
             return
-        self.chat_components[function]["user_input"].delete(0, tk.END)
-        self.append_message(function, f"You: {user_message}\n")
-        reply = self.chat_with_gpt(function, user_message)
-        self.append_message(function, f"Assistant: {reply}\n\n")
+        components["user_input"].delete(0, tk.END)
+        self.append_message(function, f"You: {user_message}\nAssistant: ")
+        self.set_busy(function, True)
+        self.dispatcher.submit(
+            function, function, user_message,
+            on_token=lambda text: self.append_message(function, text),
+            on_done=lambda reply, error: self.reply_finished(function, reply, error),
+        )
+
+    def reply_finished(self, function, reply, error):
+        self.set_busy(function, False)
+        if error is not None:
+            self.append_message(function, "Sorry, I encountered an error.\n\n")
+            messagebox.showerror("Error", f"An error occurred: {error}")
+        elif reply is None:
+            self.append_message(function, " [cancelled]\n\n")
+        else:
+            self.append_message(function, "\n\n")
+
+    def set_busy(self, function, busy):
+        components = self.chat_components[function]
+        components["send_button"].configure(state="disabled" if busy else "normal")
+        components["cancel_button"].configure(state="normal" if busy else "disabled")
 
     def append_message(self, function, message):
         chat_display = self.chat_components[function]["chat_display"]
@@ -129,30 +381,9 @@ class HealthcareChatbotUI(tk.Tk):
         chat_display.configure(state="disabled")
         chat_display.see(tk.END)
 
-    def chat_with_gpt(self, function, user_message, max_tokens=150):
-        # Build conversation messages using the system prompt and conversation history
-        system_prompt = SYSTEM_PROMPTS[function]
-        history = conversation_histories[function]
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(history)
-        messages.append({"role": "user", "content": user_message})
-        try:
-            response = client.chat.completions.create(
-                model=DEPLOYMENT_NAME,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=0.7
-            )
-            reply = response.choices[0].message.content.strip()
-            # Update conversation history
-            conversation_histories[function].append({"role": "user", "content": user_message})
-            conversation_histories[function].append({"role": "assistant", "content": reply})
-            return reply
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {e}")
-            return "Sorry, I encountered an error."
-        
-
+    def destroy(self):
+        self.dispatcher.shutdown()
+        super().destroy()
 
 
 def insert_data(table_name, table_definition, data):
@@ -172,7 +403,8 @@ def insert_data(table_name, table_definition, data):
         {columns}
         VALUES {placeholder_values}
     """
-    cursor.execute(sql, data)
+    with get_pool().cursor() as cursor:
+        cursor.execute(sql, data)
 
 
 # ----------------------------
@@ -183,9 +415,10 @@ class ChatUI:
     def __init__(self, master):
         self.master = master
         master.title("Healthcare Assistant Chatbot")
+        self.dispatcher = ChatDispatcher(master)
 
         # Dropdown for selecting the conversation function
-        self.function_var = tk.StringVar(value="symptom_check")
+        self.function_var = tk.StringVar(value="Symptom Checker")
         self.function_menu = ttk.Combobox(
             master, textvariable=self.function_var, state="readonly")
         self.function_menu['values'] = list(SYSTEM_PROMPTS.keys())
@@ -208,17 +441,33 @@ class ChatUI:
             master, text="Send", command=self.send_message)
         self.send_button.grid(row=2, column=1, padx=5, pady=5)
 
+        # Cancel button for the reply in progress
+        self.cancel_button = ttk.Button(
+            master, text="Cancel", command=lambda: self.dispatcher.cancel("chat"))
+        self.cancel_button.grid(row=2, column=2, padx=5, pady=5)
+
     def send_message(self, event=None):
         user_message = self.entry_var.get().strip()
-        if not user_message:
+        # A single conversation box shows one reply at a time
+        if not user_message or self.dispatcher.busy("chat"):
             return
         function = self.function_var.get()
         # Append user's message to conversation history widget
-        self._append_text(f"You ({function}): {user_message}\n")
+        self._append_text(f"You ({function}): {user_message}\nAssistant: ")
         self.entry_var.set("")
-        # Call the chat function to get a reply
-        reply = HealthcareChatbotUI.chat_with_gpt(function, user_message, max_tokens=150)
-        self._append_text(f"Assistant: {reply}\n\n")
+        # Get the reply on a worker thread and stream it into the conversation box
+        self.dispatcher.submit(
+            "chat", function, user_message,
+            on_token=self._append_text,
+            on_done=self._reply_finished,
+        )
+
+    def _reply_finished(self, reply, error):
+        if error is not None:
+            self._append_text("Sorry, I encountered an error.\n\n")
+            messagebox.showerror("Error", f"An error occurred: {error}")
+        else:
+            self._append_text("\n\n" if reply is not None else " [cancelled]\n\n")
 
     def _append_text(self, text):
         self.conversation_box.configure(state="normal")
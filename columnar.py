@@ -0,0 +1,97 @@
+"""
+Columnar response formats for the per-user time-series endpoints.
+
+The default response is a JSON array with one object per row, which repeats
+every column name in every row. A client that sends one of these media
+types in its Accept header gets one array per column instead, built by
+transposing the fetched rows without creating a dict per row:
+
+  - application/vnd.healthhack.columns+json
+        {"count": n, "columns": {"Temperature": [...], "Datetime": [...]}}
+        encoded with orjson when it is installed
+  - application/vnd.apache.arrow.stream
+        an Arrow IPC stream holding one record batch (requires pyarrow)
+
+Columnar responses are compressed with zstd (if zstandard is installed) or
+gzip when the client's Accept-Encoding allows it.
+"""
+import gzip
+import io
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ROWS_JSON = "application/json"
+COLUMNS_JSON = "application/vnd.healthhack.columns+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# In order of preference when the client accepts several equally.
+FORMATS = [ROWS_JSON, COLUMNS_JSON] + ([ARROW_STREAM] if pyarrow is not None else [])
+ENCODINGS = (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+# Bodies smaller than this are sent uncompressed.
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def negotiate(accept_mimetypes):
+    """The response format for an Accept header; row JSON unless a columnar type is preferred."""
+    return accept_mimetypes.best_match(FORMATS, default=ROWS_JSON) or ROWS_JSON
+
+
+def negotiate_encoding(accept_encodings):
+    """The content coding for an Accept-Encoding header, or None to send the body as is."""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def to_columns(names, rows):
+    """Transpose fetched rows into one list per named column; extra trailing row values are ignored."""
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, map(list, zip(*rows))))
+
+
+def encode_columns_json(names, rows, default):
+    document = {"count": len(rows), "columns": to_columns(names, rows)}
+    if orjson is not None:
+        # Dates go through default so they are formatted like everywhere else.
+        return orjson.dumps(document, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(document, default=default, separators=(",", ":")).encode("utf-8")
+
+
+def encode_arrow(names, rows):
+    table = pyarrow.Table.from_pydict(to_columns(names, rows))
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def encode(fmt, names, rows, default):
+    """Encode rows (tuples whose first values are the named columns) in a columnar format."""
+    if fmt == COLUMNS_JSON:
+        return encode_columns_json(names, rows, default)
+    if fmt == ARROW_STREAM:
+        return encode_arrow(names, rows)
+    raise ValueError(f"Unsupported columnar format {fmt!r}")
+
+
+def compress(body, encoding):
+    """Return (body, content coding applied or None)."""
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), "zstd"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), "gzip"
@@ -1,45 +1,169 @@
-import iris
 import time
+_import_started = time.perf_counter()
 import os
 import json
-from flask import Flask, request, jsonify, Blueprint
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from flask import Flask, request, jsonify, Blueprint, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer
+from werkzeug.http import generate_etag
+from pool import ConnectionPool
+from batcher import EmbeddingBatcher
+from embedding_server import EmbeddingClient
+from embedding_backends import load_model
+from embedding_cache import EmbeddingCache
+from vector_index import UserVectorIndex
+from vector_codec import VectorCodec
+import embedding_versions
+from embedding_versions import VersionGate
+from ingest_queue import IngestQueue, QueueFull
+from response_cache import CachedResponse, MemoryBackend, RedisBackend, ResponseCache
+import columnar
+import aggregate
+import llm
+from metrics import Histogram, render_prometheus
+import instrumentation
+from instrumentation import timed
+from prompts import PROMPT_TEMPLATES, get_prompt
+from validation import NUMERIC_FIELDS, to_row_values
+
+def json_default(value):
+    """Serialize TIMESTAMP values in the same format the tables used as text."""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return DefaultJSONProvider.default(value)
+
+class JSONProvider(DefaultJSONProvider):
+    default = staticmethod(json_default)
+
+    def dumps(self, obj, **kwargs):
+        with timed("serialize"):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 CORS(app) # added CORS
+
+# Every request reports its embed, db_execute, db_fetch and serialize time
+# in a Server-Timing header, and the totals are exported at /api/metrics.
+# PROFILE_SAMPLE_RATE profiles that fraction of requests (see /api/profile).
+profiler = instrumentation.SamplingProfiler(float(os.getenv('PROFILE_SAMPLE_RATE', '0')))
+instrumentation.install(app, profiler)
 # Create a Blueprint for API routes with prefix '/api'
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
-# Load a pre-trained sentence transformer model.
+# The model and the database pool are created on first use (or by warm_up()),
+# so importing this module stays cheap. Each stage's duration is recorded here.
+startup_timings = {}
+_model_lock = threading.Lock()
+_pool_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+# Pre-trained sentence transformer model, loaded by get_model().
 # Note: The table for MedicalRecords expects a VECTOR of DOUBLE, size 768.
-# Adjust the model or table definition if necessary.
-model = SentenceTransformer('pritamdeka/S-PubMedBert-MS-MARCO')
+# Set EMBEDDING_DIM to match when using a different model.
+MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'pritamdeka/S-PubMedBert-MS-MARCO')
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '768'))
+model = None
 
-def createDatabase():
-    """Establish a connection to the IRIS database."""
+# Inference backend for the model: torch (default), onnx or onnx-int8. A
+# faster backend is only used if it passes the accuracy gate in
+# embedding_backends.py. EMBED_THREADS sets the CPU thread count.
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBED_THREADS = int(os.getenv('EMBED_THREADS', '0')) or None
+embedding_backend = {}
+
+# The model and backend together name the embedding version stored with each
+# vector. Once the EmbeddingSlots table exists, the active version recorded
+# there takes precedence (see sync_embedding_version()).
+EMBEDDING_VERSION = embedding_versions.version_name(MODEL_NAME, EMBEDDING_BACKEND)
+
+# How embeddings are stored in MedicalRecords: double (default), float or int8.
+# See vector_codec.py, and migrate_vectors.py to convert existing rows.
+VECTOR_STORAGE = os.getenv('VECTOR_STORAGE', 'double')
+codec = VectorCodec(VECTOR_STORAGE, EMBEDDING_DIM)
+
+def get_model():
+    """Load the SentenceTransformer model on first use."""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                started = time.perf_counter()
+                loaded, report = load_model(MODEL_NAME, EMBEDDING_BACKEND, EMBED_THREADS)
+                startup_timings["model_load"] = time.perf_counter() - started
+                embedding_backend.update(report)
+                model = loaded
+                print(f"Embedding model {MODEL_NAME} loaded ({report['backend']})")
+    return model
+
+pool = None
+
+def connect():
+    """
+    Open a new connection to the IRIS database. IRIS_BACKEND=local uses the
+    SQLite-based stand-in in local_iris.py instead.
+    """
+    if os.getenv('IRIS_BACKEND', 'iris') == 'local':
+        import local_iris as iris
+    else:
+        import iris
     username = 'demo'
     password = 'demo'
     hostname = os.getenv('IRIS_HOSTNAME', 'localhost')
     port = '1972' 
     namespace = 'USER'
     CONNECTION_STRING = f"{hostname}:{port}/{namespace}"
-    conn = iris.connect(CONNECTION_STRING, username, password)
-    global cursor
-    cursor = conn.cursor()
-    print("Database connection established")
+    return instrumentation.InstrumentedConnection(iris.connect(CONNECTION_STRING, username, password))
+
+def createDatabase():
+    """
+    Create the IRIS connection pool. Safe to call more than once.
+    Pool sizing is configured through environment variables:
+      - IRIS_POOL_MIN, IRIS_POOL_MAX: minimum and maximum connections
+      - IRIS_POOL_TIMEOUT: seconds to wait for a free connection
+      - IRIS_POOL_HEALTH_CHECK: idle seconds before a connection is re-checked
+    """
+    global pool
+    if pool is not None:
+        return pool
+    with _pool_lock:
+        if pool is None:
+            started = time.perf_counter()
+            pool = ConnectionPool(
+                connect,
+                min_size=int(os.getenv('IRIS_POOL_MIN', '1')),
+                max_size=int(os.getenv('IRIS_POOL_MAX', '10')),
+                timeout=float(os.getenv('IRIS_POOL_TIMEOUT', '30')),
+                health_check_interval=float(os.getenv('IRIS_POOL_HEALTH_CHECK', '30')),
+            )
+            startup_timings["db_connect"] = time.perf_counter() - started
+            print("Database connection established")
+    return pool
 
-createDatabase()
+def get_pool():
+    """Return the connection pool, connecting on first use."""
+    return pool if pool is not None else createDatabase()
 
-def createTables():
-    """Attempt to create all four tables. Uncomment if needed."""
-    table_defs = {
-        "MedicalRecords": """
+def table_definitions():
+    """
+    Column definitions of the five tables, by table. migrations.py creates
+    them in its first migration; run `python migrations.py` to create and
+    upgrade the schema.
+    """
+    return {
+        "MedicalRecords": f"""
             (User_ID VARCHAR(50), 
              Symptom VARCHAR(50), 
              Diagnosis VARCHAR(1000), 
              Datetime VARCHAR(50), 
-             Embedding VECTOR(DOUBLE, 768))
+             {", ".join(codec.column_definitions)})
         """,
         "Vitals": """
             (User_ID VARCHAR(50), 
@@ -54,10 +178,11 @@ def createTables():
              Duration FLOAT, 
              Datetime VARCHAR(50))
         """,
-        "PastPrompts": """
+        "PastPrompts": f"""
             (User_ID VARCHAR(50), 
              Summary VARCHAR(1000), 
-             Datetime VARCHAR(50))
+             Datetime VARCHAR(50), 
+             {", ".join(codec.column_definitions)})
         """,
         "Diet": """
             (User_ID VARCHAR(50),
@@ -66,19 +191,294 @@ def createTables():
              Datetime VARCHAR(50))
         """
     }
-    for table, definition in table_defs.items():
-        try:
-            cursor.execute(f"CREATE TABLE {table} {definition}")
-            print(f"Table {table} created successfully.")
-        except Exception as e:
-            print(f"Table {table} may already exist or encountered an error: {e}")
 
-# Uncomment the following line to create tables on startup if needed.
-# createTables()
+# Tables are created and upgraded by migrations.py. Set AUTO_MIGRATE=1 to
+# apply pending migrations when the server starts.
+
+def local_encode_batch(texts):
+    """Encode a list of texts in a single forward pass of this process's model."""
+    return get_model().encode(texts, normalize_embeddings=True, batch_size=min(len(texts), 64))
+
+# With EMBED_SERVER_SOCKET set, texts are embedded by embedding_server.py so
+# that several API worker processes share one copy of the model. The model is
+# only loaded here if the server cannot be reached.
+EMBED_SERVER_SOCKET = os.getenv('EMBED_SERVER_SOCKET')
+embedding_client = EmbeddingClient(EMBED_SERVER_SOCKET, EMBEDDING_VERSION, local_encode_batch) if EMBED_SERVER_SOCKET else None
+
+def encode_batch(texts):
+    """Encode a list of texts in a single forward pass."""
+    if embedding_client is not None:
+        return embedding_client.encode_batch(texts)
+    return local_encode_batch(texts)
+
+def embedding_ready():
+    """True once texts can be embedded without loading the model first."""
+    return model is not None or (embedding_client is not None and embedding_client.connected)
+
+# Concurrent embed() calls are coalesced into micro-batches. Tune with
+# EMBED_MAX_BATCH (texts per batch) and EMBED_MAX_WAIT_MS (collection window).
+embedder = EmbeddingBatcher(
+    encode_batch,
+    max_batch_size=int(os.getenv('EMBED_MAX_BATCH', '32')),
+    max_wait=float(os.getenv('EMBED_MAX_WAIT_MS', '5')) / 1000,
+)
+
+# Embeddings are cached by embedding version and normalized text, in memory
+# (EMBED_CACHE_SIZE entries) and on disk under EMBED_CACHE_DIR
+# (EMBED_CACHE_DISK_SIZE entries). Set EMBED_CACHE_DIR to an empty string
+# to keep the cache in memory only.
+embedding_cache = None
+
+def get_embedding_cache():
+    """Open the embedding cache on first use."""
+    global embedding_cache
+    if embedding_cache is None:
+        with _cache_lock:
+            if embedding_cache is None:
+                embedding_cache = EmbeddingCache(
+                    EMBEDDING_VERSION,
+                    EMBEDDING_DIM,
+                    max_entries=int(os.getenv('EMBED_CACHE_SIZE', '10000')),
+                    directory=os.getenv('EMBED_CACHE_DIR', '.embedding_cache') or None,
+                    disk_capacity=int(os.getenv('EMBED_CACHE_DISK_SIZE', '100000')),
+                )
+    return embedding_cache
 
 def embed(text):
     """Embed text using the SentenceTransformer model and return a list."""
-    return model.encode(text, normalize_embeddings=True).tolist()
+    with timed("embed"):
+        cache = get_embedding_cache()
+        vector = cache.get(text)
+        if vector is None:
+            vector = embedder.embed(text)
+            cache.put(text, vector)
+        return vector.tolist()
+
+def embed_many(texts):
+    """Embed a list of texts in one batched call and return a list of lists."""
+    with timed("embed"):
+        cache = get_embedding_cache()
+        texts = list(texts)
+        vectors = [cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Texts repeated within the batch are only encoded once.
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = dict(zip(unique, encode_batch(unique)))
+            for text, vector in encoded.items():
+                cache.put(text, vector)
+            for i in missing:
+                vectors[i] = encoded[texts[i]]
+        return [vector.tolist() for vector in vectors]
+
+def search_medical_records_sql(user, prompt_embedding, top_k=3):
+    """Rank a user's MedicalRecords against prompt_embedding inside IRIS."""
+    condition, params = codec.version_filter
+    sql = f"""
+        SELECT TOP ? Symptom, Diagnosis, Datetime
+        FROM MedicalRecords
+        WHERE User_ID = ? AND {condition}
+        ORDER BY {codec.score_expression} DESC
+    """
+    with get_pool().cursor() as cursor:
+        cursor.execute(sql, (top_k, user, *params, codec.encode_query(prompt_embedding)))
+        rows = cursor.fetchall()
+    return [{"Symptom": row[0], "Diagnosis": row[1], "Datetime": row[2]} for row in rows]
+
+def load_user_embeddings(user):
+    """Fetch every (record, embedding) pair for a user, for the vector index."""
+    condition, params = codec.version_filter
+    sql = f"""
+        SELECT Symptom, Diagnosis, Datetime, {codec.select_columns}
+        FROM MedicalRecords
+        WHERE User_ID = ? AND {condition}
+    """
+    with get_pool().cursor() as cursor:
+        cursor.execute(sql, (user, *params))
+        rows = cursor.fetchall()
+    return [
+        ({"Symptom": row[0], "Diagnosis": row[1], "Datetime": row[2]}, codec.decode(*row[3:]))
+        for row in rows if row[3] is not None
+    ]
+
+# Optional in-process retrieval engine for /api/medical. Enable with
+# VECTOR_INDEX=1; IRIS remains the source of truth and the fallback.
+def make_vector_index():
+    return UserVectorIndex(
+        load_user_embeddings,
+        EMBEDDING_DIM,
+        max_users=int(os.getenv('VECTOR_INDEX_MAX_USERS', '1000')),
+        ttl=float(os.getenv('VECTOR_INDEX_TTL', '300')),
+    )
+
+vector_index = make_vector_index() if os.getenv('VECTOR_INDEX', '0') == '1' else None
+
+def search_medical_records(user, prompt_embedding, top_k=3):
+    """Top-k MedicalRecords for a user, from the vector index when enabled."""
+    if vector_index is not None:
+        try:
+            return vector_index.search(user, prompt_embedding, top_k)
+        except Exception as e:
+            print(f"Vector index search failed, falling back to IRIS: {e}")
+    return search_medical_records_sql(user, prompt_embedding, top_k)
+
+def find_medical_records(user, prompt, top_k=3):
+    """Embed prompt and return the user's top_k most similar MedicalRecords."""
+    with embedding_version():
+        return search_medical_records(user, embed(prompt), top_k)
+
+# Past prompts are ranked by similarity to the query, blended with recency:
+#   score = (1 - PROMPT_RECENCY_WEIGHT) * similarity
+#           + PROMPT_RECENCY_WEIGHT * 0.5 ** (age in days / PROMPT_HALF_LIFE_DAYS)
+# The PROMPT_CANDIDATES most similar prompts and, unless recency is given no
+# weight, the PROMPT_CANDIDATES newest ones are fetched from IRIS and
+# re-ranked by score. A prompt in neither set is never returned, so raise
+# PROMPT_CANDIDATES if users keep more prompts than that.
+PROMPT_RECENCY_WEIGHT = float(os.getenv('PROMPT_RECENCY_WEIGHT', '0.3'))
+PROMPT_HALF_LIFE_DAYS = float(os.getenv('PROMPT_HALF_LIFE_DAYS', '30'))
+PROMPT_CANDIDATES = int(os.getenv('PROMPT_CANDIDATES', '50'))
+
+def search_past_prompts(user, prompt_embedding, top_k=5, recency_weight=PROMPT_RECENCY_WEIGHT,
+                        half_life_days=PROMPT_HALF_LIFE_DAYS, now=None):
+    """Top-k PastPrompts for a user by similarity to prompt_embedding, weighted by recency."""
+    condition, params = codec.version_filter
+    sql = f"""
+        SELECT TOP ? Summary, Datetime, {codec.score_expression}
+        FROM PastPrompts
+        WHERE User_ID = ? AND {condition}
+    """
+    query = codec.encode_query(prompt_embedding)
+    candidates = max(top_k, PROMPT_CANDIDATES)
+    with get_pool().cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY {codec.score_expression} DESC", (candidates, query, user, *params, query))
+        rows = cursor.fetchall()
+        if recency_weight > 0:
+            # Recent prompts can outscore more similar ones, so fetch the newest too.
+            cursor.execute(f"{sql} ORDER BY Datetime DESC", (candidates, query, user, *params))
+            rows += cursor.fetchall()
+
+    # int8 scores leave out the query's own scale; restore it so they are cosines.
+    factor = codec.quantize(prompt_embedding)[1] if codec.mode == "int8" else 1.0
+    now = now or datetime.now()
+    results = []
+    seen = set()
+    for summary, datetime_val, similarity in rows:
+        if (summary, str(datetime_val)) in seen:
+            continue
+        seen.add((summary, str(datetime_val)))
+        similarity = float(similarity) * factor
+        recency = 0.0
+        try:
+            stamp = datetime_val if isinstance(datetime_val, datetime) else \
+                datetime.strptime(str(datetime_val)[:19], '%Y-%m-%d %H:%M:%S')
+            age_days = max(0.0, (now - stamp).total_seconds() / 86400)
+            recency = 0.5 ** (age_days / half_life_days) if half_life_days > 0 else 1.0
+        except (ValueError, TypeError):
+            pass
+        score = (1 - recency_weight) * similarity + recency_weight * recency
+        results.append({"Summary": summary, "Datetime": datetime_val, "similarity": similarity, "score": score})
+    results.sort(key=lambda r: r["score"], reverse=True)
+    return results[:top_k]
+
+def find_past_prompts(user, prompt, top_k=5, **weighting):
+    """Embed prompt and return the user's top_k most relevant PastPrompts."""
+    with embedding_version():
+        return search_past_prompts(user, embed(prompt), top_k, **weighting)
+
+###############################################################################
+# Embedding Versions
+###############################################################################
+
+# Searches and inserts use the active slot in the EmbeddingSlots table (see
+# embedding_versions.py and reembed.py), re-read at most every
+# EMBEDDING_SLOTS_TTL seconds. When reembed.py activates a new version, its
+# model is loaded in the background and swapped in between requests.
+EMBEDDING_SLOTS_TTL = float(os.getenv('EMBEDDING_SLOTS_TTL', '10'))
+embedding_gate = VersionGate()
+_version_lock = threading.Lock()
+_slots_read_at = None
+_switch_thread = None
+_failed_versions = set()
+
+def sync_embedding_version():
+    """
+    Follow the active slot of EmbeddingSlots. Until the table exists (run
+    `python migrations.py`), vectors are written and searched unversioned.
+    """
+    global _slots_read_at, _switch_thread
+    if embedding_gate.held:
+        return
+    if _slots_read_at is not None and time.monotonic() - _slots_read_at < EMBEDDING_SLOTS_TTL:
+        return
+    with _version_lock:
+        if _slots_read_at is not None and time.monotonic() - _slots_read_at < EMBEDDING_SLOTS_TTL:
+            return
+        first = _slots_read_at is None
+        _slots_read_at = time.monotonic()
+        try:
+            with get_pool().cursor() as cursor:
+                active = embedding_versions.active_slot(embedding_versions.read_slots(cursor))
+        except Exception as e:
+            if first:
+                print(f"Embedding versions unavailable, vectors are not versioned: {e}")
+            return
+        if active is None:
+            return
+        slot, info = active
+        if (slot, info["version"]) == (codec.slot, codec.version) or info["version"] in _failed_versions:
+            return
+        if first or info["version"] == EMBEDDING_VERSION:
+            # Nothing has been served yet, or only the columns change.
+            switch_embedding_version(slot, info)
+        elif _switch_thread is None or not _switch_thread.is_alive():
+            # Keep serving the current version while the new model loads.
+            _switch_thread = threading.Thread(target=switch_embedding_version, args=(slot, info), daemon=True)
+            _switch_thread.start()
+
+def switch_embedding_version(slot, info):
+    """Load the model for the version in slot and make searches and inserts use it."""
+    global MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_DIM, EMBEDDING_VERSION
+    global model, codec, embedding_cache, embedding_client, vector_index
+    version = info["version"]
+    loaded = None
+    if version != EMBEDDING_VERSION:
+        model_name, backend = embedding_versions.parse_version(version)
+        print(f"Loading embedding version {version} from slot {slot}")
+        try:
+            loaded, report = load_model(model_name, backend, EMBED_THREADS)
+            if report["backend"] != backend:
+                raise RuntimeError(f"backend {backend} was not usable")
+        except Exception as e:
+            print(f"Could not load embedding version {version}, staying on {EMBEDDING_VERSION}: {e}")
+            _failed_versions.add(version)
+            return
+
+    with embedding_gate.switching():
+        if loaded is not None:
+            MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_VERSION = model_name, backend, version
+            EMBEDDING_DIM = info["dim"]
+            model = loaded
+            embedding_backend.clear()
+            embedding_backend.update(report)
+            if embedding_cache is not None:
+                embedding_cache.close()
+                embedding_cache = None
+            if embedding_client is not None:
+                embedding_client = EmbeddingClient(EMBED_SERVER_SOCKET, EMBEDDING_VERSION, local_encode_batch)
+        codec = VectorCodec(VECTOR_STORAGE, info["dim"], slot, version)
+        if vector_index is not None:
+            vector_index = make_vector_index()
+    print(f"Embeddings use version {version} in slot {slot}")
+
+@contextmanager
+def embedding_version():
+    """
+    Hold the current embedding version for the block, so that text embedded
+    inside it is searched or stored with the same model's columns.
+    """
+    sync_embedding_version()
+    with embedding_gate.reading():
+        yield
 
 ###############################################################################
 # Insertion Endpoints
@@ -104,15 +504,19 @@ def insert_medical():
         diagnosis = data["Diagnosis"]
         datetime_val = data["Datetime"]
         
-        # Create embedding from the combined text
-        embedded_vector = embed(f"{symptom} {diagnosis}")
-        embedding_json = json.dumps(embedded_vector)
-        
-        query = """
-            INSERT INTO MedicalRecords (User_ID, Symptom, Diagnosis, Datetime, Embedding)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, (user_id, symptom, diagnosis, datetime_val, embedding_json))
+        with embedding_version():
+            # Create embedding from the combined text
+            embedded_vector = embed(f"{symptom} {diagnosis}")
+
+            query = f"""
+                INSERT INTO MedicalRecords (User_ID, Symptom, Diagnosis, Datetime, {codec.insert_columns})
+                VALUES (?, ?, ?, ?, {codec.insert_placeholders})
+            """
+            with get_pool().cursor() as cursor:
+                cursor.execute(query, (user_id, symptom, diagnosis, datetime_val, *codec.encode(embedded_vector)))
+            if vector_index is not None:
+                row = {"Symptom": symptom, "Diagnosis": diagnosis, "Datetime": datetime_val}
+                vector_index.add(user_id, row, embedded_vector)
         print("Medical record inserted successfully.")
         return jsonify({"status": "success"}), 200
 
@@ -139,13 +543,15 @@ def insert_vitals():
             INSERT INTO Vitals (User_ID, Temperature, BloodPressure, PulseRate, Datetime)
             VALUES (?, ?, ?, ?, ?)
         """
-        cursor.execute(query, (
-            data["User_ID"],
-            data["Temperature"],
-            data["BloodPressure"],
-            data["PulseRate"],
-            data["Datetime"]
-        ))
+        with get_pool().cursor() as cursor:
+            cursor.execute(query, (
+                data["User_ID"],
+                data["Temperature"],
+                data["BloodPressure"],
+                data["PulseRate"],
+                data["Datetime"]
+            ))
+        invalidate_user_rows("Vitals", [data["User_ID"]])
         print("Vitals record inserted successfully.")
         return jsonify({"status": "success"}), 200
 
@@ -172,12 +578,14 @@ def insert_activity():
             INSERT INTO Activity (User_ID, Activity, Duration, Datetime)
             VALUES (?, ?, ?, ?)
         """
-        cursor.execute(query, (
-            data["User_ID"],
-            data["Activity"],
-            data["Duration"],
-            data["Datetime"]
-        ))
+        with get_pool().cursor() as cursor:
+            cursor.execute(query, (
+                data["User_ID"],
+                data["Activity"],
+                data["Duration"],
+                data["Datetime"]
+            ))
+        invalidate_user_rows("Activity", [data["User_ID"]])
         print("Activity record inserted successfully.")
         return jsonify({"status": "success"}), 200
 
@@ -186,13 +594,25 @@ def insert_activity():
         return jsonify({"error": str(e)}), 500
 
 
+def prompt_embeddings_available():
+    """True if PastPrompts has the embedding columns written for the current version."""
+    try:
+        with get_pool().cursor() as cursor:
+            cursor.execute(f"SELECT TOP 1 {codec.insert_columns} FROM PastPrompts")
+            cursor.fetchall()
+        return True
+    except Exception:
+        return False
+
 @app.route('/api/insert/prompt', methods=['POST'])
 def insert_prompt():
     """
     Inserts a prompt summary into the PastPrompts table.
     Expects JSON with keys:
       - User_ID, Summary
-    Datetime is added automatically.
+    Datetime is added automatically. The summary is embedded so that it can
+    be found by /api/prompts/search; on a database without the embedding
+    columns of migration 6 it is stored unembedded and "embedded" is false.
     """
     data = request.get_json()
     required_fields = ["User_ID", "Summary"]
@@ -201,19 +621,328 @@ def insert_prompt():
             return jsonify({"error": f"Missing field {field}"}), 400
 
     try:
-        query = """
-            INSERT INTO PastPrompts (User_ID, Summary, Datetime)
-            VALUES (?, ?, ?)
-        """
         current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute(query, (data["User_ID"], data["Summary"], current_time))
+        embedded = True
+        try:
+            with embedding_version():
+                embedded_vector = embed(data["Summary"])
+                query = f"""
+                    INSERT INTO PastPrompts (User_ID, Summary, Datetime, {codec.insert_columns})
+                    VALUES (?, ?, ?, {codec.insert_placeholders})
+                """
+                with get_pool().cursor() as cursor:
+                    cursor.execute(query, (data["User_ID"], data["Summary"], current_time, *codec.encode(embedded_vector)))
+        except Exception as e:
+            if prompt_embeddings_available():
+                raise
+            print(f"PastPrompts has no embedding columns (run `python migrations.py`), "
+                  f"storing the prompt without an embedding: {e}")
+            with get_pool().cursor() as cursor:
+                cursor.execute("INSERT INTO PastPrompts (User_ID, Summary, Datetime) VALUES (?, ?, ?)",
+                               (data["User_ID"], data["Summary"], current_time))
+            embedded = False
+        invalidate_user_rows("PastPrompts", [data["User_ID"]])
         print("Prompt inserted successfully.")
-        return jsonify({"status": "success"}), 200
+        return jsonify({"status": "success", "embedded": embedded}), 200
 
     except Exception as e:
         print(f"Error inserting into PastPrompts: {e}")
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/api/insert/diet', methods=['POST'])
+def insert_diet():
+    """
+    Inserts a record into the Diet table.
+    Expects JSON with keys:
+      - User_ID, Meal, Calories, Datetime
+    """
+    data = request.get_json()
+    required_fields = ["User_ID", "Meal", "Calories", "Datetime"]
+    for field in required_fields:
+        if field not in data:
+            return jsonify({"error": f"Missing field {field}"}), 400
+
+    try:
+        query = """
+            INSERT INTO Diet (User_ID, Meal, Calories, Datetime)
+            VALUES (?, ?, ?, ?)
+        """
+        with get_pool().cursor() as cursor:
+            cursor.execute(query, (
+                data["User_ID"],
+                data["Meal"],
+                data["Calories"],
+                data["Datetime"]
+            ))
+        invalidate_user_rows("Diet", [data["User_ID"]])
+        print("Diet record inserted successfully.")
+        return jsonify({"status": "success"}), 200
+
+    except Exception as e:
+        print(f"Error inserting into Diet: {e}")
+        return jsonify({"error": str(e)}), 500
+
+###############################################################################
+# Asynchronous Ingestion Endpoints
+###############################################################################
+
+ingest_queue = None
+_ingest_lock = threading.Lock()
+
+def ingest_medical_records(records):
+    """Embed and insert a batch of queued MedicalRecords in one transaction."""
+    with embedding_version():
+        vectors = embed_many([f"{r['Symptom']} {r['Diagnosis']}" for r in records])
+        query = f"""
+            INSERT INTO MedicalRecords (User_ID, Symptom, Diagnosis, Datetime, {codec.insert_columns})
+            VALUES (?, ?, ?, ?, {codec.insert_placeholders})
+        """
+        rows = [
+            (r["User_ID"], r["Symptom"], r["Diagnosis"], r["Datetime"], *codec.encode(vector))
+            for r, vector in zip(records, vectors)
+        ]
+        with get_pool().cursor() as cursor:
+            cursor.executemany(query, rows)
+        index_medical_records(records, vectors)
+
+def get_ingest_queue():
+    """
+    Open the durable ingestion queue and start its workers on first use.
+    Configured through environment variables:
+      - INGEST_QUEUE_PATH: SQLite file holding queued jobs
+      - INGEST_WORKERS: worker threads draining the queue
+      - INGEST_MAX_PENDING: queued jobs accepted before returning 503
+      - INGEST_MAX_ATTEMPTS: attempts before a job is marked failed
+      - INGEST_LEASE_SECONDS: how long a claimed job stays with this process
+        before another process sharing the queue file may take it over
+    """
+    global ingest_queue
+    if ingest_queue is None:
+        with _ingest_lock:
+            if ingest_queue is None:
+                queue = IngestQueue(
+                    os.getenv('INGEST_QUEUE_PATH', '.ingest_queue.db'),
+                    ingest_medical_records,
+                    workers=int(os.getenv('INGEST_WORKERS', '2')),
+                    batch_size=int(os.getenv('EMBED_MAX_BATCH', '32')),
+                    max_pending=int(os.getenv('INGEST_MAX_PENDING', '10000')),
+                    max_attempts=int(os.getenv('INGEST_MAX_ATTEMPTS', '5')),
+                    lease=float(os.getenv('INGEST_LEASE_SECONDS', '300')),
+                )
+                queue.start()
+                ingest_queue = queue
+    return ingest_queue
+
+
+@app.route('/api/ingest/medical', methods=['POST'])
+def ingest_medical():
+    """
+    Queues a record for the MedicalRecords table and returns immediately.
+    Expects JSON with keys:
+      - User_ID, Symptom, Diagnosis, Datetime
+    The record is stored durably and embedded by a background worker.
+    Returns 202 with a job ID to poll at /api/ingest/<job_id>, 400 if a
+    field is missing or invalid, or 503 with Retry-After when the queue is
+    full.
+    """
+    data = request.get_json()
+    required_fields = ["User_ID", "Symptom", "Diagnosis", "Datetime"]
+    # Reject bad records here; queued records are inserted in batches, where
+    # one bad value would fail every job in the batch.
+    try:
+        values = to_row_values(data, required_fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job_id = get_ingest_queue().enqueue(dict(zip(required_fields, values)))
+        headers = {"Location": f"/api/ingest/{job_id}"}
+        return jsonify({"status": "queued", "job_id": job_id}), 202, headers
+
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        print(f"Error queueing MedicalRecords ingestion: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/ingest/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    """
+    Reports the status of a queued ingestion job: queued, running, done or
+    failed, with the attempt count and last error.
+    """
+    status = get_ingest_queue().status(job_id)
+    if status is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(status), 200
+
+###############################################################################
+# Bulk Insertion Endpoints
+###############################################################################
+
+# Upper bound on records accepted by a single batch request.
+BULK_MAX_RECORDS = int(os.getenv('BULK_MAX_RECORDS', '5000'))
+
+def validate_records(data, required_fields, numeric_fields=()):
+    """
+    Validate a batch payload in one pass.
+    Accepts either a JSON array of records or an object with a "records" array.
+    Returns (valid, errors) where valid is a list of (index, record) pairs and
+    errors is a list of {"index", "error"} dicts for rejected rows. Each field
+    is checked and normalised by validation.to_row_values(), so a bad value
+    rejects only its own record instead of failing the whole batch.
+    """
+    if isinstance(data, dict):
+        data = data.get("records")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of records.")
+    if len(data) > BULK_MAX_RECORDS:
+        raise ValueError(f"Batch exceeds the limit of {BULK_MAX_RECORDS} records.")
+
+    valid, errors = [], []
+    for index, record in enumerate(data):
+        try:
+            values = to_row_values(record, required_fields, numeric_fields)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        valid.append((index, {**record, **dict(zip(required_fields, values))}))
+    return valid, errors
+
+def bulk_insert(table, query, required_fields, to_row, embed_text=None, on_inserted=None):
+    """
+    Shared implementation of the batch endpoints. Validates the request body,
+    optionally embeds every valid record in one batched call, and writes all
+    rows with a single executemany in one transaction. on_inserted(records,
+    vectors) is called after the commit.
+    """
+    try:
+        valid, errors = validate_records(request.get_json(), required_fields, NUMERIC_FIELDS.get(table, ()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not valid:
+        return jsonify({"status": "failed", "inserted": 0, "errors": errors}), 400
+
+    try:
+        records = [record for _, record in valid]
+        vectors = None
+        if embed_text is not None:
+            vectors = embed_many([embed_text(record) for record in records])
+            rows = [to_row(record, vector) for record, vector in zip(records, vectors)]
+        else:
+            rows = [to_row(record) for record in records]
+
+        with get_pool().cursor() as cursor:
+            cursor.executemany(query, rows)
+        invalidate_user_rows(table, [record["User_ID"] for record in records])
+        if on_inserted is not None:
+            on_inserted(records, vectors)
+        print(f"Inserted {len(rows)} {table} records.")
+        status = "success" if not errors else "partial"
+        return jsonify({"status": status, "inserted": len(rows), "errors": errors}), 200
+
+    except Exception as e:
+        print(f"Error bulk inserting into {table}: {e}")
+        return jsonify({"error": str(e), "inserted": 0, "errors": errors}), 500
+
+
+@app.route('/api/insert/medical/batch', methods=['POST'])
+def insert_medical_batch():
+    """
+    Inserts many records into the MedicalRecords table.
+    Expects a JSON array of objects with keys:
+      - User_ID, Symptom, Diagnosis, Datetime
+    All embeddings are generated in one batched call.
+    """
+    with embedding_version():
+        query = f"""
+            INSERT INTO MedicalRecords (User_ID, Symptom, Diagnosis, Datetime, {codec.insert_columns})
+            VALUES (?, ?, ?, ?, {codec.insert_placeholders})
+        """
+        return bulk_insert(
+            "MedicalRecords", query,
+            ["User_ID", "Symptom", "Diagnosis", "Datetime"],
+            lambda r, vector: (r["User_ID"], r["Symptom"], r["Diagnosis"], r["Datetime"], *codec.encode(vector)),
+            embed_text=lambda r: f"{r['Symptom']} {r['Diagnosis']}",
+            on_inserted=index_medical_records,
+        )
+
+def index_medical_records(records, vectors):
+    """
+    Append freshly inserted MedicalRecords to the vector index, if enabled.
+    Runs after the insert is committed, so it never raises: if a record
+    cannot be added, its user's entry is dropped and reloaded from IRIS on
+    the next search, rather than failing a request (or ingestion job) whose
+    rows are already stored.
+    """
+    if vector_index is None:
+        return
+    try:
+        for r, vector in zip(records, vectors):
+            row = {"Symptom": r["Symptom"], "Diagnosis": r["Diagnosis"], "Datetime": r["Datetime"]}
+            vector_index.add(r["User_ID"], row, vector)
+    except Exception as e:
+        print(f"Could not add inserted MedicalRecords to the vector index, reloading their users: {e}")
+        for user in {r["User_ID"] for r in records}:
+            vector_index.invalidate(user)
+
+
+@app.route('/api/insert/vitals/batch', methods=['POST'])
+def insert_vitals_batch():
+    """
+    Inserts many records into the Vitals table.
+    Expects a JSON array of objects with keys:
+      - User_ID, Temperature, BloodPressure, PulseRate, Datetime
+    """
+    query = """
+        INSERT INTO Vitals (User_ID, Temperature, BloodPressure, PulseRate, Datetime)
+        VALUES (?, ?, ?, ?, ?)
+    """
+    return bulk_insert(
+        "Vitals", query,
+        ["User_ID", "Temperature", "BloodPressure", "PulseRate", "Datetime"],
+        lambda r: (r["User_ID"], r["Temperature"], r["BloodPressure"], r["PulseRate"], r["Datetime"]),
+    )
+
+
+@app.route('/api/insert/activity/batch', methods=['POST'])
+def insert_activity_batch():
+    """
+    Inserts many records into the Activity table.
+    Expects a JSON array of objects with keys:
+      - User_ID, Activity, Duration, Datetime
+    """
+    query = """
+        INSERT INTO Activity (User_ID, Activity, Duration, Datetime)
+        VALUES (?, ?, ?, ?)
+    """
+    return bulk_insert(
+        "Activity", query,
+        ["User_ID", "Activity", "Duration", "Datetime"],
+        lambda r: (r["User_ID"], r["Activity"], r["Duration"], r["Datetime"]),
+    )
+
+
+@app.route('/api/insert/diet/batch', methods=['POST'])
+def insert_diet_batch():
+    """
+    Inserts many records into the Diet table.
+    Expects a JSON array of objects with keys:
+      - User_ID, Meal, Calories, Datetime
+    """
+    query = """
+        INSERT INTO Diet (User_ID, Meal, Calories, Datetime)
+        VALUES (?, ?, ?, ?)
+    """
+    return bulk_insert(
+        "Diet", query,
+        ["User_ID", "Meal", "Calories", "Datetime"],
+        lambda r: (r["User_ID"], r["Meal"], r["Calories"], r["Datetime"]),
+    )
+
 ###############################################################################
 # Query Endpoints
 ###############################################################################
@@ -234,16 +963,7 @@ def query_medical_records():
         return jsonify({"error": "Missing query parameters 'user' and/or 'prompt'."}), 400
 
     try:
-        prompt_embedding = model.encode(prompt, normalize_embeddings=True).tolist()
-        sql = """
-            SELECT TOP ? Symptom, Diagnosis, Datetime
-            FROM MedicalRecords
-            WHERE User_ID = ?
-            ORDER BY VECTOR_DOT_PRODUCT(Embedding, TO_VECTOR(?)) DESC
-        """
-        cursor.execute(sql, (3, user, json.dumps(prompt_embedding))) # <-- can change
-        rows = cursor.fetchall()
-        results = [{"Symptom": row[0], "Diagnosis": row[1], "Datetime": row[2]} for row in rows]
+        results = find_medical_records(user, prompt, 3) # <-- can change
         return jsonify(results), 200
 
     except Exception as e:
@@ -251,98 +971,659 @@ def query_medical_records():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/vitals', methods=['GET'])
-def query_vitals():
+# Columns returned by the per-user time-series endpoints, in table order.
+TABLE_COLUMNS = {
+    "Vitals": ["User_ID", "Temperature", "BloodPressure", "PulseRate", "Datetime"],
+    "Activity": ["User_ID", "Activity", "Duration", "Datetime"],
+    "PastPrompts": ["User_ID", "Summary", "Datetime"],
+    "Diet": ["User_ID", "Meal", "Calories", "Datetime"],
+}
+
+# Rows fetched per round trip when streaming, and the largest page size.
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '500'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '10000'))
+
+# Non-streamed responses of the per-user query endpoints are cached per user
+# and table, and invalidated by the insert endpoints (see response_cache.py).
+# RESPONSE_CACHE_BYTES bounds the in-process cache (0 disables it) and
+# RESPONSE_CACHE_TTL caps an entry's age, which also bounds how long writes
+# made outside the API go unseen. Set RESPONSE_CACHE_URL to a redis:// URL to
+# share one cache between worker processes.
+RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL')
+RESPONSE_CACHE_BYTES = int(os.getenv('RESPONSE_CACHE_BYTES', str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+response_cache = None
+if RESPONSE_CACHE_URL:
+    response_cache = ResponseCache(RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL))
+elif RESPONSE_CACHE_BYTES > 0:
+    response_cache = ResponseCache(MemoryBackend(RESPONSE_CACHE_BYTES, RESPONSE_CACHE_TTL))
+
+def invalidate_user_rows(table, users):
+    """Drop the cached query responses for table of each of users after a write."""
+    if response_cache is not None and table in TABLE_COLUMNS:
+        response_cache.invalidate(table, users)
+
+def conditional_response(cached):
+    """Send a cached body with its strong ETag, or 304 if the client already has it."""
+    response = Response(cached.body, mimetype=cached.mimetype, headers=cached.headers)
+    response.set_etag(cached.etag)
+    # Clients may keep the body but must revalidate it on every use.
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+def encode_cursor(datetime_val, row_id):
+    """Opaque keyset cursor pointing just after the given row."""
+    return base64.urlsafe_b64encode(json.dumps([datetime_val, row_id], default=json_default).encode()).decode()
+
+def decode_cursor(token):
+    try:
+        datetime_val, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return str(datetime_val), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+def build_user_query(table, args):
     """
-    Query Vitals by User_ID.
+    Build the SELECT for a per-user time-series query from request args.
+    Returns (sql, params, columns, limit) where columns are the projected
+    output columns; the selected row ID always follows them for keyset paging.
+    """
+    user = args.get('user')
+    if not user:
+        raise ValueError("Missing query parameter 'user'.")
+
+    columns = TABLE_COLUMNS[table]
+    if args.get('fields'):
+        columns = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in columns if field not in TABLE_COLUMNS[table]]
+        if unknown or not columns:
+            raise ValueError(f"Unknown field(s) for {table}: {', '.join(unknown) or 'none given'}.")
+
+    conditions, params = ["User_ID = ?"], [user]
+    if args.get('from'):
+        conditions.append("Datetime >= ?")
+        params.append(args['from'])
+    if args.get('to'):
+        conditions.append("Datetime <= ?")
+        params.append(args['to'])
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("Query parameter 'order' must be 'asc' or 'desc'.")
+    if args.get('cursor'):
+        datetime_val, row_id = decode_cursor(args['cursor'])
+        after = ">" if order == "asc" else "<"
+        conditions.append(f"(Datetime {after} ? OR (Datetime = ? AND ID {after} ?))")
+        params.extend([datetime_val, datetime_val, row_id])
+
+    limit = None
+    top = ""
+    if args.get('limit'):
+        try:
+            limit = int(args['limit'])
+        except ValueError:
+            raise ValueError("Query parameter 'limit' must be an integer.")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"Query parameter 'limit' must be between 1 and {MAX_PAGE_SIZE}.")
+        # Fetch one extra row to learn whether another page follows.
+        top = "TOP ? "
+        params.insert(0, limit + 1)
+
+    sql = f"""
+        SELECT {top}{", ".join(columns)}, Datetime, ID
+        FROM {table}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY Datetime {order.upper()}, ID {order.upper()}
+    """
+    return sql, params, columns, limit
+
+def stream_user_rows(sql, params, columns, fmt):
+    """Yield query results in fetchmany chunks as NDJSON lines or a JSON array."""
+    width = len(columns)
+    with get_pool().cursor() as cursor:
+        cursor.execute(sql, params)
+        if fmt == "json":
+            yield "["
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            with timed("serialize"):
+                lines = [json.dumps(dict(zip(columns, row[:width])), default=json_default) for row in rows]
+            if fmt == "ndjson":
+                yield "\n".join(lines) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(lines)
+            first = False
+        if fmt == "json":
+            yield "]"
+
+def query_user_rows(table):
+    """
+    Shared implementation of the per-user query endpoints.
     Expects query parameter:
       - user: the user ID
-    Returns all matching rows from the Vitals table.
+    Optional query parameters:
+      - from, to: inclusive Datetime bounds
+      - fields: comma-separated columns to return
+      - order: "asc" (oldest first, the default) or "desc"
+      - limit: page size; the cursor for the next page is returned in the
+        X-Next-Cursor header when more rows follow
+      - cursor: value of X-Next-Cursor from the previous page
+      - stream: "ndjson" or "json" to stream rows in chunks instead of
+        building the whole response in memory
+    Non-streamed responses carry an ETag and are answered with 304 when the
+    client sends a matching If-None-Match. They are sent column by column
+    when the Accept header prefers one of the formats in columnar.py.
     """
-    user = request.args.get('user')
-    if not user:
-        return jsonify({"error": "Missing query parameter 'user'."}), 400
+    try:
+        sql, params, columns, limit = build_user_query(table, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream = request.args.get('stream')
+    if stream:
+        if stream not in ("ndjson", "json"):
+            return jsonify({"error": "Query parameter 'stream' must be 'ndjson' or 'json'."}), 400
+        if limit is not None:
+            return jsonify({"error": "Use either 'stream' or 'limit', not both."}), 400
+        mimetype = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return Response(stream_with_context(stream_user_rows(sql, params, columns, stream)), mimetype=mimetype)
+
+    fmt = columnar.negotiate(request.accept_mimetypes)
+    encoding = columnar.negotiate_encoding(request.accept_encodings) if fmt != columnar.ROWS_JSON else None
+
+    key = None
+    if response_cache is not None:
+        args = [(name, value) for name, value in request.args.items(multi=True) if name != 'user']
+        args += [("Accept", fmt), ("Accept-Encoding", encoding or "identity")]
+        key, cached = response_cache.lookup(table, request.args['user'], args)
+        if cached is not None:
+            return conditional_response(cached)
 
     try:
-        sql = "SELECT * FROM Vitals WHERE User_ID = ?"
-        cursor.execute(sql, (user,))
-        rows = cursor.fetchall()
-        results = [
-            {
-                "User_ID": row[0],
-                "Temperature": row[1],
-                "BloodPressure": row[2],
-                "PulseRate": row[3],
-                "Datetime": row[4]
-            } for row in rows
-        ]
-        return jsonify(results), 200
+        with get_pool().cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        headers = {"Vary": "Accept, Accept-Encoding"}
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(rows[-1][-2], rows[-1][-1])
+        if fmt == columnar.ROWS_JSON:
+            width = len(columns)
+            results = [dict(zip(columns, row[:width])) for row in rows]
+            body = jsonify(results).get_data()
+        else:
+            with timed("serialize"):
+                body, applied = columnar.compress(columnar.encode(fmt, columns, rows, json_default), encoding)
+            if applied:
+                headers["Content-Encoding"] = applied
+        cached = CachedResponse(body, generate_etag(body), headers, fmt)
+        if response_cache is not None:
+            response_cache.store(key, cached)
+        return conditional_response(cached)
 
     except Exception as e:
-        print(f"Error querying Vitals: {e}")
+        print(f"Error querying {table}: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/vitals', methods=['GET'])
+def query_vitals():
+    """
+    Query Vitals by User_ID.
+    Expects query parameter:
+      - user: the user ID
+    Supports the time-range, projection, paging and streaming parameters
+    described in query_user_rows().
+    Returns matching rows from the Vitals table, oldest first by default.
+    """
+    return query_user_rows("Vitals")
+
+
 @app.route('/api/activity', methods=['GET'])
 def query_activity():
     """
     Query Activity by User_ID.
     Expects query parameter:
       - user: the user ID
-    Returns all matching rows from the Activity table.
+    Supports the time-range, projection, paging and streaming parameters
+    described in query_user_rows().
+    Returns matching rows from the Activity table, oldest first by default.
+    """
+    return query_user_rows("Activity")
+
+
+@app.route('/api/prompts', methods=['GET'])
+def query_prompts():
+    """
+    Query PastPrompts by User_ID.
+    Expects query parameter:
+      - user: the user ID
+    Supports the time-range, projection, paging and streaming parameters
+    described in query_user_rows().
+    Returns matching rows from the PastPrompts table, oldest first by default.
+    """
+    return query_user_rows("PastPrompts")
+
+
+@app.route('/api/prompts/search', methods=['GET'])
+def search_prompts():
+    """
+    Query PastPrompts by User_ID and a text prompt.
+    Expects query parameters:
+      - user: the user ID
+      - prompt: the prompt text to embed and compare
+    Optional query parameters:
+      - k: number of summaries to return (default 5)
+      - recency_weight: 0 ranks by similarity only, 1 by recency only
+        (default PROMPT_RECENCY_WEIGHT)
+      - half_life_days: age at which a summary's recency is halved
+        (default PROMPT_HALF_LIFE_DAYS)
+    Returns the top k summaries with their similarity and score, best first.
     """
     user = request.args.get('user')
-    if not user:
-        return jsonify({"error": "Missing query parameter 'user'."}), 400
+    prompt = request.args.get('prompt')
+    if not user or not prompt:
+        return jsonify({"error": "Missing query parameters 'user' and/or 'prompt'."}), 400
+    try:
+        top_k = int(request.args.get('k', '5'))
+        recency_weight = float(request.args.get('recency_weight', PROMPT_RECENCY_WEIGHT))
+        half_life_days = float(request.args.get('half_life_days', PROMPT_HALF_LIFE_DAYS))
+    except ValueError:
+        return jsonify({"error": "Query parameters 'k', 'recency_weight' and 'half_life_days' must be numbers."}), 400
+    if not 1 <= top_k <= MAX_PAGE_SIZE or not 0 <= recency_weight <= 1:
+        return jsonify({"error": f"'k' must be between 1 and {MAX_PAGE_SIZE}, 'recency_weight' between 0 and 1."}), 400
 
     try:
-        sql = "SELECT * FROM Activity WHERE User_ID = ?"
-        cursor.execute(sql, (user,))
-        rows = cursor.fetchall()
-        results = [
-            {
-                "User_ID": row[0],
-                "Activity": row[1],
-                "Duration": row[2],
-                "Datetime": row[3]
-            } for row in rows
-        ]
+        results = find_past_prompts(user, prompt, top_k, recency_weight=recency_weight, half_life_days=half_life_days)
         return jsonify(results), 200
 
     except Exception as e:
-        print(f"Error querying Activity: {e}")
+        print(f"Error searching PastPrompts: {e}")
         return jsonify({"error": str(e)}), 500
 
+###############################################################################
+# Aggregation Endpoints
+###############################################################################
 
-@app.route('/api/prompts', methods=['GET'])
-def query_prompts():
+# Source columns and how to turn them into numeric metrics, per table.
+AGGREGATE_SOURCES = {
+    "vitals": ("Vitals", ["Temperature", "PulseRate", "BloodPressure"]),
+    "activity": ("Activity", ["Duration"]),
+    "diet": ("Diet", ["Calories"]),
+}
+
+def aggregate_metrics(table, columns):
+    """Build the numeric metric arrays for one table from its fetched columns."""
+    if table == "Vitals":
+        systolic, diastolic = aggregate.parse_blood_pressure(columns["BloodPressure"])
+        return {
+            "Temperature": aggregate.to_float(columns["Temperature"]),
+            "PulseRate": aggregate.to_float(columns["PulseRate"]),
+            "Systolic": systolic,
+            "Diastolic": diastolic,
+        }
+    return {name: aggregate.to_float(values) for name, values in columns.items()}
+
+
+@app.route('/api/aggregate/<kind>', methods=['GET'])
+def query_aggregate(kind):
     """
-    Query PastPrompts by User_ID.
+    Time-bucketed statistics for Vitals, Activity or Diet.
+    Path parameter kind is one of: vitals, activity, diet.
     Expects query parameter:
       - user: the user ID
-    Returns all matching rows from the PastPrompts table.
+    Optional query parameters:
+      - bucket: hour, day (default) or week
+      - from, to: inclusive Datetime bounds
+    Returns bucket start times and, per metric, mean/min/max/count/sum lists
+    aligned with them. BloodPressure is reported as Systolic and Diastolic.
     """
+    if kind not in AGGREGATE_SOURCES:
+        return jsonify({"error": f"Unknown aggregate '{kind}'."}), 404
     user = request.args.get('user')
     if not user:
         return jsonify({"error": "Missing query parameter 'user'."}), 400
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in aggregate.BUCKETS:
+        return jsonify({"error": f"Query parameter 'bucket' must be one of {', '.join(aggregate.BUCKETS)}."}), 400
+
+    table, sources = AGGREGATE_SOURCES[kind]
+    conditions, params = ["User_ID = ?"], [user]
+    if request.args.get('from'):
+        conditions.append("Datetime >= ?")
+        params.append(request.args['from'])
+    if request.args.get('to'):
+        conditions.append("Datetime <= ?")
+        params.append(request.args['to'])
+    sql = f"SELECT Datetime, {', '.join(sources)} FROM {table} WHERE {' AND '.join(conditions)}"
 
     try:
-        sql = "SELECT * FROM PastPrompts WHERE User_ID = ?"
-        cursor.execute(sql, (user,))
-        rows = cursor.fetchall()
-        results = [
-            {
-                "User_ID": row[0],
-                "Summary": row[1],
-                "Datetime": row[2]
-            } for row in rows
-        ]
-        return jsonify(results), 200
+        datetimes, columns = [], {name: [] for name in sources}
+        with get_pool().cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    datetimes.append(row[0])
+                    for name, value in zip(sources, row[1:]):
+                        columns[name].append(value)
+
+        result = aggregate.aggregate(
+            aggregate.parse_timestamps(datetimes),
+            aggregate_metrics(table, columns),
+            bucket,
+        )
+        result["rows"] = len(datetimes)
+        return jsonify(result), 200
 
     except Exception as e:
-        print(f"Error querying PastPrompts: {e}")
+        print(f"Error aggregating {table}: {e}")
         return jsonify({"error": str(e)}), 500
 
+###############################################################################
+# Chat Endpoint
+###############################################################################
+
+# Rows of recent vitals/activity included in chat context, and the number of
+# past prompts most relevant to the message (see search_past_prompts()).
+CHAT_RECENT_ROWS = int(os.getenv('CHAT_RECENT_ROWS', '20'))
+CHAT_PAST_PROMPTS = int(os.getenv('CHAT_PAST_PROMPTS', '5'))
+CHAT_MAX_TOKENS = int(os.getenv('CHAT_MAX_TOKENS', '512'))
+TTFT_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0]
+
+llm_client = None
+_llm_lock = threading.Lock()
+chat_ttft = Histogram(TTFT_BUCKETS)
+chat_retrieval_time = Histogram(TTFT_BUCKETS)
+# Retrievals for one chat turn run side by side on this pool.
+retrieval_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CHAT_RETRIEVAL_WORKERS', '8')),
+                                        thread_name_prefix="chat-retrieval")
+
+def get_llm_client():
+    """Create the LLM client selected by LLM_BACKEND on first use."""
+    global llm_client
+    if llm_client is None:
+        with _llm_lock:
+            if llm_client is None:
+                llm_client = llm.create_client()
+    return llm_client
+
+def recent_rows(table, columns, user, limit=CHAT_RECENT_ROWS):
+    """Newest rows for a user, newest first."""
+    sql = f"SELECT TOP ? {', '.join(columns)} FROM {table} WHERE User_ID = ? ORDER BY Datetime DESC"
+    with get_pool().cursor() as cursor:
+        cursor.execute(sql, (limit, user))
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def relevant_prompts(user, message):
+    """Past prompts most relevant to message, or the newest ones if they cannot be searched."""
+    try:
+        return find_past_prompts(user, message, CHAT_PAST_PROMPTS)
+    except Exception as e:
+        print(f"Past prompt search failed, using the newest prompts: {e}")
+        return recent_rows("PastPrompts", ["Summary", "Datetime"], user, CHAT_PAST_PROMPTS)
+
+def json_default_str(value):
+    """Format TIMESTAMP values as text for prompts; pass other values through."""
+    return json_default(value) if isinstance(value, (date, datetime)) else value
+
+def format_records(records):
+    return "\n".join(f"{r['Symptom']}: {r['Diagnosis']} ({json_default_str(r['Datetime'])})" for r in records)
+
+def format_vitals(rows):
+    return "\n".join(
+        f"Temp: {r['Temperature']}, BP: {r['BloodPressure']}, Pulse: {r['PulseRate']} at {json_default_str(r['Datetime'])}"
+        for r in rows
+    )
+
+def format_activity(rows):
+    return "\n".join(f"{r['Activity']} for {r['Duration']} mins at {json_default_str(r['Datetime'])}" for r in rows)
+
+def format_prompts(rows):
+    return "\n".join(f"{r['Summary']} ({json_default_str(r['Datetime'])})" for r in rows)
+
+# Retrieval each prompt mode needs. symptom_checker and lifestyle_summary fetch
+# what the app fetched itself; the app sent treatment_recommendation and
+# followup_question with no context, so here they also get the closest
+# medical records and past conversations.
+CHAT_RETRIEVALS = {
+    "symptom_checker": ["medical"],
+    "lifestyle_summary": ["vitals", "activity"],
+    "treatment_recommendation": ["medical", "prompts"],
+    "followup_question": ["medical", "prompts"],
+    "general_conversation": [],
+}
+
+def retrieve_chat_context(user, mode, message):
+    """Run the retrievals for a prompt mode in parallel and build its context."""
+    tasks = {
+        "medical": lambda: find_medical_records(user, message, 3),
+        "vitals": lambda: recent_rows("Vitals", ["Temperature", "BloodPressure", "PulseRate", "Datetime"], user),
+        "activity": lambda: recent_rows("Activity", ["Activity", "Duration", "Datetime"], user),
+        "prompts": lambda: relevant_prompts(user, message),
+    }
+    futures = {name: retrieval_executor.submit(tasks[name]) for name in CHAT_RETRIEVALS[mode]}
+    found = {name: future.result() for name, future in futures.items()}
+
+    if mode == "symptom_checker":
+        return f"Patient symptoms: {message}\nPast Medical Records:\n{format_records(found['medical'])}"
+    if mode == "lifestyle_summary":
+        return (f"\n{message}\nVitals Data:\n{format_vitals(found['vitals'])}"
+                f"\n\nActivity Data:\n{format_activity(found['activity'])}")
+    if mode in ("treatment_recommendation", "followup_question"):
+        return (f"Patient message: {message}\nPast Medical Records:\n{format_records(found['medical'])}"
+                f"\nPast Conversations:\n{format_prompts(found['prompts'])}")
+    return message
+
+def sse(data, event=None):
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, default=json_default)}\n\n"
+
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    """
+    Answers a chat message with retrieval-augmented generation.
+    Expects JSON with keys:
+      - User_ID, Mode, Message
+    Mode is one of the prompt templates (symptom_checker, lifestyle_summary,
+    treatment_recommendation, followup_question, general_conversation).
+    Streams the completion as server-sent events: one {"token"} event per
+    fragment, then a "done" event with retrieval and time-to-first-token
+    timings, or an "error" event.
+    """
+    data = request.get_json()
+    required_fields = ["User_ID", "Mode", "Message"]
+    for field in required_fields:
+        if field not in data:
+            return jsonify({"error": f"Missing field {field}"}), 400
+    if data["Mode"] not in PROMPT_TEMPLATES:
+        return jsonify({"error": f"Unknown mode {data['Mode']}"}), 400
+
+    user, mode, message = data["User_ID"], data["Mode"], data["Message"]
+    started = time.perf_counter()
+
+    def generate():
+        try:
+            context = retrieve_chat_context(user, mode, message)
+            retrieved = time.perf_counter()
+            chat_retrieval_time.observe(retrieved - started)
+            messages = [{"role": "user", "content": get_prompt(mode, context)}]
+
+            first_token = None
+            for token in get_llm_client().stream(messages, max_tokens=CHAT_MAX_TOKENS):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    chat_ttft.observe(first_token - started)
+                yield sse({"token": token})
+
+            finished = time.perf_counter()
+            yield sse({
+                "retrieval_ms": (retrieved - started) * 1000,
+                "ttft_ms": ((first_token or finished) - started) * 1000,
+                "total_ms": (finished - started) * 1000,
+            }, event="done")
+
+        except Exception as e:
+            print(f"Error in chat: {e}")
+            yield sse({"error": str(e)}, event="error")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+
+@app.route('/api/chat/stats', methods=['GET'])
+def chat_stats():
+    """Report time-to-first-token and retrieval-time histograms for /api/chat."""
+    return jsonify({
+        "ttft_seconds": chat_ttft.snapshot(),
+        "retrieval_seconds": chat_retrieval_time.snapshot(),
+    }), 200
+
+###############################################################################
+# Monitoring Endpoints
+###############################################################################
+
+@app.route('/api/pool', methods=['GET'])
+def pool_stats():
+    """
+    Report connection pool usage: size, utilization, checkout wait times
+    and reconnect counts.
+    """
+    return jsonify(get_pool().stats()), 200
+
+
+@app.route('/api/cache', methods=['GET'])
+def response_cache_stats():
+    """
+    Report response cache hits, misses and invalidations for the per-user
+    query endpoints, along with the backend's size and evictions.
+    """
+    if response_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(response_cache.stats(), enabled=True)), 200
+
+
+@app.route('/api/embedder', methods=['GET'])
+def embedder_stats():
+    """
+    Report embedding micro-batch statistics: batch-size and queue-wait
+    histograms, used to tune EMBED_MAX_BATCH and EMBED_MAX_WAIT_MS,
+    along with embedding cache hit, miss and eviction counts.
+    """
+    stats = embedder.stats()
+    stats["cache"] = get_embedding_cache().stats()
+    if embedding_client is not None:
+        stats["server"] = embedding_client.stats()
+    if embedding_backend:
+        stats["backend"] = embedding_backend
+    stats["version"] = {"version": codec.version, "slot": codec.slot}
+    if vector_index is not None:
+        stats["vector_index"] = vector_index.stats()
+    if ingest_queue is not None:
+        stats["ingest_queue"] = ingest_queue.stats()
+    return jsonify(stats), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus metrics: request latency, per-stage latency (embed,
+    db_execute, db_fetch, serialize), response sizes and rows fetched, per
+    route, plus connection pool and embedding gauges.
+    """
+    gauges = []
+    if pool is not None:
+        stats = pool.stats()
+        gauges += [
+            ("api_pool_size", "Open database connections.", stats["size"]),
+            ("api_pool_in_use", "Database connections checked out.", stats["in_use"]),
+            ("api_pool_wait_seconds_max", "Longest wait for a database connection.", stats["wait_seconds_max"]),
+        ]
+    if embedding_cache is not None:
+        gauges.append(("api_embedding_cache_hit_ratio", "Embedding cache hit ratio.",
+                       embedding_cache.stats()["hit_rate"]))
+    if response_cache is not None:
+        gauges.append(("api_response_cache_hit_ratio", "Response cache hit ratio.",
+                       response_cache.stats()["hit_rate"]))
+    gauges.append(("api_embedding_queue_pending", "Texts waiting for an embedding batch.",
+                   embedder.stats()["pending"]))
+    text = render_prometheus(instrumentation.FAMILIES, gauges)
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/profile', methods=['GET', 'POST'])
+def sampling_profile():
+    """
+    GET returns the combined cProfile statistics of sampled requests.
+    Optional query parameters: sort (default cumulative), limit (default 30).
+    POST with JSON {"rate": 0.05} sets the fraction of requests profiled
+    (0 turns profiling off); add "reset": true to discard collected samples.
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            rate = float(data.get("rate", profiler.rate))
+        except (TypeError, ValueError):
+            return jsonify({"error": "'rate' must be a number between 0 and 1."}), 400
+        if not 0 <= rate <= 1:
+            return jsonify({"error": "'rate' must be a number between 0 and 1."}), 400
+        profiler.rate = rate
+        if data.get("reset"):
+            profiler.reset()
+        return jsonify({"rate": profiler.rate, "profiled": profiler.profiled}), 200
+    try:
+        report = profiler.report(request.args.get('sort', 'cumulative'), int(request.args.get('limit', '30')))
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Invalid sort or limit: {e}"}), 400
+    return Response(report, mimetype="text/plain")
+
+
+def warm_up():
+    """
+    Load the model (or reach the embedding server), run one encode and open
+    the database pool ahead of the first request. Records each stage in
+    startup_timings and prints a report.
+    """
+    # Pick up the active embedding version first, so only its model is loaded.
+    get_pool()
+    sync_embedding_version()
+    if embedding_client is None:
+        get_model()
+    started = time.perf_counter()
+    encode_batch(["warm up"])
+    startup_timings["model_warmup"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_embedding_cache()
+    startup_timings["embedding_cache_open"] = time.perf_counter() - started
+
+    # Resume draining any jobs left over from a previous run.
+    get_ingest_queue()
+    print("Startup timings: " + ", ".join(
+        f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in startup_timings.items()
+    ))
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """
+    Readiness probe. Returns 200 once the model is loaded and the database
+    pool is connected, 503 otherwise, along with the startup-time breakdown.
+    """
+    status = {
+        "ready": embedding_ready() and pool is not None,
+        "model_loaded": embedding_ready(),
+        "database_connected": pool is not None,
+        "startup_timings_ms": {stage: seconds * 1000 for stage, seconds in startup_timings.items()},
+    }
+    return jsonify(status), 200 if status["ready"] else 503
+
 ###############################################################################
 # Run the Flask App
 ###############################################################################
@@ -350,5 +1631,15 @@ def query_prompts():
 # Register the blueprint so that all routes are under the '/api' prefix.
 app.register_blueprint(api_bp)
 
+startup_timings["module_import"] = time.perf_counter() - _import_started
+
 if __name__ == '__main__':
+    if os.getenv('AUTO_MIGRATE') == '1':
+        from migrations import migrate
+        migrate()
+    # Warm up in the background so the server starts accepting requests
+    # immediately; /api/ready reports when it has finished. With debug=True
+    # only the reloader's child process serves requests.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     app.run(port=3000, debug=True)
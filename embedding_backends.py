@@ -0,0 +1,258 @@
+"""
+Selectable inference backends for the embedding model.
+
+  - torch:     SentenceTransformer on PyTorch, full precision (the reference)
+  - onnx:      the same weights exported to ONNX and run with onnxruntime
+  - onnx-int8: the ONNX graph with dynamic int8 quantization of its weights
+
+The ONNX backends need `optimum` (pip install "sentence-transformers[onnx]").
+Exported models are kept under EMBED_ONNX_DIR so the export only runs once.
+
+A backend other than torch is only used after passing an accuracy gate:
+its embeddings of a sample corpus are compared with the reference model's,
+and it is rejected (falling back to torch) if the mean cosine similarity or
+the top-3 retrieval overlap is below the configured minimum. The scores are
+saved next to the exported model, so later starts load only the model they
+will use; they are measured again if the exported model file changes.
+
+Usage:
+    python embedding_backends.py --backend onnx-int8 --threads 4
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import time
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = os.getenv("EMBED_ONNX_DIR", ".onnx_models")
+MIN_COSINE = float(os.getenv("EMBED_MIN_COSINE", "0.99"))
+MIN_TOP_K_OVERLAP = float(os.getenv("EMBED_MIN_TOPK_OVERLAP", "0.9"))
+TOP_K = 3
+
+# Records and prompts resembling what the API embeds, used by the accuracy gate.
+SAMPLE_RECORDS = [
+    "Diagnosed with type 2 diabetes mellitus, started on metformin 500 mg twice daily.",
+    "HbA1c 8.1%, fasting glucose 162 mg/dL. Advised dietary changes and follow-up in 3 months.",
+    "Essential hypertension, blood pressure 152/96. Prescribed lisinopril 10 mg daily.",
+    "Blood pressure well controlled at 124/80 on current medication.",
+    "Seasonal allergic rhinitis with sneezing and nasal congestion, loratadine recommended.",
+    "Mild persistent asthma, albuterol inhaler as needed and inhaled fluticasone.",
+    "Sprained left ankle while running, RICE protocol and ibuprofen for pain.",
+    "Lower back pain after lifting, no radiating symptoms, physiotherapy referral.",
+    "Hyperlipidemia, LDL 168 mg/dL, started atorvastatin 20 mg at night.",
+    "Migraine with aura, two episodes per month, sumatriptan prescribed for attacks.",
+    "Generalized anxiety disorder, referred for cognitive behavioural therapy.",
+    "Iron deficiency anemia, hemoglobin 10.2 g/dL, oral iron supplementation.",
+    "Hypothyroidism, TSH 7.8 mIU/L, levothyroxine 50 mcg daily.",
+    "Acute bronchitis with productive cough for 10 days, supportive care.",
+    "Gastroesophageal reflux disease, omeprazole 20 mg before breakfast.",
+    "Annual physical exam, all labs within normal limits, continue regular exercise.",
+    "Vitamin D deficiency, 25-OH vitamin D 14 ng/mL, started cholecalciferol.",
+    "Insomnia related to work stress, sleep hygiene counselling provided.",
+    "Osteoarthritis of the right knee, pain on stairs, topical diclofenac.",
+    "Penicillin allergy documented, hives after amoxicillin in childhood.",
+]
+SAMPLE_QUERIES = [
+    "How is my blood sugar control?",
+    "What medication am I taking for blood pressure?",
+    "Do I have any breathing problems?",
+    "Why does my knee hurt?",
+    "What should I know about my cholesterol?",
+    "Am I allergic to any antibiotics?",
+    "I keep getting bad headaches",
+    "I feel tired and pale all the time",
+]
+
+
+def default_quantization():
+    """The onnxruntime dynamic quantization config for this CPU."""
+    return os.getenv("EMBED_ONNX_QUANTIZATION") or (
+        "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+    )
+
+
+def export_directory(model_name):
+    return os.path.join(ONNX_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+
+
+def model_file(model_name, backend):
+    """Path of the exported ONNX model file for backend."""
+    if backend == "onnx":
+        return os.path.join(export_directory(model_name), "onnx", "model.onnx")
+    return os.path.join(export_directory(model_name), "onnx", f"model_qint8_{default_quantization()}.onnx")
+
+
+def _gate_path(model_name, backend):
+    return os.path.join(export_directory(model_name), f"gate_{backend}.json")
+
+
+def _model_identity(model_name, backend):
+    stat = os.stat(model_file(model_name, backend))
+    return {"file": os.path.basename(model_file(model_name, backend)), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def read_gate(model_name, backend):
+    """The saved accuracy gate scores for backend, or None if it must be measured."""
+    try:
+        with open(_gate_path(model_name, backend)) as f:
+            saved = json.load(f)
+        if saved.pop("model") != _model_identity(model_name, backend):
+            return None
+        return saved
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_gate(model_name, backend, scores):
+    """Save the accuracy gate scores; written atomically, as workers start together."""
+    path = _gate_path(model_name, backend)
+    saved = dict(scores, model=_model_identity(model_name, backend))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(saved, f)
+    os.replace(tmp, path)
+
+
+def _session_options(threads):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+def load_backend(model_name, backend="torch", threads=None):
+    """Load model_name on the given backend, exporting it to ONNX if needed."""
+    from sentence_transformers import SentenceTransformer
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+
+    directory = export_directory(model_name)
+    if not os.path.exists(os.path.join(directory, "onnx", "model.onnx")):
+        print(f"Exporting {model_name} to ONNX in {directory}")
+        SentenceTransformer(model_name, backend="onnx").save_pretrained(directory)
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": _session_options(threads)}
+    if backend == "onnx":
+        return SentenceTransformer(directory, backend="onnx", model_kwargs=model_kwargs)
+
+    quantization = default_quantization()
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(directory, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f"Quantizing {model_name} to int8 ({quantization})")
+        onnx_model = SentenceTransformer(directory, backend="onnx", model_kwargs=model_kwargs)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization, directory)
+    model_kwargs["file_name"] = file_name
+    return SentenceTransformer(directory, backend="onnx", model_kwargs=model_kwargs)
+
+
+def encode(model, texts):
+    return np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=min(len(texts), 64)), dtype=np.float32)
+
+
+def compare(reference, candidate, records=SAMPLE_RECORDS, queries=SAMPLE_QUERIES, k=TOP_K):
+    """
+    Compare a candidate model's embeddings with the reference model's.
+    Returns the mean and minimum cosine similarity over all texts and the
+    average fraction of each query's top-k records that both models agree on.
+    """
+    texts = list(records) + list(queries)
+    expected, actual = encode(reference, texts), encode(candidate, texts)
+    cosines = np.sum(expected * actual, axis=1)
+
+    n = len(records)
+    expected_top = np.argsort(-(expected[n:] @ expected[:n].T), axis=1)[:, :k]
+    actual_top = np.argsort(-(actual[n:] @ actual[:n].T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(expected_top, actual_top)])
+    return {
+        "mean_cosine": float(np.mean(cosines)),
+        "min_cosine": float(np.min(cosines)),
+        "top_k_overlap": float(overlap),
+    }
+
+
+def load_model(model_name, backend="torch", threads=None,
+               min_cosine=MIN_COSINE, min_top_k_overlap=MIN_TOP_K_OVERLAP):
+    """
+    Load the embedding model on the requested backend if it passes the
+    accuracy gate. Returns (model, report); report["backend"] is the backend
+    actually in use. With saved gate scores only the model that will be used
+    is loaded; otherwise the torch reference is loaded to measure them.
+    """
+    if backend == "torch":
+        return load_backend(model_name, "torch", threads), {"backend": "torch", "requested": "torch"}
+
+    def passes(scores):
+        return scores["mean_cosine"] >= min_cosine and scores["top_k_overlap"] >= min_top_k_overlap
+
+    def log(scores, saved):
+        print(f"Embedding backend {backend}: mean cosine {scores['mean_cosine']:.4f}, "
+              f"top-{TOP_K} overlap {scores['top_k_overlap']:.2f}{' (saved)' if saved else ''} "
+              f"-> {'accepted' if passes(scores) else 'rejected'}")
+
+    scores = read_gate(model_name, backend) if backend in BACKENDS else None
+    if scores is not None:
+        log(scores, saved=True)
+        report = dict(scores, requested=backend, backend=backend if passes(scores) else "torch")
+        if not passes(scores):
+            return load_backend(model_name, "torch", threads), report
+        try:
+            return load_backend(model_name, backend, threads), report
+        except Exception as e:
+            print(f"Embedding backend {backend} unavailable, using torch: {e}")
+            return load_backend(model_name, "torch", threads), {"backend": "torch", "requested": backend, "error": str(e)}
+
+    reference = load_backend(model_name, "torch", threads)
+    try:
+        candidate = load_backend(model_name, backend, threads)
+    except Exception as e:
+        print(f"Embedding backend {backend} unavailable, using torch: {e}")
+        return reference, {"backend": "torch", "requested": backend, "error": str(e)}
+
+    scores = compare(reference, candidate)
+    try:
+        write_gate(model_name, backend, scores)
+    except OSError as e:
+        print(f"Could not save the accuracy gate scores for {backend}: {e}")
+    log(scores, saved=False)
+    report = dict(scores, requested=backend, backend=backend if passes(scores) else "torch")
+    return (candidate if passes(scores) else reference), report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "pritamdeka/S-PubMedBert-MS-MARCO"))
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBED_THREADS", "0")) or None)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the sample corpus")
+    args = parser.parse_args()
+
+    reference = load_backend(args.model, "torch", args.threads)
+    candidate = load_backend(args.model, args.backend, args.threads)
+    report = compare(reference, candidate)
+    print(f"mean cosine {report['mean_cosine']:.4f}, min cosine {report['min_cosine']:.4f}, "
+          f"top-{TOP_K} overlap {report['top_k_overlap']:.2f}")
+
+    texts = SAMPLE_RECORDS + SAMPLE_QUERIES
+    for name, model in (("torch", reference), (args.backend, candidate)):
+        encode(model, texts)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for text in texts:
+                encode(model, [text])
+        per_text = (time.perf_counter() - started) / (args.repeat * len(texts))
+        print(f"{name:<10} {per_text * 1000:.2f} ms per single-text encode")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+# Each index record is a 16-byte key digest followed by a little-endian slot number.
+INDEX_RECORD = struct.Struct("<16sQ")
+INITIAL_DISK_SLOTS = 1024
+
+
+def normalize_text(text):
+    """
+    Normalize text for cache lookups. Tokenizers ignore runs of whitespace,
+    so these variants embed identically. Case is kept: EMBEDDING_MODEL may
+    be a cased model, for which "MS" and "ms" embed differently.
+    """
+    return " ".join(text.split())
+
+
+class DiskVectorStore:
+    """
+    A persistent, memory-mapped store of fixed-size float32 vectors.
+
+    Vectors live in `vectors.f32`, a memory-mapped array that grows by
+    doubling up to `capacity` slots and is then reused as a ring. Slot
+    assignments are appended to `index.bin` and replayed on open, so the
+    store survives restarts. Each embedding version (model and backend,
+    see embedding_versions.py) and vector size gets its own subdirectory of
+    `directory` (named by a digest of both, described by its `meta.json`),
+    so switching versions never deletes a store that another process may
+    have open.
+
+    Several processes may share a store. Every access takes an fcntl lock
+    on the `lock` file (exclusive to write, shared to read) and first
+    replays the index records other processes appended since the last
+    access, so slots are allocated from one shared ring position and a key
+    is never read from a slot that has since been reused for another key.
+    """
+
+    def __init__(self, directory, version, dim, capacity=100000):
+        meta = {"version": version, "dim": dim}
+        digest = hashlib.sha256(json.dumps(meta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.directory = os.path.join(directory, digest)
+        self.dim = dim
+        self.capacity = capacity
+        self.evictions = 0
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._index_path = os.path.join(self.directory, "index.bin")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        self._lock_file = open(os.path.join(self.directory, "lock"), "a+b")
+
+        self._slots = {}       # key digest -> slot
+        self._owners = {}      # slot -> key digest
+        self._next_slot = 0
+        self._index_inode = None
+        self._index_offset = 0
+        with self._locked(fcntl.LOCK_EX):
+            self._open_index()
+            slots = max(INITIAL_DISK_SLOTS, self._allocated_slots())
+            self._vectors = self._map(min(slots, capacity))
+
+    @contextmanager
+    def _locked(self, operation):
+        fcntl.flock(self._lock_file.fileno(), operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _allocated_slots(self):
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dim)
+
+    def _map(self, slots):
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        if mode == "r+" and self._allocated_slots() < slots:
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(slots * 4 * self.dim)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(slots, self.dim))
+
+    def _open_index(self):
+        """Replay the index on open; call with the exclusive lock held."""
+        if os.path.exists(self._index_path):
+            # A record cut short by a crash would misalign every later one.
+            size = os.path.getsize(self._index_path)
+            if size % INDEX_RECORD.size:
+                with open(self._index_path, "r+b") as f:
+                    f.truncate(size - size % INDEX_RECORD.size)
+        records = self._catch_up()
+        # Rewrite the log once it is mostly superseded entries. It is replaced
+        # rather than rewritten in place, and other processes notice the new
+        # file and replay it from the start.
+        if records > 2 * max(len(self._slots), 1):
+            temporary = self._index_path + ".tmp"
+            with open(temporary, "wb") as f:
+                for key, slot in self._slots.items():
+                    f.write(INDEX_RECORD.pack(key, slot))
+                # Keep the ring position, which the last record determines.
+                last = (self._next_slot - 1) % self.capacity
+                if last in self._owners:
+                    f.write(INDEX_RECORD.pack(self._owners[last], last))
+            os.replace(temporary, self._index_path)
+            self._catch_up()
+
+    def _catch_up(self):
+        """Apply index records written since the last call; returns how many were read."""
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_ino != self._index_inode:
+            self._slots.clear()
+            self._owners.clear()
+            self._next_slot = 0
+            self._index_inode = stat.st_ino
+            self._index_offset = 0
+        if stat.st_size <= self._index_offset:
+            return 0
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read(stat.st_size - self._index_offset)
+        data = data[:len(data) - len(data) % INDEX_RECORD.size]
+        records = 0
+        for key, slot in INDEX_RECORD.iter_unpack(data):
+            records += 1
+            if slot >= self.capacity:
+                continue
+            self._assign(key, slot)
+            self._next_slot = (slot + 1) % self.capacity
+        self._index_offset += len(data)
+        return records
+
+    def _assign(self, key, slot):
+        previous = self._owners.get(slot)
+        if previous is not None and previous != key:
+            del self._slots[previous]
+        old_slot = self._slots.get(key)
+        if old_slot is not None and old_slot != slot:
+            del self._owners[old_slot]
+        self._slots[key] = slot
+        self._owners[slot] = key
+
+    def _ensure_mapped(self, slot, grow=False):
+        """
+        Remap vectors.f32 if slot lies beyond the current mapping. Only a
+        writer (holding the exclusive lock) grows the file; readers map the
+        slots another process has already allocated.
+        """
+        if slot >= self._vectors.shape[0]:
+            self._vectors.flush()
+            slots = self._allocated_slots()
+            if grow:
+                slots = max(slots, self._vectors.shape[0] * 2)
+            self._vectors = self._map(min(slots, self.capacity))
+
+    def get(self, key):
+        with self._locked(fcntl.LOCK_SH):
+            self._catch_up()
+            slot = self._slots.get(key)
+            if slot is None:
+                return None
+            self._ensure_mapped(slot)
+            return np.array(self._vectors[slot])
+
+    def put(self, key, vector):
+        with self._locked(fcntl.LOCK_EX):
+            self._catch_up()
+            if key in self._slots:
+                return
+            slot = self._next_slot
+            self._ensure_mapped(slot, grow=True)
+            if slot in self._owners:
+                self.evictions += 1
+            self._vectors[slot] = vector
+            with open(self._index_path, "ab") as f:
+                f.write(INDEX_RECORD.pack(key, slot))
+            self._catch_up()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def close(self):
+        self._vectors.flush()
+        self._lock_file.close()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of text embeddings keyed by a hash of the embedding
+    version (model@backend) and the normalized text: a bounded in-process
+    LRU in front of an optional DiskVectorStore that persists across
+    restarts. Vectors from one backend are never returned for another,
+    since quantized models embed slightly differently.
+    """
+
+    def __init__(self, version, dim, max_entries=10000, directory=None, disk_capacity=100000):
+        self.version = version
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk = DiskVectorStore(directory, version, dim, disk_capacity) if directory else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text):
+        digest = hashlib.sha256(f"{self.version}\0{normalize_text(text)}".encode("utf-8"))
+        return digest.digest()[:16]
+
+    def get(self, text):
+        """Return the cached vector for text, or None."""
+        key = self.key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            if self._disk is not None:
+                vector = self._disk.get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, text, vector):
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.put(key, vector)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit, miss and eviction counters for both tiers."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "version": self.version,
+                "memory_entries": len(self._memory),
+                "memory_max_entries": self.max_entries,
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_evictions": self.evictions,
+                "disk_evictions": self._disk.evictions if self._disk is not None else 0,
+            }
+
+    def close(self):
+        if self._disk is not None:
+            with self._lock:
+                self._disk.close()
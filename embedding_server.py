@@ -0,0 +1,272 @@
+"""
+A local embedding service shared by several API worker processes.
+
+The server loads the SentenceTransformer model once and answers requests
+over a Unix socket. Requests from all connections go through one
+EmbeddingBatcher, so concurrent workers share forward passes. Vectors are
+returned as raw float32 bytes, which the client reads straight into a
+buffer and wraps with np.frombuffer without copying.
+
+Usage:
+    EMBED_SERVER_SOCKET=/tmp/embed.sock python embedding_server.py
+    EMBED_SERVER_SOCKET=/tmp/embed.sock python database.py    # in each API worker
+
+Each request names the embedding version (model@backend, see
+embedding_versions.py) the client stores vectors under. The server answers
+with an error if it serves a different version, for example because its
+backend failed the accuracy gate and it fell back to torch.
+
+Wire format (all integers little-endian):
+    request:  <I length> + JSON {"version": name, "texts": [...]} or {"op": "stats"}
+    response: <B kind><I a><I b> + payload
+              kind 0: a rows x b dims of float32
+              kind 1: error, a bytes of UTF-8 message
+              kind 2: JSON, a bytes
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from batcher import EmbeddingBatcher
+from embedding_versions import version_name
+
+DEFAULT_SOCKET = os.getenv("EMBED_SERVER_SOCKET") or "/tmp/healthcare-embeddings.sock"
+REQUEST_HEADER = struct.Struct("<I")
+RESPONSE_HEADER = struct.Struct("<BII")
+VECTORS, ERROR, JSON = 0, 1, 2
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Embedding server connection closed")
+        received += count
+    return buffer
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve embeddings of the given version from encode_batch(texts) over a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, path, version, encode_batch, max_batch_size=64, max_wait=0.005):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.version = version
+        self.batcher = EmbeddingBatcher(encode_batch, max_batch_size=max_batch_size, max_wait=max_wait)
+        self.started = time.time()
+        self.requests = 0
+        self.texts = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__(path, _Handler)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "version": self.version,
+                "uptime_seconds": time.time() - self.started,
+                "connections": self.connections,
+                "requests": self.requests,
+                "texts": self.texts,
+            }
+        stats["batcher"] = self.batcher.stats()
+        return stats
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        with server._lock:
+            server.connections += 1
+        try:
+            while True:
+                (length,) = REQUEST_HEADER.unpack(_recv_exactly(self.request, REQUEST_HEADER.size))
+                if length > MAX_REQUEST_BYTES:
+                    self._send(ERROR, f"Request of {length} bytes is too large".encode("utf-8"))
+                    return
+                self._respond(json.loads(bytes(_recv_exactly(self.request, length))))
+        except ConnectionError:
+            # The client closed the connection, possibly after timing out.
+            return
+        finally:
+            with server._lock:
+                server.connections -= 1
+
+    def _respond(self, message):
+        server = self.server
+        if message.get("op") == "stats":
+            self._send(JSON, json.dumps(server.stats()).encode("utf-8"))
+            return
+        if message.get("version") != server.version:
+            self._send(ERROR, f"Server has version {server.version!r}, not {message.get('version')!r}".encode("utf-8"))
+            return
+        texts = message.get("texts") or []
+        try:
+            vectors = np.ascontiguousarray(server.batcher.embed_many(texts), dtype=np.float32)
+        except Exception as e:
+            self._send(ERROR, str(e).encode("utf-8"))
+            return
+        with server._lock:
+            server.requests += 1
+            server.texts += len(texts)
+        rows, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+        self.request.sendall(RESPONSE_HEADER.pack(VECTORS, rows, dim))
+        self.request.sendall(memoryview(vectors).cast("B"))
+
+    def _send(self, kind, payload):
+        self.request.sendall(RESPONSE_HEADER.pack(kind, len(payload), 0) + payload)
+
+
+class EmbeddingServerError(Exception):
+    """The server answered, but could not embed the request."""
+
+
+class EmbeddingClient:
+    """
+    Embeds texts of the given version through an EmbeddingServer, falling
+    back to `fallback(texts)` in this process when no server is listening or
+    it serves another version.
+
+    Each thread keeps its own connection. After the server could not be used
+    it is not tried again for `retry_interval` seconds. A request that times
+    out raises instead: the server is up but busy, and loading a second copy
+    of the model in this process would only slow the machine down further.
+    """
+
+    def __init__(self, path, version, fallback, timeout=30.0, retry_interval=5.0):
+        self.path = path
+        self.version = version
+        self._fallback = fallback
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+        self.connected = False
+        self.remote_batches = 0
+        self.fallback_batches = 0
+        self.connect_failures = 0
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def request(self, message):
+        """
+        Send one request and return an (n, dim) float32 array or a decoded
+        JSON object. A kept connection that the server has closed (because
+        it restarted) is replaced and the request sent once more.
+        """
+        payload = json.dumps(message).encode("utf-8")
+        reused = getattr(self._local, "sock", None) is not None
+        sock = self._connection()
+        try:
+            sock.sendall(REQUEST_HEADER.pack(len(payload)) + payload)
+            kind, a, b = RESPONSE_HEADER.unpack(_recv_exactly(sock, RESPONSE_HEADER.size))
+            body = _recv_exactly(sock, a * b * 4 if kind == VECTORS else a)
+        except ConnectionError:
+            self._drop_connection()
+            if not reused:
+                raise
+            return self.request(message)
+        except OSError:
+            self._drop_connection()
+            raise
+        if kind == ERROR:
+            raise EmbeddingServerError(body.decode("utf-8"))
+        if kind == JSON:
+            return json.loads(bytes(body))
+        return np.frombuffer(body, dtype=np.float32).reshape(a, b)
+
+    def encode_batch(self, texts):
+        texts = list(texts)
+        if time.monotonic() >= self._retry_at:
+            try:
+                vectors = self.request({"version": self.version, "texts": texts})
+                with self._lock:
+                    self.connected = True
+                    self.remote_batches += 1
+                return vectors
+            except (FileNotFoundError, ConnectionRefusedError, EmbeddingServerError) as e:
+                with self._lock:
+                    if self.connected or self.connect_failures == 0:
+                        print(f"Embedding server at {self.path} unavailable, embedding in-process: {e}")
+                    self.connected = False
+                    self.connect_failures += 1
+                    self._retry_at = time.monotonic() + self.retry_interval
+        with self._lock:
+            self.fallback_batches += 1
+        return self._fallback(texts)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "socket": self.path,
+                "connected": self.connected,
+                "remote_batches": self.remote_batches,
+                "fallback_batches": self.fallback_batches,
+                "connect_failures": self.connect_failures,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "pritamdeka/S-PubMedBert-MS-MARCO"))
+    parser.add_argument("--backend", default=os.getenv("EMBEDDING_BACKEND", "torch"),
+                        help="torch, onnx or onnx-int8 (see embedding_backends.py)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBED_THREADS", "0")) or None)
+    parser.add_argument("--max-batch", type=int, default=int(os.getenv("EMBED_MAX_BATCH", "64")))
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("EMBED_MAX_WAIT_MS", "5")))
+    args = parser.parse_args()
+
+    from embedding_backends import load_model
+    started = time.perf_counter()
+    model, report = load_model(args.model, args.backend, args.threads)
+    print(f"Embedding model {args.model} ({report['backend']}) loaded in {time.perf_counter() - started:.1f}s")
+    # Clients ask for the backend they were configured with; if this one
+    # fell back to torch they embed in-process rather than mix the versions.
+    version = version_name(args.model, report["backend"])
+
+    def encode_batch(texts):
+        return model.encode(texts, normalize_embeddings=True, batch_size=min(len(texts), 64))
+
+    server = EmbeddingServer(args.socket, version, encode_batch, args.max_batch, args.max_wait_ms / 1000)
+    print(f"Serving embeddings of {version} on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Which embedding model produced the vectors in MedicalRecords and PastPrompts.
+
+A version names a model and its inference backend, e.g.
+"pritamdeka/S-PubMedBert-MS-MARCO@torch". Both tables have two vector
+slots, A and B (see VectorCodec), and every row records in
+EmbeddingVersion / EmbeddingVersionB which version produced the vector in
+each slot. The EmbeddingSlots table holds one row per slot with the version
+it holds and its status:
+
+  - active:   the slot searches and inserts use
+  - building: being filled for a new version by reembed.py
+  - retired:  the previously active slot, reused by the next re-embedding
+
+Searches only rank vectors of the active version, so vectors from different
+models are never compared. reembed.py fills the inactive slot while the API
+keeps serving the active one, then flips both statuses in one UPDATE. API
+processes notice the flip, load the new model and switch to it between
+requests, using VersionGate to wait for requests still on the old version.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+SLOTS = ("A", "B")
+ACTIVE, BUILDING, RETIRED = "active", "building", "retired"
+
+# Tables with vector columns, and the text columns whose values, joined by
+# spaces, are embedded for each row.
+EMBEDDED_TABLES = {
+    "MedicalRecords": ["Symptom", "Diagnosis"],
+    "PastPrompts": ["Summary"],
+}
+
+
+def version_name(model_name, backend="torch"):
+    return f"{model_name}@{backend}"
+
+
+def parse_version(version):
+    """Split a version name into (model name, backend)."""
+    model_name, _, backend = version.rpartition("@")
+    return (model_name, backend) if model_name else (version, "torch")
+
+
+def other_slot(slot):
+    return "B" if slot == "A" else "A"
+
+
+def read_slots(cursor):
+    """Return {slot: {"version", "dim", "status"}} from EmbeddingSlots."""
+    cursor.execute("SELECT Slot, Version, Dim, Status FROM EmbeddingSlots")
+    return {row[0]: {"version": row[1], "dim": row[2], "status": row[3]} for row in cursor.fetchall()}
+
+
+def active_slot(slots):
+    """Return (slot, info) for the active slot, or None."""
+    for slot, info in slots.items():
+        if info["status"] == ACTIVE:
+            return slot, info
+    return None
+
+
+def set_slot(cursor, slot, version, dim, status):
+    cursor.execute("DELETE FROM EmbeddingSlots WHERE Slot = ?", (slot,))
+    cursor.execute(
+        "INSERT INTO EmbeddingSlots (Slot, Version, Dim, Status, UpdatedAt) VALUES (?, ?, ?, ?, ?)",
+        (slot, version, dim, status, time.strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+def activate(cursor, slot):
+    """Make slot the active one and retire the other, in a single statement."""
+    cursor.execute(
+        f"UPDATE EmbeddingSlots SET Status = CASE WHEN Slot = ? THEN '{ACTIVE}' ELSE '{RETIRED}' END, "
+        "UpdatedAt = ?",
+        (slot, time.strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+def missing_count(cursor, codec, table="MedicalRecords"):
+    """Number of rows of table without a vector of codec.version in codec's slot."""
+    cursor.execute(
+        f"SELECT COUNT(*) FROM {table} "
+        f"WHERE {codec.version_column} IS NULL OR {codec.version_column} <> ?",
+        (codec.version,),
+    )
+    return cursor.fetchall()[0][0]
+
+
+class VersionGate:
+    """
+    A readers-writer lock around the embedding version. Requests that embed
+    text and then read or write vectors hold it for reading, so both steps
+    use the same model and columns. A switch waits for those requests to
+    finish and holds new ones back until it is done. Readers may nest.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._switching = False
+        self._local = threading.local()
+
+    @property
+    def held(self):
+        return getattr(self._local, "depth", 0) > 0
+
+    @contextmanager
+    def reading(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            with self._condition:
+                while self._switching:
+                    self._condition.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._condition:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def switching(self):
+        with self._condition:
+            while self._switching:
+                self._condition.wait()
+            self._switching = True
+            while self._readers:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._switching = False
+                self._condition.notify_all()
@@ -0,0 +1,90 @@
+import threading
+
+
+def make_token_counter(model="gpt-4"):
+    """
+    Return a function counting the tokens in a string. Uses tiktoken when it
+    is installed and falls back to the usual estimate of four characters per token.
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model)
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        return lambda text: max(1, len(text) // 4)
+
+
+# Tokens the chat format adds around each message's content.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ConversationHistory:
+    """
+    A conversation history kept within a token budget.
+
+    The most recent turns are sent verbatim. When they exceed `budget`
+    tokens, the oldest turns are folded into a rolling summary with
+    `summarize(previous_summary, turns)`, and the new summary is handed to
+    `persist(summary)` so a later session can resume from it.
+    """
+
+    def __init__(self, budget, summarize, count_tokens, persist=None, summary=""):
+        self.budget = budget
+        self._summarize = summarize
+        self._count = count_tokens
+        self._persist = persist
+        self._lock = threading.Lock()
+        self.summary = summary
+        self.turns = []
+        # Tokens the unbounded history would have contained, for reporting.
+        self._raw_tokens = self._count(summary) if summary else 0
+        self.last_saved = 0
+        self.total_saved = 0
+
+    def _tokens(self, message):
+        return self._count(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+
+    def messages(self):
+        """The history to send before the next user message."""
+        with self._lock:
+            prefix = [self._summary_message()] if self.summary else []
+            return prefix + list(self.turns)
+
+    def add_turn(self, user_message, reply):
+        """Record one exchange, summarizing older turns if over budget."""
+        turn = [{"role": "user", "content": user_message}, {"role": "assistant", "content": reply}]
+        with self._lock:
+            self.turns.extend(turn)
+            self._raw_tokens += sum(self._tokens(m) for m in turn)
+            folded = []
+            while len(self.turns) > 2 and self._used() > self.budget:
+                folded.extend(self.turns[:2])
+                del self.turns[:2]
+            if folded:
+                self.summary = self._summarize(self.summary, folded)
+            sent = self._used()
+            self.last_saved = max(0, self._raw_tokens - sent)
+            self.total_saved += self.last_saved
+            summary = self.summary
+        if folded and self._persist is not None:
+            self._persist(summary)
+
+    def _used(self):
+        total = sum(self._tokens(m) for m in self.turns)
+        if self.summary:
+            total += self._tokens(self._summary_message())
+        return total
+
+    def used_tokens(self):
+        with self._lock:
+            return self._used()
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+            self._raw_tokens = 0
+            self.last_saved = 0
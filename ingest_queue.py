@@ -0,0 +1,261 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised when the number of pending jobs has reached the configured bound."""
+
+
+class IngestQueue:
+    """
+    A durable background job queue backed by a local SQLite file.
+
+    `enqueue(payload)` stores the JSON payload and returns a job ID straight
+    away. A pool of worker threads claims up to `batch_size` queued jobs at a
+    time and passes their payloads to `handler(payloads)`. If the handler
+    raises, the batch's jobs are run again one at a time, so that one bad job
+    cannot fail the others; each job that still fails is retried with
+    exponential backoff until `max_attempts` is reached. Finished jobs are
+    kept for `retention` seconds so their status can still be polled.
+
+    Several processes may share one queue file. A claimed job is leased to
+    its process for `lease` seconds, and only jobs whose lease has expired
+    (because the process holding them died) are claimed again, so a process
+    starting up never takes over jobs another live process is running.
+    """
+
+    def __init__(self, path, handler, workers=2, batch_size=32, max_pending=10000,
+                 max_attempts=5, backoff=1.0, poll_interval=1.0, retention=86400.0, lease=300.0):
+        self.path = path
+        self._handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._stopping = False
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    next_attempt REAL NOT NULL,
+                    owner TEXT,
+                    lease_expires REAL
+                )
+            """)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, definition in (("owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, next_attempt)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=FULL")
+        return _Transaction(db)
+
+    def start(self):
+        """Start the worker threads, if they are not running yet."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def enqueue(self, payload):
+        """Durably store a job and return its ID. Raises QueueFull under backpressure."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            with self._connect() as db:
+                pending = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFull(f"Ingestion queue is full ({pending} pending jobs)")
+                db.execute(
+                    "INSERT INTO jobs (id, payload, status, created, updated, next_attempt) VALUES (?, ?, 'queued', ?, ?, ?)",
+                    (job_id, json.dumps(payload), now, now, now),
+                )
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        """Return the job's status dict, or None if the ID is unknown."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT id, status, attempts, error, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "status", "attempts", "error", "created", "updated")
+        return dict(zip(keys, row))
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            with self._connect() as db:
+                # A job whose lease expired on its last attempt most likely
+                # crashed its process; give up on it instead of running it again.
+                expired = db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Lease expired on the last attempt', updated = ? "
+                    "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?) AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                ).rowcount
+                rows = db.execute(
+                    "SELECT id, payload FROM jobs "
+                    "WHERE (status = 'queued' AND next_attempt <= ?) "
+                    "OR (status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)) "
+                    "ORDER BY created LIMIT ?",
+                    (now, now, self.batch_size),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_expires = ?, "
+                    "updated = ? WHERE id = ?",
+                    [(self.owner, now + self.lease, now, job_id) for job_id, _ in rows],
+                )
+            self.failed += expired
+        return rows
+
+    def _renew(self, ids):
+        """Extend the lease on jobs this process is still running."""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                [(now + self.lease, job_id, self.owner) for job_id in ids],
+            )
+
+    def _run(self):
+        while not self._stopping:
+            jobs = self._claim()
+            if not jobs:
+                self._prune()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._process(jobs)
+
+    def _process(self, jobs):
+        """Run a claimed batch, falling back to one job at a time if it fails."""
+        ids = [job_id for job_id, _ in jobs]
+        payloads = [json.loads(payload) for _, payload in jobs]
+        try:
+            self._handler(payloads)
+        except Exception as e:
+            if len(jobs) == 1:
+                print(f"Ingestion job {ids[0]} failed: {e}")
+                self._fail(ids, str(e))
+                return
+            print(f"Ingestion batch of {len(jobs)} jobs failed ({e}), running them one at a time")
+            self._renew(ids)
+            for job_id, payload in zip(ids, payloads):
+                try:
+                    self._handler([payload])
+                except Exception as e:
+                    print(f"Ingestion job {job_id} failed: {e}")
+                    self._fail([job_id], str(e))
+                else:
+                    self._done([job_id])
+        else:
+            self._done(ids)
+
+    def _done(self, ids):
+        with self._connect() as db:
+            db.executemany(
+                "UPDATE jobs SET status = 'done', error = NULL, updated = ? WHERE id = ? AND owner = ?",
+                [(time.time(), job_id, self.owner) for job_id in ids],
+            )
+        with self._lock:
+            self.completed += len(ids)
+
+    def _prune(self):
+        with self._connect() as db:
+            db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                (time.time() - self.retention,),
+            )
+
+    def _fail(self, ids, error):
+        now = time.time()
+        with self._connect() as db:
+            for job_id in ids:
+                row = db.execute("SELECT attempts FROM jobs WHERE id = ? AND owner = ?", (job_id, self.owner)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0]
+                if attempts >= self.max_attempts:
+                    db.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                        (error, now, job_id),
+                    )
+                    with self._lock:
+                        self.failed += 1
+                else:
+                    delay = self.backoff * 2 ** (attempts - 1)
+                    db.execute(
+                        "UPDATE jobs SET status = 'queued', error = ?, updated = ?, next_attempt = ? WHERE id = ?",
+                        (error, now, now + delay, job_id),
+                    )
+                    with self._lock:
+                        self.retried += 1
+
+    def stats(self):
+        with self._connect() as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        with self._lock:
+            return {
+                "queued": counts.get("queued", 0),
+                "running": counts.get("running", 0),
+                "done": counts.get("done", 0),
+                "failed": counts.get("failed", 0),
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "completed_since_start": self.completed,
+                "retried_since_start": self.retried,
+                "failed_since_start": self.failed,
+            }
+
+
+class _Transaction:
+    """Run a block in one SQLite transaction and close the connection afterwards."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.db.close()
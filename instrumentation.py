@@ -0,0 +1,215 @@
+"""
+Per-request stage timing for the Flask API.
+
+Each request gets a RequestTimer. Code on the hot path wraps its work in
+`timed(stage)`, and database connections are wrapped in
+InstrumentedConnection so that every cursor execute and fetch is timed and
+fetched rows are counted. When the request finishes the stage totals are
+sent back in a Server-Timing header and recorded in the histograms below,
+which database.py exposes at /api/metrics.
+
+Work done outside a request (background workers, start-up) is not timed.
+"""
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from metrics import CounterFamily, HistogramFamily
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+SIZE_BUCKETS = [100, 1000, 10000, 100000, 1000000, 10000000]
+ROW_BUCKETS = [0, 1, 10, 100, 1000, 10000, 100000]
+
+request_duration = HistogramFamily(
+    "api_request_duration_seconds", "Time to produce a response, by route.",
+    LATENCY_BUCKETS, ("route", "method", "status"))
+stage_duration = HistogramFamily(
+    "api_stage_duration_seconds", "Time spent in each stage of a request, by route.",
+    LATENCY_BUCKETS, ("route", "stage"))
+response_size = HistogramFamily(
+    "api_response_size_bytes", "Response body size, for responses with a known length.",
+    SIZE_BUCKETS, ("route",))
+rows_fetched = HistogramFamily(
+    "api_rows_fetched", "Database rows fetched per request.",
+    ROW_BUCKETS, ("route",))
+requests_total = CounterFamily(
+    "api_requests_total", "Requests served, by route and status.", ("route", "method", "status"))
+
+FAMILIES = [request_duration, stage_duration, response_size, rows_fetched, requests_total]
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.rows = 0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total):
+        parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current_timer():
+    return g.get("request_timer") if has_request_context() else None
+
+
+@contextmanager
+def timed(stage):
+    """Add the duration of the block to the current request's stage total."""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, time.perf_counter() - started)
+
+
+class InstrumentedCursor:
+    """A DB-API cursor whose execute and fetch calls are timed."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        with timed("db_execute"):
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with timed("db_execute"):
+            return self._cursor.executemany(*args, **kwargs)
+
+    def _fetch(self, method, *args):
+        with timed("db_fetch"):
+            result = getattr(self._cursor, method)(*args)
+        timer = current_timer()
+        if timer is not None and result is not None:
+            timer.rows += len(result) if method != "fetchone" else 1
+        return result
+
+    def fetchone(self):
+        return self._fetch("fetchone")
+
+    def fetchmany(self, *args):
+        return self._fetch("fetchmany", *args)
+
+    def fetchall(self):
+        return self._fetch("fetchall")
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Wraps a DB-API connection so its cursors are InstrumentedCursors."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return InstrumentedCursor(self._connection.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class SamplingProfiler:
+    """
+    Profiles a random `rate` fraction of requests with cProfile and keeps
+    the combined statistics. Only one request is profiled at a time.
+    """
+
+    def __init__(self, rate=0.0):
+        self.rate = rate
+        self.profiled = 0
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = None
+
+    def start(self):
+        if self.rate <= 0 or random.random() >= self.rate or not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile):
+        profile.disable()
+        self._busy.release()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+
+    def report(self, sort="cumulative", limit=30):
+        with self._lock:
+            if self._stats is None:
+                return "No requests profiled yet.\n"
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+        return f"{self.profiled} requests profiled\n" + out.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self._stats = None
+            self.profiled = 0
+
+
+def install(app, profiler=None):
+    """Time every request to app and record its metrics when the response closes."""
+
+    @app.before_request
+    def start_timer():
+        g.request_timer = RequestTimer()
+        g.profile = profiler.start() if profiler is not None else None
+
+    @app.after_request
+    def finish_timer(response):
+        timer = g.get("request_timer")
+        if timer is None:
+            return response
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profiler.stop(profile)
+        elapsed = time.perf_counter() - timer.started
+        response.headers["Server-Timing"] = timer.server_timing(elapsed)
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        method, status = request.method, str(response.status_code)
+        size = None if response.is_streamed else response.content_length
+
+        def record():
+            # Streamed bodies are produced after this hook, so totals are
+            # taken when the response is closed.
+            total = time.perf_counter() - timer.started
+            request_duration.observe(total, route, method, status)
+            requests_total.inc(route, method, status)
+            for stage, seconds in timer.stages.items():
+                stage_duration.observe(seconds, route, stage)
+            rows_fetched.observe(timer.rows, route)
+            if size is not None:
+                response_size.observe(size, route)
+
+        response.call_on_close(record)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # after_request is skipped when a request fails with an unhandled error.
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profiler.stop(profile)
@@ -0,0 +1,83 @@
+"""
+Pluggable chat-completion clients. Every client exposes
+`stream(messages, max_tokens, temperature)`, which yields the completion as
+text fragments, and `complete(...)`, which returns it as one string.
+
+LLM_BACKEND selects the client returned by create_client(): "azure" (the
+default) calls Azure OpenAI; "stub" is a local stand-in with configurable
+latency for tests and benchmarks.
+"""
+import os
+import time
+
+AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "https://e0957-m7dhe0bf-eastus2.cognitiveservices.azure.com/")
+DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4")
+API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+
+
+class ChatClient:
+    def stream(self, messages, max_tokens=512, temperature=0.7):
+        raise NotImplementedError
+
+    def complete(self, messages, max_tokens=512, temperature=0.7):
+        return "".join(self.stream(messages, max_tokens, temperature)).strip()
+
+
+class AzureChatClient(ChatClient):
+    """Streams completions from an Azure OpenAI deployment."""
+
+    def __init__(self, api_key=None, endpoint=AZURE_OPENAI_ENDPOINT,
+                 deployment=DEPLOYMENT_NAME, api_version=API_VERSION):
+        import openai
+        self.deployment = deployment
+        self._client = openai.AzureOpenAI(
+            api_key=api_key or os.getenv("openAIkey"),
+            api_version=api_version,
+            azure_endpoint=endpoint,
+        )
+
+    def stream(self, messages, max_tokens=512, temperature=0.7):
+        response = self._client.chat.completions.create(
+            model=self.deployment,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubChatClient(ChatClient):
+    """
+    A local stand-in for the LLM. Replies with a fixed sentence that echoes
+    the start of the last message, one word at a time, after
+    `first_token_delay` seconds and with `token_delay` seconds between words.
+    """
+
+    def __init__(self, first_token_delay=0.0, token_delay=0.0):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+
+    def stream(self, messages, max_tokens=512, temperature=0.7):
+        last = messages[-1]["content"] if messages else ""
+        words = ("This is a local stand-in response to: " + " ".join(last.split()[:20])).split()
+        time.sleep(self.first_token_delay)
+        for i, word in enumerate(words[:max_tokens]):
+            if i:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+
+def create_client(backend=None):
+    """Build the client selected by LLM_BACKEND (or the backend argument)."""
+    backend = backend or os.getenv("LLM_BACKEND", "azure")
+    if backend == "azure":
+        return AzureChatClient()
+    if backend == "stub":
+        return StubChatClient(
+            first_token_delay=float(os.getenv("LLM_STUB_FIRST_TOKEN_MS", "0")) / 1000,
+            token_delay=float(os.getenv("LLM_STUB_TOKEN_MS", "0")) / 1000,
+        )
+    raise ValueError(f"Unknown LLM_BACKEND {backend!r}, expected 'azure' or 'stub'")
@@ -0,0 +1,168 @@
+"""
+A local stand-in for the subset of the IRIS DB-API this project uses, built
+on SQLite and NumPy, so the API can run and be benchmarked without an IRIS
+instance. Select it with IRIS_BACKEND=local; the database file is
+LOCAL_IRIS_PATH (default .local_iris.db).
+
+Supported IRIS syntax:
+  - SELECT TOP ? / SELECT TOP n
+  - VECTOR(type, n) columns and TO_VECTOR(?, type) parameters
+  - VECTOR_DOT_PRODUCT(a, b), computed with NumPy
+  - the implicit ID row identifier
+  - ALTER TABLE ... ALTER COLUMN a RENAME b
+
+Vectors are stored as binary arrays of their element type, so ranking a
+user's records costs one NumPy dot product per row rather than parsing
+text. They are returned as comma-separated text, as IRIS returns them.
+"""
+import os
+import re
+import sqlite3
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_PATH = os.getenv("LOCAL_IRIS_PATH", ".local_iris.db")
+
+_TOP = re.compile(r"^(\s*SELECT\s+)TOP\s+(\?|\d+)\s+", re.IGNORECASE)
+_TO_VECTOR = re.compile(r"TO_VECTOR\(\s*\?\s*(?:,\s*(\w+)\s*)?\)", re.IGNORECASE)
+_VECTOR_TYPE = re.compile(r"\bVECTOR\(\s*\w+\s*,\s*\d+\s*\)", re.IGNORECASE)
+_ID = re.compile(r"\bID\b")
+_RENAME_COLUMN = re.compile(r"ALTER\s+TABLE\s+(\w+)\s+ALTER\s+COLUMN\s+(\w+)\s+RENAME\s+(\w+)", re.IGNORECASE)
+
+# A stored vector is a one-byte element type tag followed by the raw array.
+ELEMENT_TYPES = {
+    "DOUBLE": (b"d", np.float64),
+    "DECIMAL": (b"d", np.float64),
+    "FLOAT": (b"f", np.float32),
+    "INT": (b"i", np.int32),
+    "INTEGER": (b"i", np.int32),
+}
+_DTYPES = {tag: dtype for tag, dtype in ELEMENT_TYPES.values()}
+
+
+def _parse_text(value):
+    return np.array(value.strip("[] ").split(","), dtype=np.float64)
+
+
+def _to_vector(value, element_type="DOUBLE"):
+    if value is None:
+        return None
+    tag, dtype = ELEMENT_TYPES[element_type.upper()]
+    values = _parse_text(value)
+    return tag + values.astype(dtype).tobytes()
+
+
+def _from_vector(value):
+    if isinstance(value, str):
+        # Vectors inserted with a plain ? rather than TO_VECTOR(?) are kept as text.
+        return _parse_text(value)
+    return np.frombuffer(value, dtype=_DTYPES[value[:1]], offset=1)
+
+
+def _vector_dot_product(a, b):
+    if a is None or b is None:
+        return None
+    return float(np.dot(_from_vector(a), _from_vector(b)))
+
+
+def _vector_to_text(value):
+    if value[:1] not in _DTYPES:
+        return value.decode("utf-8")
+    return ",".join(map(str, _from_vector(value).tolist()))
+
+
+# Columns declared VECTOR come back as text. TIMESTAMP columns are returned
+# as stored, rather than through sqlite3's default datetime converter.
+sqlite3.register_converter("VECTOR", _vector_to_text)
+sqlite3.register_converter("TIMESTAMP", lambda value: value.decode("utf-8"))
+
+
+@lru_cache(maxsize=1024)
+def _translate_sql(sql):
+    """Return (sqlite sql, how TOP is bound) for an IRIS statement."""
+    top = None
+    match = _TOP.match(sql)
+    if match:
+        top = match.group(2)
+        sql = sql[:match.start()] + match.group(1) + sql[match.end():]
+        sql = sql.rstrip().rstrip(";") + " LIMIT ?"
+    sql = _TO_VECTOR.sub(lambda m: f"TO_VECTOR(?, '{(m.group(1) or 'DOUBLE').upper()}')", sql)
+    sql = _VECTOR_TYPE.sub("VECTOR", sql)
+    sql = _ID.sub("rowid", sql)
+    sql = _RENAME_COLUMN.sub(r"ALTER TABLE \1 RENAME COLUMN \2 TO \3", sql)
+    return sql, top
+
+
+def translate(sql, params=()):
+    """Translate one IRIS statement and its parameters to SQLite."""
+    sql, top = _translate_sql(sql)
+    params = list(params)
+    if top == "?":
+        params.append(params.pop(0))
+    elif top is not None:
+        params.append(int(top))
+    return sql, params
+
+
+class Cursor:
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(*translate(sql, params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        translated, top = _translate_sql(sql)
+        if top is not None:
+            raise NotImplementedError("executemany does not support SELECT TOP")
+        self._cursor.executemany(translated, seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    def __init__(self, path=DEFAULT_PATH):
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                           detect_types=sqlite3.PARSE_DECLTYPES)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.create_function("TO_VECTOR", 2, _to_vector, deterministic=True)
+        self._connection.create_function("VECTOR_DOT_PRODUCT", 2, _vector_dot_product, deterministic=True)
+
+    def cursor(self):
+        return Cursor(self._connection)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+def connect(connection_string=None, username=None, password=None, path=None):
+    """Open a connection; the IRIS connection arguments are accepted and ignored."""
+    return Connection(path or DEFAULT_PATH)
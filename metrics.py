@@ -0,0 +1,119 @@
+import bisect
+import threading
+
+
+class Histogram:
+    """
+    A thread-safe cumulative histogram with fixed upper bucket bounds.
+    Observations above the last bound land in the implicit +Inf bucket.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return bucket counts keyed by upper bound, plus count and sum."""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        buckets = {str(bound): n for bound, n in zip(self.bounds, counts)}
+        buckets["+Inf"] = counts[-1]
+        return {
+            "buckets": buckets,
+            "count": count,
+            "sum": total,
+            "avg": total / count if count else 0.0,
+        }
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class HistogramFamily:
+    """
+    Histograms sharing a metric name and bucket bounds, one per combination
+    of label values, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, name, help, bounds, label_names=()):
+        self.name = name
+        self.help = help
+        self.bounds = sorted(bounds)
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def observe(self, value, *label_values):
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, Histogram(self.bounds))
+        child.observe(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for label_values, histogram in children:
+            snapshot = histogram.snapshot()
+            cumulative = 0
+            for bound, count in snapshot["buckets"].items():
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, ("le", bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {snapshot['sum']}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+
+class CounterFamily:
+    """Monotonic counters, one per combination of label values."""
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+def render_prometheus(families, gauges=()):
+    """
+    Render metric families plus (name, help, value) gauges in the
+    Prometheus text exposition format.
+    """
+    lines = []
+    for family in families:
+        lines.extend(family.render())
+    for name, help, value in gauges:
+        lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,71 @@
+"""
+Convert existing MedicalRecords embeddings to another storage mode.
+
+Adds the target mode's columns, then copies every row's vector from the
+source mode's columns (by default those of the current VECTOR_STORAGE) into
+them in keyset-paginated batches, committing after each batch. Rows that
+already have a value in the target column are skipped, so the migration
+can be stopped and re-run safely. Once it completes, start the API with
+VECTOR_STORAGE set to the target mode. The source columns are left in
+place and can be dropped afterwards.
+
+Usage:
+    python migrate_vectors.py --to float
+    python migrate_vectors.py --from float --to int8 --batch-size 1000
+"""
+import argparse
+import time
+
+from database import EMBEDDING_DIM, VECTOR_STORAGE, get_pool
+from migrations import execute_ddl
+from vector_codec import VectorCodec
+
+
+def add_columns(target):
+    for definition in target.column_definitions:
+        execute_ddl(f"ALTER TABLE MedicalRecords ADD {definition}", idempotent=True)
+
+
+def migrate(source, target, batch_size):
+    select = f"""
+        SELECT TOP ? ID, {source.select_columns}
+        FROM MedicalRecords
+        WHERE ID > ? AND {source.column} IS NOT NULL AND {target.column} IS NULL
+        ORDER BY ID
+    """
+    update = f"UPDATE MedicalRecords SET {target.update_assignments} WHERE ID = ?"
+
+    last_id, migrated, started = 0, 0, time.perf_counter()
+    while True:
+        with get_pool().cursor() as cursor:
+            cursor.execute(select, (batch_size, last_id))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            params = [(*target.encode(source.decode(*row[1:])), row[0]) for row in rows]
+            cursor.executemany(update, params)
+        last_id = rows[-1][0]
+        migrated += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"Migrated {migrated} rows (last ID {last_id}, {migrated / elapsed:.0f} rows/s)")
+    print(f"Done: {migrated} rows converted to {target.mode} storage.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="source", choices=VectorCodec.MODES, default=VECTOR_STORAGE,
+                        help="Mode the vectors are stored in now (default VECTOR_STORAGE)")
+    parser.add_argument("--to", required=True, choices=VectorCodec.MODES)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    if args.source == args.to:
+        parser.error(f"Vectors are already stored as {args.to}")
+
+    source = VectorCodec(args.source, EMBEDDING_DIM)
+    target = VectorCodec(args.to, EMBEDDING_DIM)
+    add_columns(target)
+    migrate(source, target, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Versioned schema migrations for the IRIS tables.
+
+Each migration has a version number and is applied at most once; applied
+versions are recorded in the SchemaMigrations table. Every step is written
+to be safe to re-run, so a migration interrupted part-way through can simply
+be started again.
+
+Usage:
+    python migrations.py                    # apply pending migrations
+    python migrations.py --status           # list applied and pending versions
+    python migrations.py --timings 129      # time the query endpoints' SQL for
+                                            # user 129 before and after migrating
+"""
+import argparse
+import time
+
+import database
+from database import get_pool
+from embedding_versions import ACTIVE, read_slots, set_slot
+from validation import parse_datetime
+from vector_codec import VectorCodec
+
+TABLES = ["MedicalRecords", "Vitals", "Activity", "PastPrompts", "Diet"]
+BACKFILL_BATCH_SIZE = 1000
+
+
+def column_names(table):
+    with get_pool().cursor() as cursor:
+        cursor.execute(f"SELECT TOP ? * FROM {table}", (0,))
+        return [column[0] for column in cursor.description]
+
+
+# Errors meaning a DDL statement's effect is already in place: the table,
+# column or index exists, or for DROP, is already gone. IRIS reports them by
+# SQLCODE (-201 table, -306 column, -324 index exists; -29 column, -30 table,
+# -315 index not found), the local SQLite stand-in in words.
+EXISTS_ERRORS = ("already exists", "already defined", "duplicate column", "not unique", "<-201>", "<-306>", "<-324>")
+MISSING_ERRORS = ("no such", "does not exist", "not found", "<-29>", "<-30>", "<-315>")
+
+
+def already_applied(sql, error):
+    message = str(error).lower()
+    patterns = MISSING_ERRORS if "DROP " in sql.upper() else EXISTS_ERRORS
+    return any(pattern in message for pattern in patterns)
+
+
+def execute_ddl(sql, idempotent=False):
+    """
+    Run one DDL statement in its own transaction. With idempotent=True, an
+    error saying the statement's effect is already in place is reported and
+    skipped, so a migration can be re-run; every other error is raised.
+    """
+    try:
+        with get_pool().cursor() as cursor:
+            cursor.execute(sql)
+        print(f"  {sql}")
+    except Exception as e:
+        if not (idempotent and already_applied(sql, e)):
+            raise
+        print(f"  {sql} skipped: {e}")
+
+
+###############################################################################
+# Migrations
+###############################################################################
+
+def create_tables():
+    """Create the five application tables if they do not exist."""
+    for table, definition in database.table_definitions().items():
+        execute_ddl(f"CREATE TABLE {table} {definition}", idempotent=True)
+
+
+def backfill_timestamps(table, source="Datetime", batch_size=BACKFILL_BATCH_SIZE):
+    """Copy every VARCHAR source value into DatetimeTS, one ID range per transaction."""
+    with get_pool().cursor() as cursor:
+        cursor.execute(f"SELECT MAX(ID) FROM {table}")
+        max_id = cursor.fetchall()[0][0] or 0
+
+    converted, unparsable = 0, 0
+    for start in range(0, max_id, batch_size):
+        with get_pool().cursor() as cursor:
+            cursor.execute(
+                f"SELECT ID, {source} FROM {table} WHERE ID > ? AND ID <= ? AND DatetimeTS IS NULL",
+                (start, start + batch_size),
+            )
+            updates = []
+            for row_id, value in cursor.fetchall():
+                parsed = parse_datetime(value)
+                if parsed is None:
+                    unparsable += 1
+                    continue
+                updates.append((parsed.strftime("%Y-%m-%d %H:%M:%S"), row_id))
+            if updates:
+                cursor.executemany(f"UPDATE {table} SET DatetimeTS = ? WHERE ID = ?", updates)
+        converted += len(updates)
+    print(f"  {table}: converted {converted} rows, {unparsable} unparsable values left NULL")
+
+
+def convert_datetime_to_timestamp():
+    """
+    Replace each table's VARCHAR Datetime with a TIMESTAMP column.
+    A new DatetimeTS column is backfilled in batches while the old column
+    keeps serving traffic, then the columns are swapped by renaming. Rows
+    written during the backfill are caught up from the renamed old column,
+    so only inserts landing between the two renames can fail.
+    """
+    for table in TABLES:
+        columns = column_names(table)
+        if "DatetimeText" in columns and "Datetime" in columns:
+            execute_ddl(f"ALTER TABLE {table} DROP COLUMN DatetimeText")
+            continue
+        if "DatetimeTS" not in columns:
+            if "DatetimeText" in columns:
+                continue
+            execute_ddl(f"ALTER TABLE {table} ADD DatetimeTS TIMESTAMP")
+            columns.append("DatetimeTS")
+        if "Datetime" in columns:
+            backfill_timestamps(table)
+            execute_ddl(f"ALTER TABLE {table} ALTER COLUMN Datetime RENAME DatetimeText")
+        backfill_timestamps(table, source="DatetimeText")
+        execute_ddl(f"ALTER TABLE {table} ALTER COLUMN DatetimeTS RENAME Datetime")
+        execute_ddl(f"ALTER TABLE {table} DROP COLUMN DatetimeText")
+
+
+def add_user_datetime_indexes():
+    """Add a composite (User_ID, Datetime) index to every table."""
+    for table in TABLES:
+        execute_ddl(f"CREATE INDEX {table}UserDatetime ON {table} (User_ID, Datetime)", idempotent=True)
+
+
+def create_bulk_load_checkpoints():
+    """Track how far bulk_load.py has got through each input file."""
+    execute_ddl(
+        "CREATE TABLE BulkLoadCheckpoints (Source VARCHAR(1000), TableName VARCHAR(50), "
+        "Records INT, Inserted INT, Rejected INT, UpdatedAt TIMESTAMP)",
+        idempotent=True,
+    )
+
+
+def add_embedding_versions():
+    """
+    Record which model produced each MedicalRecords vector. Existing vectors
+    are labelled with the configured EMBEDDING_MODEL and EMBEDDING_BACKEND,
+    which become the active version in slot A of EmbeddingSlots.
+    """
+    execute_ddl("ALTER TABLE MedicalRecords ADD EmbeddingVersion VARCHAR(250)", idempotent=True)
+    execute_ddl(
+        "CREATE TABLE EmbeddingSlots (Slot VARCHAR(1), Version VARCHAR(250), Dim INT, "
+        "Status VARCHAR(20), UpdatedAt TIMESTAMP)",
+        idempotent=True,
+    )
+    with get_pool().cursor() as cursor:
+        cursor.execute("SELECT MAX(ID) FROM MedicalRecords")
+        max_id = cursor.fetchall()[0][0] or 0
+    for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+        with get_pool().cursor() as cursor:
+            cursor.execute(
+                "UPDATE MedicalRecords SET EmbeddingVersion = ? WHERE ID > ? AND ID <= ? "
+                f"AND EmbeddingVersion IS NULL AND {database.codec.column} IS NOT NULL",
+                (database.EMBEDDING_VERSION, start, start + BACKFILL_BATCH_SIZE),
+            )
+    with get_pool().cursor() as cursor:
+        if not read_slots(cursor):
+            set_slot(cursor, "A", database.EMBEDDING_VERSION, database.EMBEDDING_DIM, ACTIVE)
+    print(f"  Existing embeddings labelled {database.EMBEDDING_VERSION}")
+
+
+def add_prompt_embeddings():
+    """
+    Add vector columns to PastPrompts for every slot in EmbeddingSlots. New
+    prompts are embedded as they are inserted; run `python reembed.py` to
+    embed the existing ones.
+    """
+    with get_pool().cursor() as cursor:
+        slots = read_slots(cursor)
+    for slot, info in sorted(slots.items()):
+        for definition in VectorCodec(database.VECTOR_STORAGE, info["dim"], slot).column_definitions:
+            execute_ddl(f"ALTER TABLE PastPrompts ADD {definition}", idempotent=True)
+
+
+MIGRATIONS = [
+    (1, "create tables", create_tables),
+    (2, "convert Datetime to TIMESTAMP", convert_datetime_to_timestamp),
+    (3, "index (User_ID, Datetime)", add_user_datetime_indexes),
+    (4, "bulk load checkpoints", create_bulk_load_checkpoints),
+    (5, "embedding versions", add_embedding_versions),
+    (6, "past prompt embeddings", add_prompt_embeddings),
+]
+
+
+###############################################################################
+# Runner
+###############################################################################
+
+def applied_versions():
+    with get_pool().cursor() as cursor:
+        try:
+            cursor.execute("SELECT Version FROM SchemaMigrations")
+            return {row[0] for row in cursor.fetchall()}
+        except Exception:
+            pass
+    # The version table itself is created on first use.
+    execute_ddl("CREATE TABLE SchemaMigrations (Version INT, Name VARCHAR(200), AppliedAt TIMESTAMP)")
+    return set()
+
+
+def migrate(target=None):
+    """Apply pending migrations in order, up to and including target."""
+    done = applied_versions()
+    for version, name, apply in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        print(f"Applying migration {version}: {name}")
+        started = time.perf_counter()
+        apply()
+        with get_pool().cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO SchemaMigrations (Version, Name, AppliedAt) VALUES (?, ?, ?)",
+                (version, name, time.strftime('%Y-%m-%d %H:%M:%S')),
+            )
+        print(f"Migration {version} applied in {time.perf_counter() - started:.2f}s")
+
+
+def endpoint_timings(user, repeat=5):
+    """Median latency of the SQL behind each per-user query endpoint."""
+    queries = {}
+    for table in database.TABLE_COLUMNS:
+        sql, params, _, _ = database.build_user_query(table, {"user": user})
+        queries[f"{table} (all)"] = (sql, params)
+        sql, params, _, _ = database.build_user_query(table, {"user": user, "from": "2025-01-01 00:00:00"})
+        queries[f"{table} (range)"] = (sql, params)
+
+    timings = {}
+    for label, (sql, params) in queries.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            with get_pool().cursor() as cursor:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            samples.append(time.perf_counter() - started)
+        timings[label] = sorted(samples)[len(samples) // 2]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Show applied and pending migrations")
+    parser.add_argument("--target", type=int, help="Apply migrations up to this version")
+    parser.add_argument("--timings", metavar="USER", help="Time the query endpoints for USER before and after")
+    args = parser.parse_args()
+
+    if args.status:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>3}  {'applied' if version in done else 'pending':<8} {name}")
+        return
+
+    before = endpoint_timings(args.timings) if args.timings else None
+    migrate(args.target)
+    if before is not None:
+        after = endpoint_timings(args.timings)
+        print(f"{'query':<26}{'before ms':>12}{'after ms':>12}")
+        for label, seconds in before.items():
+            print(f"{label:<26}{seconds * 1000:>12.2f}{after[label] * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
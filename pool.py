@@ -0,0 +1,215 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of DB-API connections.
+
+    Connections are created lazily up to max_size by calling `connect()`.
+    Idle connections are health-checked before being handed out, and broken
+    connections are replaced, retrying with exponential backoff.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0,
+                 health_check_interval=30.0, max_retries=5,
+                 backoff=0.5, max_backoff=10.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []  # list of (conn, last_used) pairs
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._connect_failures = 0
+        self._health_check_failures = 0
+
+        for _ in range(min_size):
+            conn = self._open()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _open(self):
+        """Open a new connection, retrying with exponential backoff."""
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._connect()
+            except Exception as e:
+                with self._lock:
+                    self._connect_failures += 1
+                if attempt == self.max_retries:
+                    raise
+                print(f"Database connection failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Check out a connection, blocking for up to `timeout` seconds."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    conn, last_used = None, None
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._available.wait(remaining)
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        try:
+            if conn is None:
+                conn = self._open()
+            elif time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(conn):
+                with self._lock:
+                    self._health_check_failures += 1
+                    self._reconnects += 1
+                self._close_quietly(conn)
+                conn = self._open()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._in_use -= 1
+                self._available.notify()
+            raise
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return a connection to the pool, discarding it if it is broken."""
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._lock:
+            self._in_use -= 1
+            if broken or self._closed:
+                self._size -= 1
+                if broken:
+                    self._reconnects += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+        if broken or self._closed:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a `with` block."""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            # The error may have come from the statement or from the link
+            # itself; only keep the connection if it still answers.
+            broken = not self._is_healthy(conn)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    @contextmanager
+    def cursor(self):
+        """
+        Yield a cursor on a pooled connection.
+        Commits when the block exits cleanly and rolls back otherwise.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def stats(self):
+        """Return a snapshot of pool sizing and wait-time counters."""
+        with self._lock:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "utilization": self._in_use / self.max_size,
+                "checkouts": self._checkouts,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "wait_seconds_max": self._wait_max,
+                "timeouts": self._timeouts,
+                "reconnects": self._reconnects,
+                "connect_failures": self._connect_failures,
+                "health_check_failures": self._health_check_failures,
+            }
+
+    def close(self):
+        """Close all idle connections; checked-out ones are closed on release."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._available.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
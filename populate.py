@@ -1,7 +1,10 @@
 import os
 import time
 import json
-import iris  # Make sure you have the appropriate IRIS driver/package installed
+if os.getenv('IRIS_BACKEND', 'iris') == 'local':
+    import local_iris as iris  # SQLite-based stand-in, see local_iris.py
+else:
+    import iris  # Make sure you have the appropriate IRIS driver/package installed
 from sentence_transformers import SentenceTransformer
 
 # ---------------------------
@@ -0,0 +1,203 @@
+"""
+Re-embed every MedicalRecords and PastPrompts row with another model,
+without downtime.
+
+The new version's vectors are written into the inactive vector slot (see
+embedding_versions.py) while the API keeps searching the active one:
+
+  1. The inactive slot is marked as building for the new version and its
+     columns are added (recreated if the slot held vectors of another size).
+  2. Rows whose slot does not hold the new version yet are read in
+     keyset-paginated batches, encoded in one call per batch and written
+     with one executemany per batch. Each row is labelled with the version
+     as its vector is written, so an interrupted run picks up where it
+     stopped when started again.
+  3. Passes repeat until no row is missing; rows inserted by the API in the
+     meantime are caught by the next pass. The slot is then activated with
+     one UPDATE, in the same transaction as the final check. API processes
+     switch within EMBEDDING_SLOTS_TTL seconds plus the time to load the model.
+  4. For --settle seconds afterwards, rows inserted by API processes that had
+     not switched yet are re-embedded as well.
+
+Use --max-rate and --pause to limit the load on IRIS, and --threads to limit
+the CPU the model uses, so that live traffic is not starved. Re-running for
+the version that is already active, or running without --model, only fills
+in rows missing it, e.g. PastPrompts written before they were embedded. Run
+one job at a time, and let every API process switch over before starting the
+next.
+
+Usage:
+    python reembed.py --model NeuML/pubmedbert-base-embeddings
+    python reembed.py --model pritamdeka/S-PubMedBert-MS-MARCO --backend onnx-int8 --max-rate 200
+    python reembed.py                    # embed rows missing the active version
+    python reembed.py --status
+"""
+import argparse
+import sys
+import time
+
+from database import EMBED_THREADS, VECTOR_STORAGE, get_pool
+import embedding_versions
+from embedding_versions import BUILDING, EMBEDDED_TABLES
+from embedding_backends import BACKENDS, load_model
+from migrations import execute_ddl, migrate
+from vector_codec import VectorCodec
+
+
+def add_columns(codec, previous_dim=None):
+    """Add codec's columns to every embedded table, dropping the slot's old ones if they had another size."""
+    for table in EMBEDDED_TABLES:
+        if previous_dim is not None and previous_dim != codec.dim:
+            for definition in codec.column_definitions:
+                execute_ddl(f"ALTER TABLE {table} DROP COLUMN {definition.split()[0]}", idempotent=True)
+        for definition in codec.column_definitions:
+            execute_ddl(f"ALTER TABLE {table} ADD {definition}", idempotent=True)
+
+
+def backfill(codec, encode, batch_size, max_rate=0, pause=0.0, table="MedicalRecords"):
+    """
+    One pass writing codec.version's vector into codec's slot for every row
+    of table that lacks it. Returns the number of rows written.
+    """
+    select = f"""
+        SELECT TOP ? ID, {", ".join(EMBEDDED_TABLES[table])}
+        FROM {table}
+        WHERE ID > ? AND ({codec.version_column} IS NULL OR {codec.version_column} <> ?)
+        ORDER BY ID
+    """
+    update = f"UPDATE {table} SET {codec.update_assignments} WHERE ID = ?"
+
+    last_id, written, started = 0, 0, time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        with get_pool().cursor() as cursor:
+            cursor.execute(select, (batch_size, last_id, codec.version))
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        # Encode outside the transaction so no connection is held meanwhile.
+        vectors = encode([" ".join(map(str, row[1:])) for row in rows])
+        with get_pool().cursor() as cursor:
+            cursor.executemany(update, [(*codec.encode(vector), row[0]) for row, vector in zip(rows, vectors)])
+        last_id = rows[-1][0]
+        written += len(rows)
+        print(f"Re-embedded {written} {table} rows (last ID {last_id}, "
+              f"{written / (time.perf_counter() - started):.0f} rows/s)")
+
+        wait = pause
+        if max_rate:
+            wait = max(wait, len(rows) / max_rate - (time.perf_counter() - batch_started))
+        if wait > 0:
+            time.sleep(wait)
+    return written
+
+
+def backfill_all(codec, encode, args):
+    """One backfill pass over every embedded table; returns the number of rows written."""
+    return sum(backfill(codec, encode, args.batch_size, args.max_rate, args.pause, table) for table in EMBEDDED_TABLES)
+
+
+def missing_total(cursor, codec):
+    return sum(embedding_versions.missing_count(cursor, codec, table) for table in EMBEDDED_TABLES)
+
+
+def show_status():
+    with get_pool().cursor() as cursor:
+        slots = embedding_versions.read_slots(cursor)
+        if not slots:
+            print("No embedding versions recorded; run python migrations.py")
+            return
+        for slot, info in sorted(slots.items()):
+            codec = VectorCodec(VECTOR_STORAGE, info["dim"], slot, info["version"])
+            missing = []
+            for table in EMBEDDED_TABLES:
+                try:
+                    missing.append(f"{embedding_versions.missing_count(cursor, codec, table)} {table}")
+                except Exception:
+                    missing.append(f"? {table}")
+            print(f"slot {slot}  {info['status']:<9} {info['version']} "
+                  f"(dim {info['dim']}, rows missing: {', '.join(missing)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Model to re-embed with (default: the active version's)")
+    parser.add_argument("--backend", choices=BACKENDS,
+                        help="Inference backend (default: torch, or the active version's without --model)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Rows per encode call and transaction")
+    parser.add_argument("--max-rate", type=float, default=0, help="Rows per second at most (default: no limit)")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument("--threads", type=int, default=EMBED_THREADS, help="CPU threads for the model")
+    parser.add_argument("--settle", type=float, default=120,
+                        help="Seconds to keep re-embedding new rows after activating (default 120)")
+    parser.add_argument("--no-activate", action="store_true", help="Fill the slot but leave the active version")
+    parser.add_argument("--status", action="store_true", help="Show each slot's version and coverage")
+    args = parser.parse_args()
+
+    migrate()
+    if args.status:
+        show_status()
+        return
+
+    with get_pool().cursor() as cursor:
+        slots = embedding_versions.read_slots(cursor)
+    active = embedding_versions.active_slot(slots)
+    if active is None:
+        sys.exit("No active embedding version; run python migrations.py first")
+    active_slot, active_info = active
+    if args.model:
+        model_name, backend = args.model, args.backend or "torch"
+    else:
+        model_name, backend = embedding_versions.parse_version(active_info["version"])
+        backend = args.backend or backend
+
+    model, report = load_model(model_name, backend, args.threads)
+    if report["backend"] != backend:
+        print(f"Using the {report['backend']} backend instead of {backend}")
+    version = embedding_versions.version_name(model_name, report["backend"])
+
+    def encode(texts):
+        return model.encode(texts, normalize_embeddings=True, batch_size=min(len(texts), 64))
+
+    if active_info["version"] == version:
+        codec = VectorCodec(VECTOR_STORAGE, active_info["dim"], active_slot, version)
+        written = backfill_all(codec, encode, args)
+        print(f"{version} is already active in slot {active_slot}; {written} missing rows re-embedded.")
+        return
+
+    slot = embedding_versions.other_slot(active_slot)
+    previous = slots.get(slot)
+    dim = len(encode(["dimension probe"])[0])
+    codec = VectorCodec(VECTOR_STORAGE, dim, slot, version)
+    add_columns(codec, previous["dim"] if previous else None)
+    if previous is not None and previous["version"] == version and previous["status"] == BUILDING:
+        print(f"Resuming {version} in slot {slot}")
+    else:
+        with get_pool().cursor() as cursor:
+            embedding_versions.set_slot(cursor, slot, version, dim, BUILDING)
+        print(f"Building {version} in slot {slot} (dim {dim}) alongside {active_info['version']}")
+
+    started = time.perf_counter()
+    while True:
+        backfill_all(codec, encode, args)
+        with get_pool().cursor() as cursor:
+            missing = missing_total(cursor, codec)
+            if missing == 0 and not args.no_activate:
+                embedding_versions.activate(cursor, slot)
+        if missing == 0:
+            break
+        print(f"{missing} rows were added during the pass; starting another")
+    print(f"Slot {slot} holds {version} for every row ({time.perf_counter() - started:.1f}s)")
+    if args.no_activate:
+        return
+    print(f"Activated {version}; API processes switch within their EMBEDDING_SLOTS_TTL")
+
+    deadline = time.monotonic() + args.settle
+    while time.monotonic() < deadline:
+        time.sleep(min(10, max(0.0, deadline - time.monotonic())))
+        backfill_all(codec, encode, args)
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
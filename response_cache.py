@@ -0,0 +1,205 @@
+"""
+Read-through cache of per-user query responses.
+
+Every (table, user) pair has a generation number that the insert endpoints
+increment after writing to that table for that user. Cache keys include the
+current generation, so a write invalidates exactly that user's cached
+responses for that table, and stale entries are never read again; they age
+out of the LRU (or expire, in Redis).
+
+Two backends hold the entries and generations:
+  - MemoryBackend: a byte-bounded LRU private to this process, which keeps
+    the generations of at most max_generations pairs
+  - RedisBackend: a Redis server shared by every worker that uses it, so an
+    insert handled by one worker invalidates the others' entries as well
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    def __init__(self, body, etag, headers, mimetype):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+        self.mimetype = mimetype
+
+
+class MemoryBackend:
+    """
+    Entries in an LRU bounded to max_bytes of response bodies, each kept for
+    at most ttl seconds.
+
+    Generations are numbered from one counter shared by every name, and only
+    the max_generations most recently bumped names keep their own. The
+    others all read the floor: the highest generation dropped so far. So a
+    name's generation never goes back to a number its stale entries were
+    stored under, and dropping a generation can only cause misses.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300.0, max_generations=100000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_generations = max_generations
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (response, stored_at)
+        self._generations = OrderedDict()  # name -> generation, least recently bumped first
+        self._clock = 0
+        self._floor = 0
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            response, stored_at = item
+            if time.monotonic() - stored_at > self.ttl:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key, response):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (response, time.monotonic())
+            self.bytes += len(response.body)
+            while self.bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        response, _ = self._entries.pop(key)
+        self.bytes -= len(response.body)
+
+    def generation(self, name):
+        with self._lock:
+            return self._generations.get(name, self._floor)
+
+    def bump(self, name):
+        with self._lock:
+            self._clock += 1
+            self._generations[name] = self._clock
+            self._generations.move_to_end(name)
+            while len(self._generations) > self.max_generations:
+                _, generation = self._generations.popitem(last=False)
+                self._floor = max(self._floor, generation)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self.bytes,
+                    "max_bytes": self.max_bytes, "evictions": self.evictions,
+                    "generations": len(self._generations)}
+
+
+class RedisBackend:
+    """Entries and generations in Redis; entries expire after ttl seconds."""
+
+    def __init__(self, url, ttl=300.0, prefix="healthhack:responses:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        if value is None:
+            return None
+        meta, _, body = value.partition(b"\n")
+        etag, headers, mimetype = json.loads(meta)
+        return CachedResponse(body, etag, headers, mimetype)
+
+    def set(self, key, response):
+        meta = json.dumps([response.etag, response.headers, response.mimetype]).encode("utf-8")
+        self._redis.set(self.prefix + key, meta + b"\n" + response.body, ex=max(1, int(self.ttl)))
+
+    def generation(self, name):
+        return int(self._redis.get(self.prefix + "generation:" + name) or 0)
+
+    def bump(self, name):
+        self._redis.incr(self.prefix + "generation:" + name)
+
+    def stats(self):
+        return {"backend": "redis", "url": self.url}
+
+
+class ResponseCache:
+    """
+    Caches response bodies by (table, user, generation, query string).
+    Backend errors are reported and treated as misses, so the cache can
+    never take an endpoint down.
+    """
+
+    def __init__(self, backend, max_entry_bytes=1024 * 1024):
+        self.backend = backend
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def key(self, table, user, args):
+        """Cache key for a request; args are the query parameters other than user."""
+        generation = self.backend.generation(f"{table}:{user}")
+        # A JSON dump keeps values containing '&' or '=' from colliding.
+        key = json.dumps([table, user, generation, sorted(args)])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def lookup(self, table, user, args):
+        """Return (key, cached response or None); key is None if the backend failed."""
+        try:
+            key = self.key(table, user, args)
+            response = self.backend.get(key)
+        except Exception as e:
+            self._error("lookup", e)
+            return None, None
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return key, response
+
+    def store(self, key, response):
+        if key is None or len(response.body) > self.max_entry_bytes:
+            return
+        try:
+            self.backend.set(key, response)
+        except Exception as e:
+            self._error("store", e)
+
+    def invalidate(self, table, users):
+        """Invalidate the cached responses of each of users for table."""
+        for user in set(users):
+            try:
+                self.backend.bump(f"{table}:{user}")
+            except Exception as e:
+                self._error("invalidate", e)
+        with self._lock:
+            self.invalidations += 1
+
+    def _error(self, operation, e):
+        with self._lock:
+            self.errors += 1
+        print(f"Response cache {operation} failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+            }
+        stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+def normalize_message(text):
+    """Collapse runs of whitespace; case is kept, since the model may be cased."""
+    return " ".join(text.split())
+
+
+class _Namespace:
+    def __init__(self, dim):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.entries = []  # [response, created, last_used, latency]
+
+
+class SemanticCache:
+    """
+    Caches LLM completions by meaning rather than exact text.
+
+    Entries are grouped by system prompt, and within a group a message hits
+    when the dot product of its normalized embedding with a cached message's
+    embedding is at least `threshold`. Entries expire after `ttl` seconds and
+    the least recently used are evicted beyond `max_entries` in total.
+    `embed(text)` must return a unit-length vector.
+    """
+
+    def __init__(self, embed, threshold=0.92, ttl=86400.0, max_entries=1000):
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._namespaces = {}
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _namespace_key(system_prompt):
+        return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    def _vector(self, message):
+        return np.asarray(self._embed(normalize_message(message)), dtype=np.float32)
+
+    def lookup(self, system_prompt, message):
+        """Return (response, vector) on a hit or (None, vector) on a miss."""
+        vector = self._vector(message)
+        now = time.time()
+        with self._lock:
+            namespace = self._namespaces.get(self._namespace_key(system_prompt))
+            if namespace is not None and namespace.entries:
+                scores = namespace.vectors @ vector
+                best = int(np.argmax(scores))
+                entry = namespace.entries[best]
+                if scores[best] >= self.threshold and now - entry[1] <= self.ttl:
+                    entry[2] = now
+                    self.hits += 1
+                    self.latency_saved += entry[3]
+                    return entry[0], vector
+            self.misses += 1
+        return None, vector
+
+    def store(self, system_prompt, vector, response, latency):
+        """Cache a completion that took `latency` seconds to produce."""
+        now = time.time()
+        key = self._namespace_key(system_prompt)
+        with self._lock:
+            namespace = self._namespaces.setdefault(key, _Namespace(len(vector)))
+            namespace.vectors = np.vstack([namespace.vectors, vector.reshape(1, -1)])
+            namespace.entries.append([response, now, now, latency])
+            self._evict(now)
+
+    def _evict(self, now):
+        for namespace in self._namespaces.values():
+            keep = [i for i, entry in enumerate(namespace.entries) if now - entry[1] <= self.ttl]
+            if len(keep) < len(namespace.entries):
+                namespace.vectors = namespace.vectors[keep]
+                namespace.entries = [namespace.entries[i] for i in keep]
+        total = sum(len(namespace.entries) for namespace in self._namespaces.values())
+        while total > self.max_entries:
+            # Drop the least recently used entry across all namespaces.
+            namespace, index = min(
+                ((ns, i) for ns in self._namespaces.values() for i in range(len(ns.entries))),
+                key=lambda pair: pair[0].entries[pair[1]][2],
+            )
+            namespace.vectors = np.delete(namespace.vectors, index, axis=0)
+            del namespace.entries[index]
+            total -= 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(namespace.entries) for namespace in self._namespaces.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+            }
@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+
+from embedding_cache import INDEX_RECORD, DiskVectorStore, EmbeddingCache
+
+DIM = 4
+
+
+def key(i):
+    return i.to_bytes(16, "little")
+
+
+def vector(i):
+    return np.full(DIM, i, dtype=np.float32)
+
+
+def test_ring_wraps_and_evicts_oldest(tmp_path):
+    store = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    for i in range(12):
+        store.put(key(i), vector(i))
+
+    assert len(store) == 8
+    assert store.evictions == 4
+    for i in range(4):
+        assert store.get(key(i)) is None
+    for i in range(4, 12):
+        np.testing.assert_array_equal(store.get(key(i)), vector(i))
+
+
+def test_put_of_known_key_keeps_its_slot(tmp_path):
+    store = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    store.put(key(1), vector(1))
+    store.put(key(1), vector(99))
+    assert len(store) == 1
+    np.testing.assert_array_equal(store.get(key(1)), vector(1))
+
+
+def test_grows_past_initial_mapping(tmp_path, monkeypatch):
+    monkeypatch.setattr("embedding_cache.INITIAL_DISK_SLOTS", 2)
+    store = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=16)
+    for i in range(10):
+        store.put(key(i), vector(i))
+    for i in range(10):
+        np.testing.assert_array_equal(store.get(key(i)), vector(i))
+
+
+def test_index_replay_after_reopen(tmp_path):
+    store = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    for i in range(10):
+        store.put(key(i), vector(i))
+    store.close()
+
+    reopened = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    assert len(reopened) == 8
+    assert reopened.get(key(1)) is None
+    for i in range(2, 10):
+        np.testing.assert_array_equal(reopened.get(key(i)), vector(i))
+    # The ring position survives too: the next put replaces the oldest entry.
+    reopened.put(key(10), vector(10))
+    assert reopened.get(key(2)) is None
+    np.testing.assert_array_equal(reopened.get(key(3)), vector(3))
+
+
+def test_replay_compacts_superseded_records(tmp_path):
+    store = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=4)
+    for i in range(20):
+        store.put(key(i), vector(i))
+    store.close()
+
+    reopened = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=4)
+    assert os.path.getsize(reopened._index_path) <= 5 * INDEX_RECORD.size
+    for i in range(16, 20):
+        np.testing.assert_array_equal(reopened.get(key(i)), vector(i))
+    reopened.put(key(20), vector(20))
+    assert reopened.get(key(16)) is None
+    np.testing.assert_array_equal(reopened.get(key(17)), vector(17))
+
+
+def test_replay_ignores_truncated_record(tmp_path):
+    store = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    store.put(key(1), vector(1))
+    store.close()
+    with open(store._index_path, "ab") as f:
+        f.write(INDEX_RECORD.pack(key(2), 1)[:7])
+
+    reopened = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    reopened.put(key(3), vector(3))
+    reopened.close()
+    again = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=8)
+    np.testing.assert_array_equal(again.get(key(1)), vector(1))
+    np.testing.assert_array_equal(again.get(key(3)), vector(3))
+    assert again.get(key(2)) is None
+
+
+def test_stores_sharing_a_directory_see_each_others_slots(tmp_path):
+    first = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=4)
+    second = DiskVectorStore(str(tmp_path), "model@torch", DIM, capacity=4)
+    first.put(key(1), vector(1))
+    np.testing.assert_array_equal(second.get(key(1)), vector(1))
+
+    # second reuses every slot; first must not return key 1 from its old slot.
+    for i in range(2, 6):
+        second.put(key(i), vector(i))
+    assert first.get(key(1)) is None
+    for i in range(2, 6):
+        np.testing.assert_array_equal(first.get(key(i)), vector(i))
+
+
+def test_versions_get_separate_stores(tmp_path):
+    torch = DiskVectorStore(str(tmp_path), "model@torch", DIM)
+    onnx = DiskVectorStore(str(tmp_path), "model@onnx-int8", DIM)
+    torch.put(key(1), vector(1))
+    assert onnx.get(key(1)) is None
+    assert torch.directory != onnx.directory
+
+
+def test_cache_normalizes_text_and_persists(tmp_path):
+    cache = EmbeddingCache("model@torch", DIM, max_entries=2, directory=str(tmp_path))
+    cache.put("Chest  Pain", vector(7))
+    np.testing.assert_array_equal(cache.get(" Chest Pain\n"), vector(7))
+    # Case is kept, since a cased model embeds it differently.
+    assert cache.get("chest pain") is None
+    cache.close()
+
+    reopened = EmbeddingCache("model@torch", DIM, directory=str(tmp_path))
+    np.testing.assert_array_equal(reopened.get("Chest Pain"), vector(7))
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_cache_is_keyed_on_backend(tmp_path):
+    torch = EmbeddingCache("model@torch", DIM, directory=str(tmp_path))
+    onnx = EmbeddingCache("model@onnx-int8", DIM, directory=str(tmp_path))
+    torch.put("chest pain", vector(1))
+    assert torch.key("chest pain") != onnx.key("chest pain")
+    assert onnx.get("chest pain") is None
@@ -0,0 +1,155 @@
+import sqlite3
+import time
+
+import pytest
+
+from ingest_queue import IngestQueue, QueueFull
+
+
+class Handler:
+    """Records payload batches and raises for payloads marked bad."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, payloads):
+        self.batches.append([p["n"] for p in payloads])
+        if any(p.get("bad") for p in payloads):
+            raise ValueError("bad payload")
+
+
+def make_queue(tmp_path, handler=None, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return IngestQueue(str(tmp_path / "queue.db"), handler or Handler(), **kwargs)
+
+
+def run_once(queue):
+    jobs = queue._claim()
+    if jobs:
+        queue._process(jobs)
+    return jobs
+
+
+def test_claims_in_order_and_marks_done(tmp_path):
+    handler = Handler()
+    queue = make_queue(tmp_path, handler, batch_size=2)
+    ids = [queue.enqueue({"n": n}) for n in range(3)]
+
+    assert len(run_once(queue)) == 2
+    assert len(run_once(queue)) == 1
+    assert run_once(queue) == []
+    assert handler.batches == [[0, 1], [2]]
+    assert [queue.status(job_id)["status"] for job_id in ids] == ["done"] * 3
+    assert queue.stats()["completed_since_start"] == 3
+
+
+def test_bad_job_does_not_fail_its_batch(tmp_path):
+    handler = Handler()
+    queue = make_queue(tmp_path, handler, max_attempts=2)
+    good = queue.enqueue({"n": 1})
+    bad = queue.enqueue({"n": 2, "bad": True})
+    other = queue.enqueue({"n": 3})
+
+    run_once(queue)
+    assert handler.batches == [[1, 2, 3], [1], [2], [3]]
+    assert queue.status(good)["status"] == "done"
+    assert queue.status(other)["status"] == "done"
+    assert queue.status(bad)["status"] == "queued"
+    assert queue.status(bad)["error"] == "bad payload"
+
+    # Only the bad job is retried, and it fails after max_attempts.
+    run_once(queue)
+    assert handler.batches[-1] == [2]
+    status = queue.status(bad)
+    assert (status["status"], status["attempts"]) == ("failed", 2)
+    assert run_once(queue) == []
+
+
+def test_retry_waits_for_backoff(tmp_path):
+    queue = make_queue(tmp_path, backoff=60)
+    job_id = queue.enqueue({"n": 1, "bad": True})
+    run_once(queue)
+    assert queue.status(job_id)["status"] == "queued"
+    assert run_once(queue) == []
+
+
+def test_backpressure(tmp_path):
+    queue = make_queue(tmp_path, max_pending=2)
+    queue.enqueue({"n": 1})
+    queue.enqueue({"n": 2})
+    with pytest.raises(QueueFull):
+        queue.enqueue({"n": 3})
+
+
+def test_restart_does_not_take_over_live_jobs(tmp_path):
+    first = make_queue(tmp_path, lease=60)
+    job_id = first.enqueue({"n": 1})
+    assert len(first._claim()) == 1
+
+    # Another process opens the same file while the first is running the job.
+    second = make_queue(tmp_path, lease=60)
+    assert second._claim() == []
+    assert first.status(job_id)["status"] == "running"
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    handler = Handler()
+    crashed = make_queue(tmp_path, lease=0.01)
+    job_id = crashed.enqueue({"n": 1})
+    crashed._claim()
+    time.sleep(0.05)
+
+    restarted = make_queue(tmp_path, handler)
+    assert len(run_once(restarted)) == 1
+    status = restarted.status(job_id)
+    assert (status["status"], status["attempts"]) == ("done", 2)
+
+    # The crashed process cannot overwrite the job it lost.
+    crashed._fail([job_id], "late failure")
+    assert restarted.status(job_id)["status"] == "done"
+
+
+def test_job_crashing_on_last_attempt_is_failed(tmp_path):
+    queue = make_queue(tmp_path, lease=0.01, max_attempts=1)
+    job_id = queue.enqueue({"n": 1})
+    queue._claim()
+    time.sleep(0.05)
+    assert queue._claim() == []
+    status = queue.status(job_id)
+    assert status["status"] == "failed"
+    assert "Lease expired" in status["error"]
+
+
+def test_opens_queue_files_without_lease_columns(tmp_path):
+    path = tmp_path / "queue.db"
+    db = sqlite3.connect(path)
+    db.execute("""
+        CREATE TABLE jobs (id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL,
+                           attempts INTEGER NOT NULL DEFAULT 0, error TEXT, created REAL NOT NULL,
+                           updated REAL NOT NULL, next_attempt REAL NOT NULL)
+    """)
+    db.execute("INSERT INTO jobs VALUES ('old', '{\"n\": 1}', 'running', 1, NULL, 0, 0, 0)")
+    db.commit()
+    db.close()
+
+    handler = Handler()
+    queue = IngestQueue(str(path), handler)
+    # A job left running by the previous version has no lease and is reclaimed.
+    run_once(queue)
+    assert handler.batches == [[1]]
+    assert queue.status("old")["status"] == "done"
+
+
+def test_workers_drain_the_queue(tmp_path):
+    handler = Handler()
+    queue = make_queue(tmp_path, handler, workers=2, poll_interval=0.01)
+    ids = [queue.enqueue({"n": n}) for n in range(20)]
+    queue.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and any(queue.stats()[status] for status in ("queued", "running")):
+            time.sleep(0.01)
+    finally:
+        queue.stop()
+    assert all(queue.status(job_id)["status"] == "done" for job_id in ids)
+    assert sorted(n for batch in handler.batches for n in batch) == list(range(20))
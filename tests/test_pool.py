@@ -0,0 +1,183 @@
+import threading
+
+import pytest
+
+from pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=()):
+        if self.conn.broken:
+            raise ConnectionError("link down")
+        self.conn.statements.append(sql)
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.broken = False
+        self.closed = False
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        if self.broken:
+            raise ConnectionError("link down")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class Connector:
+    """connect() for the pool, failing the first `failures` calls."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.opened = []
+
+    def __call__(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("refused")
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+def make_pool(connector=None, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return ConnectionPool(connector or Connector(), **kwargs)
+
+
+def test_opens_min_size_and_reuses_idle_connections():
+    connector = Connector()
+    pool = make_pool(connector, min_size=2, max_size=4)
+    assert len(connector.opened) == 2
+
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert len(connector.opened) == 2
+    assert pool.stats()["in_use"] == 1
+
+
+def test_checkout_times_out_when_exhausted():
+    pool = make_pool(min_size=0, max_size=1, timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiting_checkout_gets_released_connection():
+    pool = make_pool(min_size=1, max_size=1, timeout=5)
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join(5)
+    assert got == [conn]
+
+
+def test_cursor_commits_on_success():
+    pool = make_pool(min_size=1)
+    with pool.cursor() as cursor:
+        cursor.execute("INSERT INTO t VALUES (1)")
+    conn = pool.acquire()
+    assert conn.commits == 1
+    assert conn.statements == ["INSERT INTO t VALUES (1)"]
+
+
+def test_cursor_rolls_back_on_error_and_keeps_healthy_connection():
+    connector = Connector()
+    pool = make_pool(connector, min_size=1)
+    with pytest.raises(ValueError):
+        with pool.cursor() as cursor:
+            cursor.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("bad row")
+    conn = connector.opened[0]
+    assert conn.commits == 0
+    # Once by cursor() for the failed block, once by release().
+    assert conn.rollbacks == 2
+    assert not conn.closed
+    assert pool.acquire() is conn
+
+
+def test_broken_connection_is_discarded_on_error():
+    connector = Connector()
+    pool = make_pool(connector, min_size=1)
+    with pytest.raises(ConnectionError):
+        with pool.connection() as conn:
+            conn.broken = True
+            conn.cursor().execute("SELECT 1")
+    assert conn.closed
+    assert pool.stats()["size"] == 0
+    assert pool.acquire() is not conn
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_stale_idle_connection_is_health_checked_and_replaced():
+    connector = Connector()
+    pool = make_pool(connector, min_size=1, health_check_interval=0)
+    stale = connector.opened[0]
+    stale.broken = True
+
+    conn = pool.acquire()
+    assert conn is not stale
+    assert stale.closed
+    stats = pool.stats()
+    assert stats["health_check_failures"] == 1
+    assert stats["size"] == 1
+
+
+def test_healthy_idle_connection_is_kept():
+    connector = Connector()
+    pool = make_pool(connector, min_size=1, health_check_interval=0)
+    assert pool.acquire() is connector.opened[0]
+    assert connector.opened[0].statements == ["SELECT 1"]
+
+
+def test_connect_is_retried_then_gives_up():
+    connector = Connector(failures=2)
+    pool = make_pool(connector, min_size=0, max_retries=2)
+    assert pool.acquire() is connector.opened[0]
+    assert pool.stats()["connect_failures"] == 2
+
+    failing = make_pool(Connector(failures=5), min_size=0, max_retries=1)
+    with pytest.raises(ConnectionError):
+        failing.acquire()
+    # The failed checkout must not use up a slot.
+    assert failing.stats()["size"] == 0
+    assert failing.stats()["in_use"] == 0
+
+
+def test_close_closes_idle_and_later_released_connections():
+    connector = Connector()
+    pool = make_pool(connector, min_size=2, max_size=2)
+    held = pool.acquire()
+    pool.close()
+    idle = [conn for conn in connector.opened if conn is not held]
+    assert idle and all(conn.closed for conn in idle)
+    pool.release(held)
+    assert held.closed
+    assert pool.stats()["size"] == 0
+    with pytest.raises(RuntimeError):
+        pool.acquire()
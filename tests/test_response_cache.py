@@ -0,0 +1,52 @@
+from response_cache import CachedResponse, MemoryBackend, ResponseCache
+
+
+def response(body=b"[]"):
+    return CachedResponse(body, '"etag"', {}, "application/json")
+
+
+def test_key_does_not_confuse_escaped_arguments():
+    cache = ResponseCache(MemoryBackend())
+    assert cache.key("Vitals", "1", [("a", "1&b=2")]) != cache.key("Vitals", "1", [("a", "1"), ("b", "2")])
+    assert cache.key("Vitals", "1", [("b", "2"), ("a", "1")]) == cache.key("Vitals", "1", [("a", "1"), ("b", "2")])
+
+
+def test_invalidate_hides_only_that_users_entries():
+    cache = ResponseCache(MemoryBackend())
+    key, _ = cache.lookup("Vitals", "1", [])
+    cache.store(key, response())
+    other, _ = cache.lookup("Vitals", "2", [])
+    cache.store(other, response())
+
+    cache.invalidate("Vitals", ["1"])
+    assert cache.lookup("Vitals", "1", [])[1] is None
+    assert cache.lookup("Vitals", "2", [])[1] is not None
+
+
+def test_store_after_invalidation_is_never_read():
+    cache = ResponseCache(MemoryBackend())
+    key, _ = cache.lookup("Vitals", "1", [])
+    # A write lands while the response is being built.
+    cache.invalidate("Vitals", ["1"])
+    cache.store(key, response(b"stale"))
+    assert cache.lookup("Vitals", "1", [])[1] is None
+
+
+def test_generations_are_bounded_without_reviving_stale_entries():
+    backend = MemoryBackend(max_generations=2)
+    cache = ResponseCache(backend)
+    key, _ = cache.lookup("Vitals", "1", [])
+    cache.store(key, response(b"before"))
+    cache.invalidate("Vitals", ["1"])
+    key, _ = cache.lookup("Vitals", "1", [])
+    cache.store(key, response(b"after"))
+
+    for user in range(2, 10):
+        cache.invalidate("Vitals", [str(user)])
+    assert backend.stats()["generations"] == 2
+    # User 1's generation was dropped: its entries miss, but neither comes back.
+    assert cache.lookup("Vitals", "1", [])[1] is None
+
+    key, _ = cache.lookup("Vitals", "1", [])
+    cache.store(key, response(b"fresh"))
+    assert cache.lookup("Vitals", "1", [])[1].body == b"fresh"
@@ -0,0 +1,60 @@
+"""
+Validation and normalisation of records before they are written, shared by
+the batch and queued insert endpoints, bulk_load.py and the migrations.
+"""
+from datetime import datetime
+
+DATETIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+# Fields stored as numbers, per table; every other field is stored as text.
+NUMERIC_FIELDS = {
+    "Vitals": ["Temperature", "PulseRate"],
+    "Activity": ["Duration"],
+    "Diet": ["Calories"],
+}
+
+
+def parse_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def to_row_values(record, fields, numeric=()):
+    """
+    Return the record's values for fields, in order, with numbers as floats,
+    Datetime as 'YYYY-MM-DD HH:MM:SS' and everything else as text. Raises
+    ValueError naming the first missing or invalid field.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    values = []
+    for field in fields:
+        value = record.get(field)
+        if value is None or value == "":
+            raise ValueError(f"Missing field {field}")
+        if field in numeric:
+            if isinstance(value, bool):
+                raise ValueError(f"Field {field} must be a number, got {value!r}")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Field {field} must be a number, got {value!r}") from None
+        elif field == "Datetime":
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError(f"Unparsable Datetime {value!r}")
+            value = parsed.strftime("%Y-%m-%d %H:%M:%S")
+        elif isinstance(value, (dict, list)):
+            raise ValueError(f"Field {field} must be text, got {type(value).__name__}")
+        else:
+            value = str(value)
+        values.append(value)
+    return values
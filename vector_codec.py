@@ -0,0 +1,143 @@
+import numpy as np
+
+from vector_index import parse_vector
+
+
+class VectorCodec:
+    """
+    How MedicalRecords and PastPrompts embeddings are stored and sent to IRIS.
+
+    Three storage modes are supported:
+      - double: the original VECTOR(DOUBLE) column `Embedding`, full precision
+      - float:  VECTOR(FLOAT) column `EmbeddingFloat`, 7 significant digits
+      - int8:   VECTOR(INT) column `EmbeddingInt8` holding values in [-127, 127]
+                plus a per-vector `EmbeddingScale` (symmetric scalar quantization)
+
+    Every mode sends vectors as a bare comma-separated list, which TO_VECTOR
+    parses directly and which is far shorter than json.dumps of a float list.
+
+    Each embedded table has two sets of these columns, slot A (the names above)
+    and slot B (the same names with a B suffix), so that vectors from a new
+    model can be written alongside the current ones (see embedding_versions.py).
+    Each slot has an EmbeddingVersion column naming the model that produced
+    its vector. When version is given, inserts fill it in and version_filter
+    restricts a query to vectors of that version.
+    """
+
+    MODES = ("double", "float", "int8")
+
+    def __init__(self, mode="double", dim=768, slot="A", version=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown vector storage mode {mode!r}, expected one of {self.MODES}")
+        if slot not in ("A", "B"):
+            raise ValueError(f"Unknown vector slot {slot!r}, expected A or B")
+        self.mode = mode
+        self.dim = dim
+        self.slot = slot
+        self.version = version
+        suffix = "" if slot == "A" else slot
+        if mode == "double":
+            self.column, self.element_type = "Embedding" + suffix, "DOUBLE"
+        elif mode == "float":
+            self.column, self.element_type = "EmbeddingFloat" + suffix, "FLOAT"
+        else:
+            self.column, self.element_type = "EmbeddingInt8" + suffix, "INT"
+        self.scale_column = "EmbeddingScale" + suffix
+        self.version_column = "EmbeddingVersion" + suffix
+
+    @property
+    def column_definitions(self):
+        """Column definitions to add to an embedded table for this mode."""
+        columns = [f"{self.column} VECTOR({self.element_type}, {self.dim})"]
+        if self.mode == "int8":
+            columns.append(f"{self.scale_column} DOUBLE")
+        columns.append(f"{self.version_column} VARCHAR(250)")
+        return columns
+
+    @property
+    def vector_columns(self):
+        """The columns holding the vector itself (and its int8 scale)."""
+        return f"{self.column}, {self.scale_column}" if self.mode == "int8" else self.column
+
+    @property
+    def insert_columns(self):
+        """Column list for INSERT statements, matching insert_placeholders."""
+        if self.version is not None:
+            return f"{self.vector_columns}, {self.version_column}"
+        return self.vector_columns
+
+    @property
+    def insert_placeholders(self):
+        placeholder = f"TO_VECTOR(?, {self.element_type})"
+        if self.mode == "int8":
+            placeholder += ", ?"
+        return f"{placeholder}, ?" if self.version is not None else placeholder
+
+    @property
+    def update_assignments(self):
+        """SET clause writing the parameters of encode()."""
+        assignments = f"{self.column} = TO_VECTOR(?, {self.element_type})"
+        if self.mode == "int8":
+            assignments += f", {self.scale_column} = ?"
+        if self.version is not None:
+            assignments += f", {self.version_column} = ?"
+        return assignments
+
+    @property
+    def select_columns(self):
+        """Columns to SELECT so that decode() can rebuild a float vector."""
+        return self.vector_columns
+
+    @property
+    def version_filter(self):
+        """(SQL condition, parameters) matching rows whose vector is of this version."""
+        if self.version is None:
+            return f"{self.column} IS NOT NULL", ()
+        return f"{self.version_column} = ?", (self.version,)
+
+    @property
+    def score_expression(self):
+        """SQL scoring a row against a query parameter encoded by encode_query()."""
+        score = f"VECTOR_DOT_PRODUCT({self.column}, TO_VECTOR(?, {self.element_type}))"
+        # Each row's integers are scaled differently, so the per-row scale must
+        # be applied for scores to be comparable. The query's own scale is a
+        # constant factor and does not change the ranking.
+        return f"{score} * {self.scale_column}" if self.mode == "int8" else score
+
+    def quantize(self, vector):
+        """Return (int8 values, scale) such that values * scale ~= vector."""
+        vector = np.asarray(vector, dtype=np.float32)
+        peak = float(np.max(np.abs(vector)))
+        scale = peak / 127.0 if peak > 0 else 1.0
+        return np.clip(np.rint(vector / scale), -127, 127).astype(np.int8), scale
+
+    def format(self, vector):
+        """Serialize a vector into the compact text form accepted by TO_VECTOR."""
+        if self.mode == "double":
+            return ",".join(map(repr, np.asarray(vector, dtype=np.float64).tolist()))
+        if self.mode == "float":
+            return ",".join(map("{:.7g}".format, np.asarray(vector, dtype=np.float32).tolist()))
+        return ",".join(map(str, np.asarray(vector, dtype=np.int8).tolist()))
+
+    def encode(self, vector):
+        """Parameters for insert_placeholders, as a tuple."""
+        if self.mode == "int8":
+            values, scale = self.quantize(vector)
+            params = (self.format(values), scale)
+        else:
+            params = (self.format(vector),)
+        return params + (self.version,) if self.version is not None else params
+
+    def encode_query(self, vector):
+        """Parameter for the TO_VECTOR(?) in score_expression."""
+        if self.mode == "int8":
+            values, _ = self.quantize(vector)
+            return self.format(values)
+        return self.format(vector)
+
+    def decode(self, value, scale=None):
+        """Rebuild a float32 vector from a stored value (and int8 scale)."""
+        vector = parse_vector(value)
+        if self.mode == "int8":
+            vector = vector * np.float32(scale if scale is not None else 1.0)
+        return vector
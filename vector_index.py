@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def parse_vector(value):
+    """
+    Parse a vector as returned by the database driver. Accepts a sequence of
+    numbers, or a string in either JSON ("[0.1, 0.2]") or IRIS ("0.1,0.2") form.
+    """
+    if isinstance(value, str):
+        return np.array(value.strip().strip("[]").split(","), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+class _UserEntry:
+    def __init__(self, rows, vectors):
+        self.rows = rows
+        self.vectors = vectors
+        self.loaded_at = time.monotonic()
+
+
+class UserVectorIndex:
+    """
+    In-process exact top-k index over normalized embeddings, one matrix per user.
+
+    A user's rows are fetched with `load(user)` on first search, which must
+    return a list of (row, vector) pairs. New records are appended with `add()`
+    so the index stays current for writes made by this process; entries older
+    than `ttl` seconds are reloaded to pick up writes from other processes.
+    At most `max_users` users are kept, evicting the least recently used.
+    """
+
+    def __init__(self, load, dim, max_users=1000, ttl=300.0):
+        self._load = load
+        self.dim = dim
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def _entry(self, user):
+        with self._lock:
+            entry = self._users.get(user)
+            if entry is not None and time.monotonic() - entry.loaded_at <= self.ttl:
+                self._users.move_to_end(user)
+                self.hits += 1
+                return entry
+
+        pairs = self._load(user)
+        rows = [row for row, _ in pairs]
+        vectors = np.empty((len(pairs), self.dim), dtype=np.float32)
+        for i, (_, vector) in enumerate(pairs):
+            vectors[i] = parse_vector(vector)
+        entry = _UserEntry(rows, vectors)
+
+        with self._lock:
+            self._users[user] = entry
+            self._users.move_to_end(user)
+            self.loads += 1
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def search(self, user, query, k):
+        """Return the k rows for user with the highest dot product to query."""
+        entry = self._entry(user)
+        with self._lock:
+            rows, vectors = entry.rows, entry.vectors
+        if not rows:
+            return []
+        scores = vectors @ np.asarray(query, dtype=np.float32)
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [rows[i] for i in top]
+
+    def add(self, user, row, vector):
+        """Append a newly inserted record if the user is already indexed."""
+        vector = parse_vector(vector).reshape(1, self.dim)
+        with self._lock:
+            entry = self._users.get(user)
+            if entry is None:
+                return
+            # Replace rather than mutate so concurrent searches see a
+            # consistent (rows, vectors) pair.
+            entry.rows = entry.rows + [row]
+            entry.vectors = np.vstack([entry.vectors, vector])
+
+    def invalidate(self, user=None):
+        """Drop one user's entry, or every entry when user is None."""
+        with self._lock:
+            if user is None:
+                self._users.clear()
+            else:
+                self._users.pop(user, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "vectors": sum(len(entry.rows) for entry in self._users.values()),
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "ttl_seconds": self.ttl,
+            }